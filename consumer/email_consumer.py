@@ -1,18 +1,20 @@
-import pika
 import smtplib
 from email.message import EmailMessage
 import json
 
-def email_callback(ch, method, properties, body):
-    print(f" [x] Received {body}")
-    data = json.loads(body)
-    to_address = data.get('email')
-    message_text = data.get('message')
+from notification_coalescer import Coalescer, coalescing_prefetch
+from notification_transport import get_transport
 
-    # Create EmailMessage object
+def send_email(to_address, items):
+    messages = [data for _, data in items]
+    # Create EmailMessage object, a digest when several notifications were coalesced
     msg = EmailMessage()
-    msg.set_content(message_text)
-    msg['Subject'] = f'Enrollment Notification for {data.get("class_name")}'
+    if len(messages) == 1:
+        msg.set_content(messages[0].get('message'))
+        msg['Subject'] = f'Enrollment Notification for {messages[0].get("class_name")}'
+    else:
+        msg.set_content("\n\n".join(data.get('message') for data in messages))
+        msg['Subject'] = f'{len(messages)} Enrollment Notifications'
     msg['From'] = 'edwinperaza@csu.fullerton.edu'
     msg['To'] = to_address
 
@@ -21,29 +23,27 @@ def email_callback(ch, method, properties, body):
     # server = smtplib.SMTP('localhost')
     server.send_message(msg)
     server.quit()
-    print(f" [x] Sent email to {to_address}")
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+    print(f" [x] Sent {len(messages)} notification(s) to {to_address}")
+    for message, _ in items:
+        message.ack()
 
 def main():
-    # Set up RabbitMQ connection and channel
-    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-    channel = connection.channel()
+    # Consume email notifications from RabbitMQ or a Redis Stream, as NOTIFICATION_TRANSPORT selects.
+    # Replicas compete for messages from one shared queue or consumer group, so each message
+    # is handled once and adding consumers adds throughput
+    transport = get_transport('email', coalescing_prefetch())
 
-    # Declare a fanout exchange
-    channel.exchange_declare(exchange='enrollment_notifications', exchange_type='fanout')
+    # Hold each recipient's notifications for a short window and send them as one email
+    coalescer = Coalescer(transport, send_email)
 
-    # Declare a queue and bind it to the exchange
-    result = channel.queue_declare(queue='', exclusive=True, durable=True)
-    queue_name = result.method.queue
-
-    channel.queue_bind(exchange='enrollment_notifications', queue=queue_name)
-
-    # Set up the consumer callback
-    channel.basic_consume(queue=queue_name, on_message_callback=email_callback)
+    def email_callback(message):
+        print(f" [x] Received {message.body}")
+        data = json.loads(message.body)
+        coalescer.add(data.get('email'), message, data)
 
     # Start consuming messages
     print('Email Notification Consumer is waiting for messages. To exit press CTRL+C')
-    channel.start_consuming()
+    transport.consume(email_callback)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,94 @@
+"""
+Coalesces notifications per recipient, so a subscriber promoted off several
+waitlists at once, or sent several messages back to back, gets one digest email
+or one webhook POST for the burst instead of one per message.
+
+A recipient's first message is sent straight away and opens a window of
+NOTIFICATION_COALESCE_WINDOW seconds, so a lone notification isn't delayed.
+Everything else that arrives for them in that window is sent together when it
+closes, and only acknowledged by the sender once delivered, so a crash re-delivers
+the messages instead of losing them. At most NOTIFICATION_COALESCE_MAX messages, and
+never more than the transport's prefetch, are held across all recipients; past
+that the recipient with the oldest window is sent early.
+"""
+import os
+
+from notification_transport import PREFETCH_COUNT
+
+COALESCE_WINDOW = float(os.environ.get("NOTIFICATION_COALESCE_WINDOW", "2.0"))
+COALESCE_MAX = int(os.environ.get("NOTIFICATION_COALESCE_MAX", "1000"))
+
+
+def coalescing_prefetch():
+    """
+    :return: The prefetch for a coalescing consumer's transport. Held messages stay unacked,
+    so with coalescing on it is raised to NOTIFICATION_COALESCE_MAX, or RabbitMQ would stop
+    delivering after NOTIFICATION_PREFETCH messages and every window would run to its end.
+    """
+    if COALESCE_WINDOW > 0:
+        return max(PREFETCH_COUNT, COALESCE_MAX)
+    return PREFETCH_COUNT
+
+
+class Coalescer:
+
+    def __init__(self, transport, send, window=COALESCE_WINDOW, max_buffered=COALESCE_MAX):
+        """
+        :param transport: The transport the messages came from, used for its call_later and prefetch.
+        :param send: A callable taking a recipient and a list of (Message, data) tuples,
+        which acks the messages once they are delivered.
+        :param window: Seconds to hold a recipient's messages, 0 sends every message on its own.
+        :param max_buffered: The most messages held in memory across all recipients.
+        """
+        self.transport = transport
+        self.send = send
+        self.window = window
+        # The transport stops delivering once its prefetch is unacked, so send early before that
+        prefetch = getattr(transport, "prefetch", None)
+        self.max_buffered = min(max_buffered, prefetch) if prefetch else max_buffered
+        # recipient -> list of (Message, data) held in their open window, oldest window first
+        self.buffers = {}
+        self.buffered = 0
+
+
+    def add(self, recipient, message, data):
+        """
+        Sends a message, or holds it until its recipient's window closes if one is open.
+
+        :param recipient: The email address or webhook url the message goes to.
+        :param message: The transport Message, acked by send once it is delivered.
+        :param data: The decoded message dictionary.
+        """
+        if self.window <= 0:
+            self.send(recipient, [(message, data)])
+            return
+
+        items = self.buffers.get(recipient)
+        if items is None:
+            # nothing sent to them lately, send now and hold whatever follows
+            items = self.buffers[recipient] = []
+            self.transport.call_later(self.window, lambda: self.flush(recipient, items))
+            self.send(recipient, [(message, data)])
+            return
+
+        items.append((message, data))
+        self.buffered += 1
+        if self.buffered >= self.max_buffered:
+            oldest = next(held for held in self.buffers if self.buffers[held])
+            self.flush(oldest, self.buffers[oldest])
+
+
+    def flush(self, recipient, items):
+        """
+        Closes a recipient's window and sends the messages held in it, if it is still open.
+
+        :param recipient: The email address or webhook url the messages go to.
+        :param items: The buffer the window was opened for. A window's timer can fire after
+        the buffer was already sent early, and mustn't close a newer window before its time.
+        """
+        if self.buffers.get(recipient) is not items:
+            return
+        del self.buffers[recipient]
+        if items:
+            self.buffered -= len(items)
+            self.send(recipient, items)
@@ -0,0 +1,326 @@
+"""
+Transports the notification consumers read from. Both hand each message to a
+handler as a Message and leave acknowledging it to the handler, so the email
+and webhook consumers don't care which one they run on. Both can also run a
+callback later on the consuming thread, which the coalescer uses to close its windows,
+hand results from worker threads back to it, and park a message in a delay queue
+to be delivered again later, which the webhook consumer uses for retries.
+
+NOTIFICATION_TRANSPORT in .env picks the transport: "rabbitmq" (the default)
+consumes the durable work queues bound to the enrollment_channels exchange,
+"redis" consumes a Redis Stream per routing key through a consumer group, for
+installs that don't run RabbitMQ.
+"""
+import os
+import queue
+import socket
+import time
+import uuid
+
+import pika
+import redis
+
+# Same names as WORK_QUEUES and NOTIFICATION_STREAMS in enrollment/enrollment_notify.py
+NOTIFICATION_EXCHANGE = 'enrollment_channels'
+WORK_QUEUES = {'email': 'email_notifications', 'webhook': 'webhook_notifications'}
+NOTIFICATION_STREAMS = {'email': 'notifications:email', 'webhook': 'notifications:webhook'}
+
+# Number of unacknowledged messages RabbitMQ will give this consumer at once,
+# and the number of stream entries read per XREADGROUP
+PREFETCH_COUNT = int(os.environ.get("NOTIFICATION_PREFETCH", "10"))
+STREAM_BLOCK_MS = int(os.environ.get("NOTIFICATION_STREAM_BLOCK_MS", "1000"))
+# Stream entries pending this long on another consumer are assumed stuck and claimed
+STREAM_CLAIM_IDLE_MS = int(os.environ.get("NOTIFICATION_STREAM_CLAIM_IDLE_MS", "60000"))
+STREAM_CLAIM_INTERVAL = 30
+# How often the Redis transport moves parked messages that are due back onto the stream
+PARKED_RELEASE_INTERVAL = 1.0
+# The RabbitMQ transport's delay queues, in seconds. RabbitMQ only expires messages from
+# the head of a queue, so each queue has one fixed TTL and every message in it expires in
+# order, and a park waits in the shortest queue at least as long as its delay
+DELAY_TIERS = (1, 5, 10, 30, 60, 120, 300, 600)
+
+# Moves due members of a delayed sorted set back onto their stream, atomically so
+# competing consumers never release the same message twice. Members are "<uuid>|<body>"
+RELEASE_PARKED_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    local sep = string.find(member, '|', 1, true)
+    redis.call('XADD', KEYS[2], '*', 'body', string.sub(member, sep + 1))
+    redis.call('ZREM', KEYS[1], member)
+end
+return #due
+"""
+
+
+class Message:
+    """
+    One notification handed to a consumer's handler.
+    """
+
+    __slots__ = ("body", "_ack")
+
+    def __init__(self, body, ack):
+        """
+        :param body: The raw JSON message body, as bytes.
+        :param ack: A callable that acknowledges the message on its transport.
+        """
+        self.body = body
+        self._ack = ack
+
+
+    def ack(self):
+        """
+        Acknowledges the message, so it is never delivered again.
+        """
+        self._ack()
+
+
+class RabbitMQTransport:
+    """
+    Consumes a routing key's durable work queue, shared by every replica of the consumer.
+    """
+
+    def __init__(self, routing_key, prefetch=PREFETCH_COUNT):
+        """
+        :param routing_key: "email" or "webhook".
+        :param prefetch: The number of unacked messages this consumer may hold.
+        """
+        self.routing_key = routing_key
+        self.queue = WORK_QUEUES[routing_key]
+        self.prefetch = prefetch
+        self.connection = None
+        self.channel = None
+
+
+    def connect(self):
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
+        self.channel = self.connection.channel()
+
+        # Declare the direct exchange that routes notifications by delivery channel
+        self.channel.exchange_declare(exchange=NOTIFICATION_EXCHANGE, exchange_type='direct', durable=True)
+
+        # Declare the durable work queue shared by every consumer of this type and bind it to
+        # the exchange, only for this routing key. Replicas compete for messages from this one
+        # queue, so each message is handled once and adding consumers adds throughput
+        self.channel.queue_declare(queue=self.queue, durable=True)
+        self.channel.queue_bind(exchange=NOTIFICATION_EXCHANGE, queue=self.queue, routing_key=self.routing_key)
+
+        # Parked messages wait in a delay queue until its TTL runs out, then RabbitMQ
+        # dead letters them back through the exchange to the work queue
+        for delay in DELAY_TIERS:
+            self.channel.queue_declare(queue=self.delay_queue(delay), durable=True, arguments={
+                'x-message-ttl': delay * 1000,
+                'x-dead-letter-exchange': NOTIFICATION_EXCHANGE,
+                'x-dead-letter-routing-key': self.routing_key,
+            })
+
+        # Only hand this consumer a few unacked messages at a time, so a busy replica
+        # doesn't hoard messages other replicas could be working on
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+
+
+    def consume(self, handler):
+        """
+        Calls handler with a Message for every notification, until interrupted.
+
+        :param handler: A callable taking a Message.
+        """
+        self.connect()
+
+        def callback(ch, method, properties, body):
+            handler(Message(body, lambda: ch.basic_ack(delivery_tag=method.delivery_tag)))
+
+        self.channel.basic_consume(queue=self.queue, on_message_callback=callback)
+        self.channel.start_consuming()
+
+
+    def call_later(self, delay, callback):
+        """
+        Runs callback on the consuming thread after delay seconds.
+        """
+        self.connection.call_later(delay, callback)
+
+
+    def call_soon_threadsafe(self, callback):
+        """
+        Runs callback on the consuming thread as soon as possible. Safe to call from any thread.
+        """
+        self.connection.add_callback_threadsafe(callback)
+
+
+    def delay_queue(self, delay):
+        return f"{self.queue}_delayed_{delay}s"
+
+
+    def park(self, message, body, delay):
+        """
+        Acks a message and publishes body to a delay queue, to be delivered again after delay
+        seconds, rounded up to the next of DELAY_TIERS and at most the longest.
+
+        :param message: The Message being parked.
+        :param body: The body to deliver later, as a string.
+        :param delay: Seconds until it is delivered again.
+        """
+        tier = next((tier for tier in DELAY_TIERS if tier >= delay), DELAY_TIERS[-1])
+        self.channel.basic_publish(
+            exchange='', routing_key=self.delay_queue(tier), body=body,
+            properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent),
+        )
+        message.ack()
+
+
+class RedisStreamTransport:
+    """
+    Consumes a routing key's Redis Stream through a consumer group. Every replica is a
+    consumer in the same group, so like the RabbitMQ work queues each entry is handled once.
+    Entries are read in batches, and the acks for a batch are sent together.
+    """
+
+    def __init__(self, routing_key, batch_size=PREFETCH_COUNT, block_ms=STREAM_BLOCK_MS,
+                 claim_idle_ms=STREAM_CLAIM_IDLE_MS, client=None):
+        """
+        :param routing_key: "email" or "webhook".
+        :param batch_size: The number of entries read per XREADGROUP.
+        :param block_ms: How long a read waits for new entries.
+        :param claim_idle_ms: How long an entry may stay pending on another consumer before it is claimed.
+        :param client: An optional redis client, db 1 by default.
+        """
+        self.stream = NOTIFICATION_STREAMS[routing_key]
+        self.group = WORK_QUEUES[routing_key]
+        self.delayed = f"{self.stream}:delayed"
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.r = client or redis.Redis(db=1)
+        self.acked = []
+        self.timers = []
+        self.callbacks = queue.SimpleQueue()
+        self.release_parked = self.r.register_script(RELEASE_PARKED_SCRIPT)
+
+
+    def create_group(self):
+        try:
+            self.r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+    def flush_acks(self):
+        """
+        Acknowledges and deletes every entry acked since the last flush, in one round trip.
+        """
+        if not self.acked:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, *self.acked)
+        pipe.xdel(self.stream, *self.acked)
+        pipe.execute()
+        self.acked = []
+
+
+    def claim_stuck(self):
+        """
+        Claims entries another consumer read but never acknowledged, usually because it died.
+
+        :return: A list of (entry_id, fields) tuples now owned by this consumer.
+        """
+        _, claimed, *_ = self.r.xautoclaim(
+            self.stream, self.group, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.batch_size,
+        )
+        # entries deleted while pending come back without fields
+        return [entry for entry in claimed if entry[1]]
+
+
+    def read(self, entry_id):
+        block = None
+        if entry_id != "0":
+            # Don't block past the next timer, so a coalescing window isn't held open by an idle stream
+            block = self.block_ms
+            if self.timers:
+                until_timer = int((min(due for due, _ in self.timers) - time.monotonic()) * 1000)
+                block = max(1, min(block, until_timer))
+        response = self.r.xreadgroup(
+            self.group, self.consumer, {self.stream: entry_id},
+            count=self.batch_size, block=block,
+        )
+        return response[0][1] if response else []
+
+
+    def run_timers(self):
+        while not self.callbacks.empty():
+            self.callbacks.get()()
+        now = time.monotonic()
+        due = [timer for timer in self.timers if timer[0] <= now]
+        if due:
+            self.timers = [timer for timer in self.timers if timer[0] > now]
+            for _, callback in due:
+                callback()
+
+
+    def consume(self, handler):
+        """
+        Calls handler with a Message for every notification, until interrupted.
+        Starts with this consumer's own pending entries, left over from a previous run.
+
+        :param handler: A callable taking a Message.
+        """
+        self.create_group()
+        entries = self.read("0")
+        next_claim = next_release = time.monotonic()
+        while True:
+            if time.monotonic() >= next_claim:
+                entries += self.claim_stuck()
+                next_claim = time.monotonic() + STREAM_CLAIM_INTERVAL
+            if time.monotonic() >= next_release:
+                self.release_parked(keys=[self.delayed, self.stream], args=[time.time(), self.batch_size])
+                next_release = time.monotonic() + PARKED_RELEASE_INTERVAL
+            for entry_id, fields in entries:
+                handler(Message(fields[b"body"], lambda entry_id=entry_id: self.acked.append(entry_id)))
+            self.run_timers()
+            self.flush_acks()
+            entries = self.read(">")
+
+
+    def call_later(self, delay, callback):
+        """
+        Runs callback on the consuming thread after delay seconds, checked between reads.
+        """
+        self.timers.append((time.monotonic() + delay, callback))
+
+
+    def call_soon_threadsafe(self, callback):
+        """
+        Runs callback on the consuming thread after the current read. Safe to call from any thread.
+        """
+        self.callbacks.put(callback)
+
+
+    def park(self, message, body, delay):
+        """
+        Acks a message and adds body to the delayed sorted set, to be put back on the stream after delay seconds.
+
+        :param message: The Message being parked.
+        :param body: The body to deliver later, as a string.
+        :param delay: Seconds until it is delivered again.
+        """
+        self.r.zadd(self.delayed, {f"{uuid.uuid4().hex}|{body}": time.time() + delay})
+        message.ack()
+
+
+def get_transport(routing_key, prefetch=PREFETCH_COUNT):
+    """
+    Builds the transport NOTIFICATION_TRANSPORT selects.
+
+    :param routing_key: "email" or "webhook".
+    :param prefetch: The number of unacked messages a RabbitMQ consumer may hold.
+    :return: A RabbitMQTransport or a RedisStreamTransport.
+    """
+    name = os.environ.get("NOTIFICATION_TRANSPORT", "rabbitmq")
+    if name == "redis":
+        return RedisStreamTransport(routing_key)
+    if name == "rabbitmq":
+        return RabbitMQTransport(routing_key, prefetch)
+    raise ValueError(f"Unknown NOTIFICATION_TRANSPORT {name!r}")
@@ -9,16 +9,16 @@ email = "edwinperaza@cu.fullerton.edu"
 message = {
     "class_name": class_data["name"],
     "message": "You have been enrolled in " + class_data["name"] + " by the registrar",
-    "webhook_url": webhook,
-    "email": email,
 }
-message = json.dumps(message)
 #subscription_details = sub.get_subscription(next_student, class_id)
 # message = "You have been enrolled in " + class_data["name"] + " by the registrar"
 connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
 channel = connection.channel()
 
-channel.exchange_declare(exchange='enrollment_notifications', exchange_type='fanout')
-channel.basic_publish(exchange='enrollment_notifications', routing_key='', body=message, properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent))
-print(f" [x] Sent {message}")
+# Send one message per delivery channel, each with only the address that channel needs
+channel.exchange_declare(exchange='enrollment_channels', exchange_type='direct', durable=True)
+for routing_key, address in (("email", {"email": email}), ("webhook", {"webhook_url": webhook})):
+    body = json.dumps({**message, **address})
+    channel.basic_publish(exchange='enrollment_channels', routing_key=routing_key, body=body, properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent))
+    print(f" [x] Sent {routing_key} {body}")
 connection.close()
\ No newline at end of file
@@ -1,41 +1,30 @@
-import pika
-import httpx
 import json
 
-def webhook_callback(ch, method, properties, body):
-    print(f" [x] Received {body}")
-    data = json.loads(body)
-    webhook_url = data.get('webhook_url')
-    message_text = data.get('message')
-
-    try:
-        response = httpx.post(webhook_url, json={'message': message_text})
-        response.raise_for_status()
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        print(f" [x] Sent webhook callback to {webhook_url}")
-    except httpx.HTTPError as e:
-        print(f"Error sending Webhook callback: {e}")
+from notification_coalescer import Coalescer, coalescing_prefetch
+from notification_transport import get_transport
+from webhook_delivery import WebhookDispatcher
 
 def main():
-    # Set up RabbitMQ connection and channel
-    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-    channel = connection.channel()
-
-    # Declare a fanout exchange
-    channel.exchange_declare(exchange='enrollment_notifications', exchange_type='fanout')
+    # Consume webhook notifications from RabbitMQ or a Redis Stream, as NOTIFICATION_TRANSPORT selects.
+    # Replicas compete for messages from one shared queue or consumer group, so each message
+    # is handled once and adding consumers adds throughput
+    transport = get_transport('webhook', coalescing_prefetch())
 
-    # Declare a queue and bind it to the exchange
-    result = channel.queue_declare(queue='', exclusive=True, durable=True)
-    queue_name = result.method.queue
+    # POST on a thread pool, with a circuit breaker and an adaptive concurrency limit per host,
+    # parking failed and blocked messages in the delay queue instead of leaving them unacked
+    dispatcher = WebhookDispatcher(transport)
 
-    channel.queue_bind(exchange='enrollment_notifications', queue=queue_name)
+    # Hold each webhook's notifications for a short window and POST them together
+    coalescer = Coalescer(transport, dispatcher.send)
 
-    # Set up the consumer callback
-    channel.basic_consume(queue=queue_name, on_message_callback=webhook_callback)
+    def webhook_callback(message):
+        print(f" [x] Received {message.body}")
+        data = json.loads(message.body)
+        coalescer.add(data.get('webhook_url'), message, data)
 
     # Start consuming messages
     print('Webhook Callback Consumer is waiting for messages. To exit press CTRL+C')
-    channel.start_consuming()
+    transport.consume(webhook_callback)
 
 
 if __name__ == '__main__':
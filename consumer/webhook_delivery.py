@@ -0,0 +1,230 @@
+"""
+Delivers webhooks concurrently with per host health tracking, so one dead or
+slow student webhook doesn't hold up delivery to everyone else.
+
+Each destination host has its own circuit breaker and its own AIMD concurrency
+limit. Consecutive failures open the host's breaker, and while it is open the
+host's messages are parked in the transport's delay queue and acked, instead of
+sitting unacked and filling the consumer's prefetch. After a cooldown one probe
+is let through, and its result closes the breaker or opens it again for longer.
+The limit grows by one request per round of fast responses and halves when a
+host is slow or failing. Failed deliveries are parked for a retry too, and
+dropped after WEBHOOK_MAX_ATTEMPTS failed sends.
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+
+MAX_WORKERS = int(os.environ.get("WEBHOOK_MAX_WORKERS", "32"))
+TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", "5.0"))
+# Responses slower than this count against a host's concurrency limit
+LATENCY_TARGET = float(os.environ.get("WEBHOOK_LATENCY_TARGET", "1.0"))
+INITIAL_LIMIT = 4
+MAX_LIMIT = MAX_WORKERS
+# Messages waiting for a host's limit beyond this are parked, so they don't hold prefetch
+MAX_HOST_BACKLOG = int(os.environ.get("WEBHOOK_MAX_HOST_BACKLOG", "10"))
+FAILURE_THRESHOLD = int(os.environ.get("WEBHOOK_FAILURE_THRESHOLD", "5"))
+COOLDOWN = float(os.environ.get("WEBHOOK_COOLDOWN", "30"))
+MAX_COOLDOWN = 600
+RETRY_DELAY = float(os.environ.get("WEBHOOK_RETRY_DELAY", "10"))
+MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))
+
+
+class CircuitBreaker:
+    """
+    Closed until FAILURE_THRESHOLD consecutive failures, then open for a cooldown
+    that doubles every time a probe fails, up to MAX_COOLDOWN.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.cooldown = COOLDOWN
+        self.opened_at = None
+        self.probing = False
+
+
+    def allow(self):
+        """
+        :return: Boolean based on if a request to the host may be sent now.
+        """
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        # Half open, let a single probe through
+        self.probing = True
+        return True
+
+
+    def retry_after(self):
+        """
+        :return: Seconds until the breaker lets a probe through.
+        """
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.cooldown - time.monotonic())
+
+
+    def record_success(self):
+        self.failures = 0
+        self.cooldown = COOLDOWN
+        self.opened_at = None
+        self.probing = False
+
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing:
+            self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+        if self.probing or self.failures >= FAILURE_THRESHOLD:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class AIMDLimit:
+    """
+    Additive increase, multiplicative decrease concurrency limit for one host.
+    """
+
+    def __init__(self, initial=INITIAL_LIMIT, maximum=MAX_LIMIT):
+        self.limit = float(initial)
+        self.maximum = maximum
+
+
+    def record(self, latency, ok):
+        """
+        :param latency: Seconds the request took.
+        :param ok: Boolean based on if the request succeeded.
+        """
+        if ok and latency <= LATENCY_TARGET:
+            # Grows by about one per limit's worth of fast responses
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(1.0, self.limit / 2)
+
+
+class HostState:
+
+    __slots__ = ("breaker", "limit", "in_flight", "backlog")
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.limit = AIMDLimit()
+        self.in_flight = 0
+        self.backlog = deque()
+
+
+class WebhookDispatcher:
+    """
+    Sends coalesced webhook batches on a thread pool. Everything except the POST
+    itself runs on the transport's consuming thread, so host state needs no locks.
+    """
+
+    def __init__(self, transport, max_workers=MAX_WORKERS):
+        """
+        :param transport: The transport the messages came from, used to park
+        messages and to run completions on the consuming thread.
+        :param max_workers: The most webhooks in flight across all hosts.
+        """
+        self.transport = transport
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.client = httpx.Client(timeout=TIMEOUT)
+        self.hosts = {}
+
+
+    def send(self, webhook_url, items):
+        """
+        Sends a batch of notifications to one webhook, now or once its host has capacity.
+        Used as the coalescer's send.
+
+        :param webhook_url: The url to POST to.
+        :param items: A list of (Message, data) tuples.
+        """
+        state = self.hosts.get(urlsplit(webhook_url).netloc)
+        if state is None:
+            state = self.hosts[urlsplit(webhook_url).netloc] = HostState()
+
+        if state.in_flight >= int(state.limit.limit):
+            if len(state.backlog) >= MAX_HOST_BACKLOG:
+                self.park(items, RETRY_DELAY)
+            else:
+                state.backlog.append((webhook_url, items))
+        elif state.breaker.allow():
+            self.start(state, webhook_url, items)
+        else:
+            self.park(items, state.breaker.retry_after())
+
+
+    def start(self, state, webhook_url, items):
+        messages = [data for _, data in items]
+        # A single notification keeps the original {"message": ...} body, coalesced ones
+        # are sent together as {"messages": [...]}
+        if len(messages) == 1:
+            body = {'message': messages[0].get('message')}
+        else:
+            body = {'messages': [data.get('message') for data in messages]}
+
+        state.in_flight += 1
+        started = time.monotonic()
+        future = self.pool.submit(self.client.post, webhook_url, json=body)
+        future.add_done_callback(
+            lambda future: self.transport.call_soon_threadsafe(
+                lambda: self.finish(state, webhook_url, items, future, time.monotonic() - started)
+            )
+        )
+
+
+    def finish(self, state, webhook_url, items, future, latency):
+        state.in_flight -= 1
+        # Anything the POST raises counts against the host and parks the batch, an invalid
+        # url raises errors outside httpx.HTTPError, and the messages must not be left unacked
+        try:
+            future.result().raise_for_status()
+            ok = True
+        except Exception as e:
+            print(f"Error sending Webhook callback to {webhook_url}: {e!r}")
+            ok = False
+
+        state.limit.record(latency, ok)
+        if ok:
+            state.breaker.record_success()
+            for message, _ in items:
+                message.ack()
+            print(f" [x] Sent {len(items)} notification(s) to {webhook_url}")
+        else:
+            state.breaker.record_failure()
+            self.park(items, max(RETRY_DELAY, state.breaker.retry_after()), failed=True)
+
+        # Start waiting batches the host has room for now, or park them all if it just failed for good
+        while state.backlog and state.in_flight < int(state.limit.limit):
+            backlog_url, backlog_items = state.backlog.popleft()
+            if state.breaker.allow():
+                self.start(state, backlog_url, backlog_items)
+            else:
+                self.park(backlog_items, state.breaker.retry_after())
+                while state.backlog:
+                    self.park(state.backlog.popleft()[1], state.breaker.retry_after())
+
+
+    def park(self, items, delay, failed=False):
+        """
+        Parks messages for another attempt after delay seconds, or drops them after MAX_ATTEMPTS.
+        Only failed sends count as attempts, messages parked for an open breaker or a full
+        backlog were never sent.
+
+        :param items: A list of (Message, data) tuples.
+        :param delay: Seconds until they are delivered again.
+        :param failed: Whether they are parked because sending them failed.
+        """
+        for message, data in items:
+            attempts = data.get('attempts', 0) + int(failed)
+            if failed and attempts >= MAX_ATTEMPTS:
+                print(f"Dropping webhook to {data.get('webhook_url')} after {attempts} attempts")
+                message.ack()
+            else:
+                self.transport.park(message, json.dumps({**data, 'attempts': attempts}), delay)
@@ -0,0 +1,111 @@
+import asyncio
+import math
+
+from redis import asyncio as aioredis
+from fastapi import HTTPException, status
+from pydantic_settings import BaseSettings
+
+admission_bucket_key = "admission:{}:bucket"
+admission_queued_key = "admission:{}:queued:{}"
+
+# Token bucket shared by every enrollment worker, refilled from the redis clock.
+# A request that finds no token may reserve the next one if it would wait at most
+# max_wait, which lines waiting requests up in arrival order across workers. Each
+# student holds at most one place in that line.
+# KEYS = bucket, student's queued marker. ARGV = rate per second, burst, max wait ms.
+# Returns {admitted (1) or rejected (0), ms to wait before proceeding or retrying}
+ADMIT_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+
+local wait = 0
+if tokens < 1 then
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+    if wait > max_wait then return {0, wait} end
+    if not redis.call('SET', KEYS[2], 1, 'NX', 'PX', wait + 1000) then return {0, wait} end
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {1, wait}
+"""
+
+
+class AdmissionSettings(BaseSettings, env_file=".env", extra="ignore"):
+    admission_enabled: bool = True
+    admission_rate: float = 200.0
+    admission_burst: int = 50
+    # Longest a request may queue for a token, well under KrakenD's 3000 ms timeout
+    admission_max_wait: float = 1.0
+
+
+settings = AdmissionSettings()
+
+
+class AdmissionLimiter:
+    """
+    Admission control for one route group, shared across enrollment workers through redis.
+    Requests over the limit are rejected straight away with 429 and Retry-After, instead of
+    piling up in the workers until the gateway times them out.
+    """
+
+    def __init__(self, name, rate=None, burst=None, max_wait=None):
+        """
+        :param name: The route group, used in the redis keys.
+        :param rate: Requests admitted per second across all workers.
+        :param burst: Requests that may be admitted at once after an idle period.
+        :param max_wait: Seconds a request may queue for a token before it is rejected.
+        """
+        self.name = name
+        self.rate = rate or settings.admission_rate
+        self.burst = burst or settings.admission_burst
+        self.max_wait = settings.admission_max_wait if max_wait is None else max_wait
+        # the asyncio client, so waiting on redis doesn't block the event loop
+        self.redis_client = aioredis.Redis(db=1)
+        self.admit_script = self.redis_client.register_script(ADMIT_SCRIPT)
+
+
+    async def acquire(self, student_id):
+        """
+        Tries to take a token for a student's request.
+
+        :param student_id: The integer id of the student.
+        :return: A tuple of (admitted, seconds to wait before proceeding, or before retrying if rejected).
+        """
+        admitted, wait_ms = await self.admit_script(
+            keys=[admission_bucket_key.format(self.name), admission_queued_key.format(self.name, student_id)],
+            args=[self.rate, self.burst, int(self.max_wait * 1000)],
+        )
+        return bool(admitted), wait_ms / 1000
+
+
+    async def leave_queue(self, student_id):
+        await self.redis_client.delete(admission_queued_key.format(self.name, student_id))
+
+
+    async def __call__(self, student_id: int):
+        """
+        FastAPI dependency that admits the request, waits for its place in line,
+        or rejects it with 429 and Retry-After.
+        """
+        if not settings.admission_enabled:
+            return
+        admitted, wait = await self.acquire(student_id)
+        if not admitted:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many enrollment requests, try again shortly",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                await self.leave_queue(student_id)
@@ -0,0 +1,77 @@
+import functools
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+
+class Identity:
+    """
+    The caller's identity, as propagated by KrakenD from the JWT claims
+    in the X-User and X-Roles headers.
+    """
+
+    __slots__ = ("user_id", "roles")
+
+    def __init__(self, user_id, roles):
+        """
+        :param user_id: The integer id of the user.
+        :param roles: A frozenset of the user's roles.
+        """
+        self.user_id = user_id
+        self.roles = roles
+
+
+    def can_act_for(self, user_id):
+        """
+        Checks whether the caller may act on behalf of a user, which is
+        allowed for the user themselves and for registrars.
+
+        :param user_id: The integer id of the user being acted on.
+        :return: Boolean based on if the caller is allowed or not.
+        """
+        return self.user_id == user_id or "registrar" in self.roles
+
+
+@functools.lru_cache(maxsize=64)
+def parse_roles(roles_string):
+    """
+    Parses the comma separated X-Roles header. There are only a handful of
+    distinct role combinations, so the parsed sets are cached.
+
+    :param roles_string: The raw X-Roles header value.
+    :return: A frozenset of roles.
+    """
+    return frozenset(role.strip() for role in roles_string.split(",") if role.strip())
+
+
+def get_identity(
+    x_user: Optional[str] = Header(None), x_roles: Optional[str] = Header(None)
+):
+    """
+    FastAPI dependency that parses the gateway propagated claims once per request.
+    Requests that didn't come through the gateway have no X-User header and get None.
+
+    :return: An Identity, or None if there is no X-User header.
+    """
+    if not x_user:
+        return None
+    try:
+        user_id = int(x_user)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid X-User header"
+        )
+    return Identity(user_id, parse_roles(x_roles or ""))
+
+
+def authorize(identity, user_id):
+    """
+    Raises a 403 unless the caller may act on behalf of the given user.
+    Calls without an identity didn't come through the gateway and are let through,
+    matching how the routes have always treated a missing X-User header.
+
+    :param identity: The Identity from get_identity, or None.
+    :param user_id: The integer id of the user being acted on.
+    """
+    if identity is not None and not identity.can_act_for(user_id):
+        raise HTTPException(status_code=403, detail="Access forbidden, wrong user")
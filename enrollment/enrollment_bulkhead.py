@@ -0,0 +1,196 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from pydantic_settings import BaseSettings
+
+
+class BulkheadSettings(BaseSettings, env_file=".env", extra="ignore"):
+    bulkhead_enabled: bool = True
+    # How long a request may queue for a slot, under KrakenD's 3000 ms timeout
+    bulkhead_queue_timeout: float = 2.0
+    # Per route group: requests running at once in a worker, and requests allowed to queue behind them
+    bulkhead_student_limit: int = 200
+    bulkhead_student_queue: int = 400
+    bulkhead_instructor_limit: int = 16
+    bulkhead_instructor_queue: int = 64
+    bulkhead_registrar_limit: int = 8
+    bulkhead_registrar_queue: int = 32
+    bulkhead_debug_limit: int = 2
+    bulkhead_debug_queue: int = 4
+
+
+settings = BulkheadSettings()
+
+# Every bulkhead in this worker, by name
+bulkheads = {}
+
+_exhausted = object()
+
+
+class Bulkhead:
+    """
+    Concurrency limit for one route group in a worker. Routes in the group wait in a
+    bounded queue for one of its slots, and are rejected with 503 and Retry-After when
+    the queue is full or the wait runs past the queue timeout. Sync routes run on the
+    group's own threads rather than FastAPI's shared threadpool, so a group that is
+    saturated can't hold the threads every other group needs.
+
+    Used as a decorator under the router's decorator:
+
+        @router.get("/debug/classes", tags=["Debug"])
+        @debug_bulkhead
+        def list_all_classes():
+    """
+
+    def __init__(self, name, limit, max_queue, queue_timeout=None):
+        """
+        :param name: The route group, used in the metrics.
+        :param limit: Requests in the group that may run at once.
+        :param max_queue: Requests that may wait for a slot.
+        :param queue_timeout: Seconds a request may wait for a slot.
+        """
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = settings.bulkhead_queue_timeout if queue_timeout is None else queue_timeout
+        self.semaphore = asyncio.Semaphore(limit)
+        self.executor = None
+        self.active = 0
+        self.queued = 0
+        self.counters = {"admitted": 0, "rejected": 0, "timed_out": 0, "peak_queued": 0, "wait_seconds": 0.0}
+        bulkheads[name] = self
+
+
+    def reject(self, detail):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many {self.name} requests, {detail}",
+            headers={"Retry-After": "1"},
+        )
+
+
+    def check_capacity(self):
+        """
+        Rejects the request with 503 if the group's queue is full.
+        """
+        if self.active + self.queued >= self.limit + self.max_queue:
+            self.counters["rejected"] += 1
+            self.reject("try again shortly")
+
+
+    async def acquire(self):
+        self.check_capacity()
+
+        self.queued += 1
+        self.counters["peak_queued"] = max(self.counters["peak_queued"], self.queued)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["timed_out"] += 1
+            self.reject("timed out waiting for a slot")
+        finally:
+            self.queued -= 1
+        self.counters["wait_seconds"] += time.monotonic() - start
+        self.counters["admitted"] += 1
+        self.active += 1
+
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix=f"bulkhead-{self.name}")
+        return self.executor
+
+
+    async def stream(self, iterator):
+        """
+        Iterates a blocking iterator on the group's threads, holding one of its slots until
+        it's exhausted or the client goes away. For StreamingResponse bodies, which run after
+        the route has returned. The slot is taken when the body starts, so call check_capacity
+        in the route to reject requests while a status can still be sent.
+
+        :param iterator: A blocking iterator, closed when the stream ends.
+        :return: An async generator of the iterator's items.
+        """
+        if settings.bulkhead_enabled:
+            await self.acquire()
+        pending = None
+        try:
+            while True:
+                pending = self.get_executor().submit(next, iterator, _exhausted)
+                item = await asyncio.wrap_future(pending)
+                if item is _exhausted:
+                    return
+                yield item
+        finally:
+            if settings.bulkhead_enabled:
+                self.release()
+            if hasattr(iterator, "close"):
+                # Closed on the thread that last advanced it, once it is done, as
+                # a generator can't be closed while another thread is running it
+                if pending is None:
+                    iterator.close()
+                else:
+                    pending.add_done_callback(lambda _: iterator.close())
+
+
+    def __call__(self, func):
+        if asyncio.iscoroutinefunction(func):
+            async def call(**kwargs):
+                return await func(**kwargs)
+        else:
+            executor = self.get_executor()
+
+            async def call(**kwargs):
+                context = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(
+                    executor, functools.partial(context.run, func, **kwargs)
+                )
+
+        async def route(**kwargs):
+            if not settings.bulkhead_enabled:
+                return await call(**kwargs)
+            await self.acquire()
+            try:
+                return await call(**kwargs)
+            finally:
+                self.release()
+
+        # FastAPI reads the route's parameters from its signature and passes them as keywords.
+        # Without __wrapped__ it doesn't look through to a sync func and run the route on its threadpool
+        functools.update_wrapper(route, func)
+        del route.__wrapped__
+        route.__signature__ = inspect.signature(func)
+        return route
+
+
+    def stats(self):
+        admitted = self.counters["admitted"]
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": admitted,
+            "rejected": self.counters["rejected"],
+            "timed_out": self.counters["timed_out"],
+            "peak_queued": self.counters["peak_queued"],
+            "avg_wait_ms": round(self.counters["wait_seconds"] * 1000 / admitted, 2) if admitted else 0.0,
+        }
+
+
+def bulkhead_stats():
+    """
+    :return: A dictionary of route group -> concurrency and queue depth metrics, for this worker.
+    """
+    return {name: bulkhead.stats() for name, bulkhead in bulkheads.items()}
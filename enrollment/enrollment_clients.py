@@ -0,0 +1,99 @@
+import functools
+import threading
+
+import boto3
+from botocore.config import Config
+from pydantic_settings import BaseSettings
+
+
+class ClientSettings(BaseSettings, env_file=".env", extra="ignore"):
+    dynamodb_endpoint_url: str = "http://localhost:5500"
+    dynamodb_max_pool_connections: int = 50
+    # Connections for the debug routes' scans, kept apart from the pool the other routes use
+    dynamodb_debug_max_pool_connections: int = 4
+    dynamodb_connect_timeout: float = 1.0
+    dynamodb_read_timeout: float = 2.0
+    dynamodb_max_attempts: int = 3
+    dynamodb_retry_mode: str = "adaptive"
+    dynamodb_tcp_keepalive: bool = True
+
+
+settings = ClientSettings()
+
+DEFAULT_POOL = "default"
+DEBUG_POOL = "debug"
+
+# Cached Table handles, so routes don't build a new Table object per request
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def client_config_kwargs(**overrides):
+    """
+    Returns the keyword arguments shared by the sync and async DynamoDB client configs.
+    The read timeout is kept below KrakenD's 3000ms so a slow call fails inside the
+    gateway's budget instead of after it.
+
+    :param overrides: Any values that should replace the configured defaults.
+    :return: A dictionary of botocore Config keyword arguments.
+    """
+    kwargs = {
+        "max_pool_connections": settings.dynamodb_max_pool_connections,
+        "connect_timeout": settings.dynamodb_connect_timeout,
+        "read_timeout": settings.dynamodb_read_timeout,
+        "retries": {
+            "max_attempts": settings.dynamodb_max_attempts,
+            "mode": settings.dynamodb_retry_mode,
+        },
+        "tcp_keepalive": settings.dynamodb_tcp_keepalive,
+    }
+    kwargs.update(overrides)
+    return kwargs
+
+
+def client_config(**overrides):
+    """
+    Builds the botocore Config used by every boto3 DynamoDB resource.
+
+    :param overrides: Any values that should replace the configured defaults.
+    :return: A botocore Config object.
+    """
+    return Config(**client_config_kwargs(**overrides))
+
+
+@functools.lru_cache(maxsize=None)
+def get_dynamodb_resource(pool=DEFAULT_POOL):
+    """
+    Returns a process wide boto3 DynamoDB resource. Every caller of the same pool shares
+    the same underlying connection pool, and the debug pool's scans can't take the
+    connections the other routes need.
+
+    :param pool: DEFAULT_POOL, or DEBUG_POOL for the debug routes.
+    :return: A Boto3 DynamoDB resource.
+    """
+    overrides = {}
+    if pool == DEBUG_POOL:
+        overrides["max_pool_connections"] = settings.dynamodb_debug_max_pool_connections
+    return boto3.resource(
+        "dynamodb",
+        endpoint_url=settings.dynamodb_endpoint_url,
+        config=client_config(**overrides),
+    )
+
+
+def get_table(table_name, pool=DEFAULT_POOL):
+    """
+    Returns a cached Table handle for the given table name.
+
+    :param table_name: The name of the table.
+    :param pool: The connection pool the table's requests use.
+    :return: A Boto3 DynamoDB Table.
+    """
+    table = _tables.get((pool, table_name))
+    if table is None:
+        with _tables_lock:
+            table = _tables.get((pool, table_name))
+            if table is None:
+                table = get_dynamodb_resource(pool).Table(table_name)
+                _tables[(pool, table_name)] = table
+    return table
@@ -1,5 +1,11 @@
 import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError, WaiterError
 
 
@@ -9,6 +15,195 @@ logger = logging.getLogger(__name__)
 table_prefix = "enrollment_"
 DEBUG = False
 
+# Segments scanned at once by parallel_scan, and pages each may have waiting to be read
+SCAN_SEGMENTS = 4
+SCAN_PAGES_BUFFERED = 2
+
+# Global secondary indexes by table, each a key schema of (attribute, type) pairs, hash key first.
+# The tables' own id keys serve lookups by id, so no index repeats them as a hash key
+INSTRUCTOR_INDEX = "instructor-index"
+DEPARTMENT_INDEX = "department-index"
+NAME_INDEX = "name-index"
+CLASS_INDEXES = {
+    INSTRUCTOR_INDEX: (("instructor_id", "N"), ("id", "N")),
+    DEPARTMENT_INDEX: (("department", "S"), ("course_code", "S")),
+}
+USER_INDEXES = {
+    NAME_INDEX: (("name", "S"),),
+}
+# The index the tables used to have on their own hash key, removed by migrate_indexes
+LEGACY_ID_INDEX = "id-index"
+INDEX_POLL_INTERVAL = 1
+
+
+def index_definitions(index_name, key_schema):
+    """
+    Builds the attribute definitions and global secondary index description for an index.
+
+    :param index_name: The name of the index.
+    :param key_schema: The index's (attribute, type) pairs, hash key first.
+    :return: A tuple of (attribute definitions, index description).
+    """
+    attributes = [
+        {'AttributeName': attribute, 'AttributeType': attribute_type}
+        for attribute, attribute_type in key_schema
+    ]
+    index = {
+        'IndexName': index_name,
+        'KeySchema': [
+            {'AttributeName': attribute, 'KeyType': key_type}
+            for (attribute, _), key_type in zip(key_schema, ('HASH', 'RANGE'))
+        ],
+        'Projection': {
+            'ProjectionType': 'ALL',
+        },
+        'ProvisionedThroughput': {
+            'ReadCapacityUnits': 10,
+            'WriteCapacityUnits': 10,
+        },
+    }
+    return attributes, index
+
+
+def table_definitions(indexes):
+    """
+    Builds the attribute definitions and global secondary indexes for a table keyed on id.
+
+    :param indexes: A dictionary of index name to key schema.
+    :return: A dictionary of create_table keyword arguments.
+    """
+    attributes = {'id': 'N'}
+    gsis = []
+    for index_name, key_schema in indexes.items():
+        index_attributes, index = index_definitions(index_name, key_schema)
+        for attribute in index_attributes:
+            attributes[attribute['AttributeName']] = attribute['AttributeType']
+        gsis.append(index)
+    return {
+        'AttributeDefinitions': [
+            {'AttributeName': attribute, 'AttributeType': attribute_type}
+            for attribute, attribute_type in attributes.items()
+        ],
+        'GlobalSecondaryIndexes': gsis,
+    }
+
+
+# Attributes the routes read from class and user items. The enrolled set grows
+# with the section, so only the reads that use it project it
+CLASS_EXISTS = ("id",)
+CLASS_OWNER = ("id", "instructor_id")
+CLASS_NAME = ("id", "name", "section_number")
+CLASS_SEATS = ("id", "current_enroll", "max_enroll", "enrolled")
+CLASS_SUMMARY = (
+    "id", "name", "course_code", "section_number", "current_enroll", "max_enroll", "department", "instructor_id",
+)
+USER_EXISTS = ("id",)
+USER_NAME = ("id", "name")
+
+
+def projection(attributes):
+    """
+    Builds the GetItem or Query parameters that read only some attributes of an item.
+    Every name goes through a placeholder, as some of them, such as name, are reserved words.
+
+    :param attributes: A sequence of attribute names, or None for the whole item.
+    :return: A dictionary of ProjectionExpression and ExpressionAttributeNames, empty for the whole item.
+    """
+    if not attributes:
+        return {}
+    names = {f"#p{i}": attribute for i, attribute in enumerate(attributes)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+
+# Roster entry status, used as the sort key prefix in the roster table.
+# Drops are kept in the drop history table instead
+ROSTER_ENROLLED = "enrolled"
+
+
+def roster_key(class_id, student_id, status):
+    """
+    Builds the primary key of a roster entry. Student ids are zero padded so
+    entries sort numerically within a status.
+
+    :param class_id: The integer id of a class.
+    :param student_id: The integer id of a student.
+    :param status: ROSTER_ENROLLED.
+    :return: The key of the roster item.
+    """
+    return {"class_id": class_id, "entry": f"{status}#{int(student_id):08d}"}
+
+
+def roster_item(class_id, student_id, name, status):
+    """
+    Builds a full roster item, a denormalised copy of the student's name per class.
+
+    :param class_id: The integer id of a class.
+    :param student_id: The integer id of a student.
+    :param name: The name of the student.
+    :param status: ROSTER_ENROLLED.
+    :return: The roster item.
+    """
+    return {
+        **roster_key(class_id, student_id, status),
+        "student_id": student_id,
+        "name": name,
+    }
+
+
+def drop_time():
+    """
+    :return: The current time in integer milliseconds since the epoch, as drops are recorded.
+    """
+    return int(time.time() * 1000)
+
+
+def history_key(class_id, student_id, dropped_at):
+    """
+    Builds the primary key of a drop history entry. The drop time and student id are
+    zero padded so entries sort by time, and two drops in the same millisecond don't collide.
+    Entries are handed out as page cursors, so they are kept to URL safe characters.
+
+    :param class_id: The integer id of a class.
+    :param student_id: The integer id of the student who dropped.
+    :param dropped_at: The drop time in milliseconds since the epoch.
+    :return: The key of the history item.
+    """
+    return {"class_id": class_id, "entry": f"{int(dropped_at):013d}_{int(student_id):08d}"}
+
+
+# The entries history_key builds, which are also the drop history's page cursors
+HISTORY_ENTRY = re.compile(r"\d{13}_\d{8}")
+
+
+def is_history_cursor(cursor):
+    """
+    :param cursor: A drop history page cursor from a request.
+    :return: Boolean based on if the cursor is an entry history_key could have built.
+    """
+    return HISTORY_ENTRY.fullmatch(cursor) is not None
+
+
+def history_item(class_id, student_id, name, dropped_at):
+    """
+    Builds a full drop history item.
+
+    :param class_id: The integer id of a class.
+    :param student_id: The integer id of the student who dropped.
+    :param name: The name of the student.
+    :param dropped_at: The drop time in milliseconds since the epoch.
+    :return: The history item.
+    """
+    return {
+        **history_key(class_id, student_id, dropped_at),
+        "student_id": student_id,
+        "name": name,
+        "dropped_at": int(dropped_at),
+    }
+
+
 class Enrollment:
     """Encapsulates an Amazon DynamoDB table of enrollment data."""
 
@@ -17,17 +212,35 @@ class Enrollment:
         :param dyn_resource: A Boto3 DynamoDB resource.
         """
         self.dyn_resource = dyn_resource
-        # The table variable is set during the scenario in the call to
-        # 'exists' if the table exists. Otherwise, it is set by 'create_table'.
+        # The table variables are set here if the tables exist.
+        # Otherwise, they are set by 'create_table'.
+        self.classes = None
+        self.users = None
+        self.roster = None
+        self.drop_history = None
         if self.check_table_exists("enrollment_class"):
             for table in self.dyn_resource.tables.all():
-                if table.name == "enrollment_class":
+                if table.name == table_prefix + "class":
                     self.classes = table
-                else:
+                elif table.name == table_prefix + "user":
                     self.users = table
-        else:
-            self.classes = None
-            self.users = None
+                elif table.name == table_prefix + "roster":
+                    self.roster = table
+                elif table.name == table_prefix + "drop_history":
+                    self.drop_history = table
+
+
+    def missing_tables(self):
+        """
+        Finds the tables an existing database hasn't been migrated to yet.
+
+        :return: A list of the missing table names, empty if every table exists or
+                 the database has no enrollment tables at all yet.
+        """
+        if self.classes is None:
+            return []
+        tables = {"user": self.users, "roster": self.roster, "drop_history": self.drop_history}
+        return [table_prefix + name for name, table in tables.items() if table is None]
 
 
     def create_table(self, table_name):
@@ -44,34 +257,68 @@ class Enrollment:
                     KeySchema=[
                         {'AttributeName': 'id', 'KeyType': 'HASH'},  # Partition key
                     ],
-                    AttributeDefinitions=[
-                        {'AttributeName': 'id', 'AttributeType': 'N'},
-                    ],
                     ProvisionedThroughput={
                         "ReadCapacityUnits": 10,
                         "WriteCapacityUnits": 10,
                     },
+                    **table_definitions(CLASS_INDEXES),
                 )
                 self.classes.wait_until_exists()
-                self.create_secondary_index(self.classes, 'id-index', 'id')
                 table = self.classes
-            else:
+            elif table_name == "user":
                 self.users = self.dyn_resource.create_table(
                     TableName=table_prefix + table_name,
                     KeySchema=[
                         {'AttributeName': 'id', 'KeyType': 'HASH'},  # Partition key
                     ],
-                    AttributeDefinitions=[
-                        {'AttributeName': 'id', 'AttributeType': 'N'},
-                    ],
                     ProvisionedThroughput={
                         "ReadCapacityUnits": 10,
                         "WriteCapacityUnits": 10,
                     },
+                    **table_definitions(USER_INDEXES),
                 )
                 self.users.wait_until_exists()
-                self.create_secondary_index(self.users, 'id-index', 'id')
                 table = self.users
+            elif table_name == "roster":
+                # One item per student per class, sorted by status and then student id,
+                # so a class's enrolled students are a single Query
+                self.roster = self.dyn_resource.create_table(
+                    TableName=table_prefix + table_name,
+                    KeySchema=[
+                        {'AttributeName': 'class_id', 'KeyType': 'HASH'},  # Partition key
+                        {'AttributeName': 'entry', 'KeyType': 'RANGE'},  # Sort key
+                    ],
+                    AttributeDefinitions=[
+                        {'AttributeName': 'class_id', 'AttributeType': 'N'},
+                        {'AttributeName': 'entry', 'AttributeType': 'S'},
+                    ],
+                    ProvisionedThroughput={
+                        "ReadCapacityUnits": 10,
+                        "WriteCapacityUnits": 10,
+                    },
+                )
+                self.roster.wait_until_exists()
+                table = self.roster
+            elif table_name == "drop_history":
+                # Append-only, one item per drop, sorted by time within each class,
+                # so a class's drops are read a page at a time with a single Query
+                self.drop_history = self.dyn_resource.create_table(
+                    TableName=table_prefix + table_name,
+                    KeySchema=[
+                        {'AttributeName': 'class_id', 'KeyType': 'HASH'},  # Partition key
+                        {'AttributeName': 'entry', 'KeyType': 'RANGE'},  # Sort key
+                    ],
+                    AttributeDefinitions=[
+                        {'AttributeName': 'class_id', 'AttributeType': 'N'},
+                        {'AttributeName': 'entry', 'AttributeType': 'S'},
+                    ],
+                    ProvisionedThroughput={
+                        "ReadCapacityUnits": 10,
+                        "WriteCapacityUnits": 10,
+                    },
+                )
+                self.drop_history.wait_until_exists()
+                table = self.drop_history
         except ClientError as err:
             logger.error(
                 "Couldn't create table %s. Here's why: %s: %s",
@@ -84,39 +331,22 @@ class Enrollment:
             return table
     
 
-    def create_secondary_index(self, table, index_name, attribute_name):
+    def create_secondary_index(self, table, index_name, key_schema):
         """
-        Creates a global secondary index on the specified table.
+        Creates a global secondary index on the specified table, and waits for it to backfill.
 
         :param table: The DynamoDB table object.
         :param index_name: The name of the index to create.
-        :param attribute_name: The attribute to use as the index key.
+        :param key_schema: The index's (attribute, type) pairs, hash key first.
         """
+        attributes, index = index_definitions(index_name, key_schema)
         try:
             table.update(
-                AttributeDefinitions=[
-                    {'AttributeName': attribute_name, 'AttributeType': 'N'},
-                ],
-                GlobalSecondaryIndexUpdates=[
-                    {
-                        'Create': {
-                            'IndexName': index_name,
-                            'KeySchema': [
-                                {'AttributeName': attribute_name, 'KeyType': 'HASH'},
-                            ],
-                            'Projection': {
-                                'ProjectionType': 'ALL',
-                            },
-                            'ProvisionedThroughput': {
-                                'ReadCapacityUnits': 10,
-                                'WriteCapacityUnits': 10,
-                            },
-                        }
-                    },
-                ],
+                AttributeDefinitions=attributes,
+                GlobalSecondaryIndexUpdates=[{'Create': index}],
             )
-            table.wait_until_exists()
-        except WaiterError as err:
+            self.wait_for_indexes(table)
+        except (ClientError, WaiterError) as err:
             logger.error(
                 "Couldn't create index %s on table %s. Here's why: %s",
                 index_name,
@@ -124,6 +354,53 @@ class Enrollment:
                 err,
             )
             raise
+
+
+    def delete_secondary_index(self, table, index_name):
+        """
+        Deletes a global secondary index from the specified table.
+
+        :param table: The DynamoDB table object.
+        :param index_name: The name of the index to delete.
+        """
+        try:
+            table.update(GlobalSecondaryIndexUpdates=[{'Delete': {'IndexName': index_name}}])
+            self.wait_for_indexes(table)
+        except (ClientError, WaiterError) as err:
+            logger.error(
+                "Couldn't delete index %s on table %s. Here's why: %s",
+                index_name,
+                table.name,
+                err,
+            )
+            raise
+
+
+    def secondary_indexes(self, table):
+        """
+        :param table: The DynamoDB table object.
+        :return: A dictionary of the table's global secondary index names to their status.
+        """
+        table.reload()
+        return {
+            index['IndexName']: index.get('IndexStatus', 'ACTIVE')
+            for index in table.global_secondary_indexes or []
+        }
+
+
+    def wait_for_indexes(self, table):
+        """
+        Waits until the table and every index on it are active. DynamoDB allows one
+        index to be created or deleted at a time.
+
+        :param table: The DynamoDB table object.
+        """
+        table.wait_until_exists()
+        while True:
+            statuses = self.secondary_indexes(table)
+            if table.table_status == 'ACTIVE' and all(status == 'ACTIVE' for status in statuses.values()):
+                return
+            time.sleep(INDEX_POLL_INTERVAL)
     
 
     def delete_table(self, table_name):
@@ -152,8 +429,15 @@ class Enrollment:
 
         :param class_data: a class object.
         """
+        item = dict(class_data)
+        # students the class was created with as dropped go in the drop history, not the item
+        item.pop("dropped", None)
+        # enrolled is a number set, and DynamoDB can't store an empty set
+        student_ids = set(item.pop("enrolled", None) or ())
+        if student_ids:
+            item["enrolled"] = student_ids
         try:
-            self.classes.put_item(Item=dict(class_data))
+            self.classes.put_item(Item=item)
         except ClientError as err:
             logger.error(
                 "Couldn't add class %s to table %s. Here's why: %s: %s",
@@ -184,18 +468,19 @@ class Enrollment:
             raise
 
 
-    def get_class_item(self, id):
+    def get_class_item(self, id, attributes=None):
         """
         Gets item data from the table for a specific id.
 
         :param id: The integer id for the item.
+        :param attributes: Optional attribute names to read instead of the whole item.
         :return: The data about the requested item.
         """
         try:
             if DEBUG:
                 print("id: ", id)
                 print("table: ", self.classes)
-            response = self.classes.get_item(Key={"id": id})
+            response = self.classes.get_item(Key={"id": id}, **projection(attributes))
             # Check if the 'Item' key exists in the response
             if "Item" in response:
                 return response["Item"]
@@ -213,18 +498,19 @@ class Enrollment:
             raise
     
 
-    def get_user_item(self, id):
+    def get_user_item(self, id, attributes=None):
         """
         Gets item data from the table for a specific id.
 
         :param id: The integer id for the item.
+        :param attributes: Optional attribute names to read instead of the whole item.
         :return: The data about the requested item.
         """
         try:
             if DEBUG:
                 print("id: ", id)
                 print("table: ", self.users)
-            response = self.users.get_item(Key={"id": id})
+            response = self.users.get_item(Key={"id": id}, **projection(attributes))
             # Check if the 'Item' key exists in the response
             if "Item" in response:
                 return response["Item"]
@@ -240,7 +526,74 @@ class Enrollment:
                 err.response["Error"]["Message"],
             )
             raise
-    
+
+
+    def query_index(self, table, index_name, key_condition, **kwargs):
+        """
+        Gets every item matching a key condition on a secondary index, following LastEvaluatedKey.
+
+        :param table: The DynamoDB table object.
+        :param index_name: The name of the index.
+        :param key_condition: A boto3 Key condition on the index's keys.
+        :param kwargs: Any other Query parameters, such as Limit or FilterExpression.
+        :return: A list of items.
+        """
+        kwargs = dict(kwargs, IndexName=index_name, KeyConditionExpression=key_condition)
+        items = []
+        try:
+            while True:
+                response = table.query(**kwargs)
+                items.extend(response.get("Items", []))
+                if "LastEvaluatedKey" not in response or "Limit" in kwargs:
+                    return items
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except ClientError as err:
+            logger.error(
+                "Couldn't query index %s of table %s. Here's why: %s: %s",
+                index_name,
+                table.name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    def get_instructor_classes(self, instructor_id, attributes=None):
+        """
+        Gets the classes an instructor teaches, from the instructor index.
+
+        :param instructor_id: The integer id of the instructor.
+        :param attributes: Optional attribute names to read instead of the whole items.
+        :return: A list of class items, sorted by id.
+        """
+        return self.query_index(
+            self.classes, INSTRUCTOR_INDEX, Key("instructor_id").eq(instructor_id), **projection(attributes)
+        )
+
+
+    def get_department_classes(self, department, course_code=None):
+        """
+        Gets the classes in a department, or in one of its courses, from the department index.
+
+        :param department: The department, such as "CPSC".
+        :param course_code: An optional course code, such as "449".
+        :return: A list of class items, sorted by course code.
+        """
+        key_condition = Key("department").eq(department)
+        if course_code is not None:
+            key_condition = key_condition & Key("course_code").eq(course_code)
+        return self.query_index(self.classes, DEPARTMENT_INDEX, key_condition)
+
+
+    def get_users_by_name(self, name):
+        """
+        Gets the users with a name, from the name index.
+
+        :param name: The user's full name.
+        :return: A list of user items.
+        """
+        return self.query_index(self.users, NAME_INDEX, Key("name").eq(name))
+
 
     def delete_class_item(self, id):
         """
@@ -278,6 +631,232 @@ class Enrollment:
             raise
     
 
+    def add_roster_entries(self, entries):
+        """
+        Adds students to class rosters in batches.
+
+        :param entries: An iterable of (class_id, student_id, name, status) tuples.
+        """
+        try:
+            with self.roster.batch_writer(overwrite_by_pkeys=["class_id", "entry"]) as batch:
+                for class_id, student_id, name, status in entries:
+                    batch.put_item(Item=roster_item(class_id, student_id, name, status))
+        except ClientError as err:
+            logger.error(
+                "Couldn't add roster entries to table %s. Here's why: %s: %s",
+                self.roster.name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    def get_roster_page(self, class_id, status, limit=50, cursor=None):
+        """
+        Gets one page of a class roster with a single keyed Query.
+
+        :param class_id: The integer id of a class.
+        :param status: ROSTER_ENROLLED.
+        :param limit: The maximum number of students to return.
+        :param cursor: The student id the previous page ended on, if any.
+        :return: A list of {"id", "name"} dictionaries, and the cursor for the
+                 next page or None if this is the last page.
+        """
+        kwargs = {
+            "KeyConditionExpression": Key("class_id").eq(class_id)
+            & Key("entry").begins_with(status + "#"),
+            "Limit": limit,
+        }
+        if cursor is not None:
+            kwargs["ExclusiveStartKey"] = roster_key(class_id, cursor, status)
+        try:
+            response = self.roster.query(**kwargs)
+        except ClientError as err:
+            logger.error(
+                "Couldn't get the roster for class %s. Here's why: %s: %s",
+                class_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        students = [
+            {"id": item["student_id"], "name": item["name"]}
+            for item in response.get("Items", [])
+        ]
+        next_cursor = None
+        if "LastEvaluatedKey" in response:
+            next_cursor = students[-1]["id"] if students else None
+        return students, next_cursor
+
+
+    def add_drop_history(self, entries):
+        """
+        Appends drops to the drop history in batches.
+
+        :param entries: An iterable of (class_id, student_id, name, dropped_at) tuples.
+        """
+        try:
+            with self.drop_history.batch_writer(overwrite_by_pkeys=["class_id", "entry"]) as batch:
+                for class_id, student_id, name, dropped_at in entries:
+                    batch.put_item(Item=history_item(class_id, student_id, name, dropped_at))
+        except ClientError as err:
+            logger.error(
+                "Couldn't add drop history entries to table %s. Here's why: %s: %s",
+                self.drop_history.name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    def get_drop_history_page(self, class_id, limit=50, cursor=None):
+        """
+        Gets one page of a class's drop history, newest first, with a single keyed Query.
+
+        :param class_id: The integer id of a class.
+        :param limit: The maximum number of drops to return.
+        :param cursor: The entry the previous page ended on, if any.
+        :return: A list of {"id", "name", "dropped_at"} dictionaries, and the cursor for
+                 the next page or None if this is the last page.
+        """
+        kwargs = {
+            "KeyConditionExpression": Key("class_id").eq(class_id),
+            "ScanIndexForward": False,
+            "Limit": limit,
+        }
+        if cursor is not None:
+            kwargs["ExclusiveStartKey"] = {"class_id": class_id, "entry": cursor}
+        try:
+            response = self.drop_history.query(**kwargs)
+        except ClientError as err:
+            logger.error(
+                "Couldn't get the drop history for class %s. Here's why: %s: %s",
+                class_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        items = response.get("Items", [])
+        drops = [
+            {"id": item["student_id"], "name": item["name"], "dropped_at": item["dropped_at"]}
+            for item in items
+        ]
+        next_cursor = None
+        if "LastEvaluatedKey" in response:
+            next_cursor = items[-1]["entry"] if items else None
+        return drops, next_cursor
+
+
+    def delete_class_entries(self, table, class_id):
+        """
+        Deletes every item in a table keyed by class_id and entry for a class.
+
+        :param table: The roster or drop history table.
+        :param class_id: The integer id of a class.
+        """
+        try:
+            kwargs = {
+                "KeyConditionExpression": Key("class_id").eq(class_id),
+                "ProjectionExpression": "class_id, #entry",
+                "ExpressionAttributeNames": {"#entry": "entry"},
+            }
+            with table.batch_writer() as batch:
+                while True:
+                    response = table.query(**kwargs)
+                    for item in response.get("Items", []):
+                        batch.delete_item(Key=item)
+                    if "LastEvaluatedKey" not in response:
+                        break
+                    kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except ClientError as err:
+            logger.error(
+                "Couldn't delete the entries for class %s from table %s. Here's why: %s: %s",
+                class_id,
+                table.name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    def delete_roster(self, class_id):
+        """
+        Deletes every roster entry for a class.
+
+        :param class_id: The integer id of a class.
+        """
+        self.delete_class_entries(self.roster, class_id)
+
+
+    def delete_drop_history(self, class_id):
+        """
+        Deletes a class's drop history, when the class itself is removed.
+
+        :param class_id: The integer id of a class.
+        """
+        self.delete_class_entries(self.drop_history, class_id)
+
+
+    def parallel_scan(self, table, total_segments=SCAN_SEGMENTS, **scan_kwargs):
+        """
+        Scans a whole table, following LastEvaluatedKey, with its segments scanned
+        concurrently on a thread pool. Items are yielded as their pages arrive, in no
+        particular order. At most a few pages per segment are held at once, so memory
+        use doesn't grow with the table. Closing the generator early stops the scan.
+
+        :param table: A Boto3 DynamoDB Table.
+        :param total_segments: The number of segments to split the table into.
+        :param scan_kwargs: Any other Scan parameters, such as IndexName or FilterExpression.
+        :return: A generator of items.
+        """
+        pages = queue.Queue(maxsize=total_segments * SCAN_PAGES_BUFFERED)
+        stop = threading.Event()
+        done = object()
+
+        def put(page):
+            # Give up waiting for room once the reader has gone away
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_segment(segment):
+            kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+            try:
+                while not stop.is_set():
+                    response = table.scan(**kwargs)
+                    if not put(response.get("Items", [])) or "LastEvaluatedKey" not in response:
+                        break
+                    kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            except Exception as err:
+                logger.error(
+                    "Couldn't scan segment %s of table %s. Here's why: %r", segment, table.name, err
+                )
+                put(err)
+            finally:
+                put(done)
+
+        executor = ThreadPoolExecutor(max_workers=total_segments, thread_name_prefix="scan")
+        try:
+            for segment in range(total_segments):
+                executor.submit(scan_segment, segment)
+            remaining = total_segments
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            stop.set()
+            executor.shutdown(wait=False)
+
+
     def check_table_exists(self, table_name):
         """
         Check if a table exist in the database.
@@ -0,0 +1,369 @@
+import asyncio
+import contextlib
+import logging
+import random
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from enrollment.enrollment_dynamo import history_item, projection, roster_item, roster_key, INSTRUCTOR_INDEX
+
+
+# Configure the logger
+logger = logging.getLogger(__name__)
+
+table_prefix = "enrollment_"
+DEBUG = False
+BATCH_WRITE_LIMIT = 25
+# Unprocessed batch writes are retried with capped exponential backoff and full jitter,
+# and the write fails once a batch still has unprocessed items after the last attempt
+BATCH_WRITE_MAX_ATTEMPTS = 8
+BATCH_WRITE_BASE_DELAY = 0.05
+BATCH_WRITE_MAX_DELAY = 2.0
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+def serialize(data):
+    """
+    Converts a plain Python dictionary into the DynamoDB attribute value format.
+
+    :param data: A dictionary of attribute names to Python values.
+    :return: The same dictionary with every value in DynamoDB format.
+    """
+    return {key: serializer.serialize(value) for key, value in data.items()}
+
+
+def deserialize(data):
+    """
+    Converts a DynamoDB formatted item back into a plain Python dictionary.
+
+    :param data: A dictionary of attribute names to DynamoDB attribute values.
+    :return: The same dictionary with every value as a Python object.
+    """
+    return {key: deserializer.deserialize(value) for key, value in data.items()}
+
+
+class AsyncDynamoDB:
+    """
+    Holds a single long-lived aiobotocore DynamoDB client shared by
+    AsyncEnrollment and AsyncPartiQL. The client is opened lazily on first use,
+    so the event loop that serves requests is the one that owns it.
+    """
+
+    def __init__(self, endpoint_url, config_kwargs=None):
+        """
+        :param endpoint_url: The URL of the DynamoDB endpoint.
+        :param config_kwargs: Optional botocore Config keyword arguments, such as
+                              max_pool_connections, timeouts and retries.
+        """
+        self.endpoint_url = endpoint_url
+        self.config = AioConfig(**config_kwargs) if config_kwargs else None
+        self.session = get_session()
+        self._client = None
+        self._exit_stack = None
+        self._lock = asyncio.Lock()
+
+
+    async def client(self):
+        """
+        Returns the shared aiobotocore client, creating it if needed.
+
+        :return: An aiobotocore DynamoDB client.
+        """
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    self._exit_stack = contextlib.AsyncExitStack()
+                    self._client = await self._exit_stack.enter_async_context(
+                        self.session.create_client(
+                            "dynamodb",
+                            endpoint_url=self.endpoint_url,
+                            config=self.config,
+                        )
+                    )
+        return self._client
+
+
+    async def close(self):
+        """
+        Closes the shared client and its connection pool.
+        """
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._client = None
+        self._exit_stack = None
+
+
+class AsyncEnrollment:
+    """
+    Async counterpart of Enrollment. Encapsulates the enrollment tables behind
+    an aiobotocore client so routes can await DynamoDB calls instead of
+    blocking a threadpool worker.
+    """
+
+    def __init__(self, dyn_client):
+        """
+        :param dyn_client: An AsyncDynamoDB instance.
+        """
+        self.dyn_client = dyn_client
+        self.classes = table_prefix + "class"
+        self.users = table_prefix + "user"
+        self.roster = table_prefix + "roster"
+        self.drop_history = table_prefix + "drop_history"
+
+
+    async def get_item(self, table_name, id, attributes=None):
+        """
+        Gets item data from a table for a specific id.
+
+        :param table_name: The name of the table.
+        :param id: The integer id for the item.
+        :param attributes: Optional attribute names to read instead of the whole item.
+        :return: The data about the requested item, or None if it doesn't exist.
+        """
+        client = await self.dyn_client.client()
+        try:
+            if DEBUG:
+                print("id: ", id)
+                print("table: ", table_name)
+            response = await client.get_item(
+                TableName=table_name, Key=serialize({"id": id}), **projection(attributes)
+            )
+            # If 'Item' key doesn't exist, the item doesn't exist in the table
+            if "Item" in response:
+                return deserialize(response["Item"])
+            return None
+        except ClientError as err:
+            logger.error(
+                "Couldn't get item %s from table %s. Here's why: %s: %s",
+                id,
+                table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    async def get_class_item(self, id, attributes=None):
+        """
+        Gets class data from the class table for a specific id.
+
+        :param id: The integer id for the class.
+        :param attributes: Optional attribute names to read instead of the whole item.
+        :return: The data about the requested class.
+        """
+        return await self.get_item(self.classes, id, attributes)
+
+
+    async def get_user_item(self, id, attributes=None):
+        """
+        Gets user data from the user table for a specific id.
+
+        :param id: The integer id for the user.
+        :param attributes: Optional attribute names to read instead of the whole item.
+        :return: The data about the requested user.
+        """
+        return await self.get_item(self.users, id, attributes)
+
+
+    async def query_index(self, table_name, index_name, key_condition, values, **kwargs):
+        """
+        Gets every item matching a key condition on a secondary index, following LastEvaluatedKey.
+
+        :param table_name: The name of the table.
+        :param index_name: The name of the index.
+        :param key_condition: A key condition expression on the index's keys.
+        :param values: A dictionary of expression attribute values.
+        :param kwargs: Any other Query parameters, such as Limit.
+        :return: A list of items.
+        """
+        client = await self.dyn_client.client()
+        kwargs = dict(
+            kwargs,
+            TableName=table_name,
+            IndexName=index_name,
+            KeyConditionExpression=key_condition,
+            ExpressionAttributeValues=serialize(values),
+        )
+        items = []
+        try:
+            while True:
+                response = await client.query(**kwargs)
+                items.extend(deserialize(item) for item in response.get("Items", []))
+                if "LastEvaluatedKey" not in response or "Limit" in kwargs:
+                    return items
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except ClientError as err:
+            logger.error(
+                "Couldn't query index %s of table %s. Here's why: %s: %s",
+                index_name,
+                table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    async def get_instructor_classes(self, instructor_id, attributes=None):
+        """
+        Gets the classes an instructor teaches, from the instructor index.
+
+        :param instructor_id: The integer id of the instructor.
+        :param attributes: Optional attribute names to read instead of the whole items.
+        :return: A list of class items, sorted by id.
+        """
+        return await self.query_index(
+            self.classes, INSTRUCTOR_INDEX, "instructor_id = :instructor_id", {":instructor_id": instructor_id},
+            **projection(attributes)
+        )
+
+
+    async def update_class_item(self, id, update_expression, values, condition=None):
+        """
+        Updates a class item with the given update expression.
+
+        :param id: The integer id for the class.
+        :param update_expression: A DynamoDB update expression.
+        :param values: A dictionary of expression attribute values.
+        :param condition: An optional condition expression the item must meet.
+        :return: False if the condition wasn't met and nothing was updated, True otherwise.
+        """
+        client = await self.dyn_client.client()
+        kwargs = {"ConditionExpression": condition} if condition else {}
+        try:
+            await client.update_item(
+                TableName=self.classes,
+                Key=serialize({"id": id}),
+                UpdateExpression=update_expression,
+                ExpressionAttributeValues=serialize(values),
+                **kwargs,
+            )
+            return True
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            logger.error(
+                "Couldn't update class %s. Here's why: %s: %s",
+                id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+    async def write_roster(self, class_id, puts=(), deletes=(), drops=()):
+        """
+        Adds and removes roster entries for a class, and appends to its drop history,
+        with BatchWriteItem in as few calls as the 25 item limit allows. Writes DynamoDB
+        leaves unprocessed are retried, and RuntimeError is raised if some are still left
+        after BATCH_WRITE_MAX_ATTEMPTS.
+
+        :param class_id: The integer id of a class.
+        :param puts: An iterable of (student_id, name, status) tuples to add.
+        :param deletes: An iterable of (student_id, status) tuples to remove.
+        :param drops: An iterable of (student_id, name, dropped_at) tuples to add to the drop history.
+        """
+        requests = [
+            (self.roster, {"PutRequest": {"Item": serialize(roster_item(class_id, student_id, name, status))}})
+            for student_id, name, status in puts
+        ] + [
+            (self.roster, {"DeleteRequest": {"Key": serialize(roster_key(class_id, student_id, status))}})
+            for student_id, status in deletes
+        ] + [
+            (self.drop_history, {"PutRequest": {"Item": serialize(history_item(class_id, student_id, name, dropped_at))}})
+            for student_id, name, dropped_at in drops
+        ]
+        if not requests:
+            return
+        client = await self.dyn_client.client()
+        try:
+            for start in range(0, len(requests), BATCH_WRITE_LIMIT):
+                request_items = {}
+                for table_name, request in requests[start:start + BATCH_WRITE_LIMIT]:
+                    request_items.setdefault(table_name, []).append(request)
+                response = await client.batch_write_item(RequestItems=request_items)
+                # Retry anything DynamoDB didn't get to, such as throttled writes
+                attempts = 1
+                while response.get("UnprocessedItems"):
+                    if attempts >= BATCH_WRITE_MAX_ATTEMPTS:
+                        raise RuntimeError(
+                            f"Roster writes for class {class_id} still unprocessed after {attempts} attempts"
+                        )
+                    delay = min(BATCH_WRITE_MAX_DELAY, BATCH_WRITE_BASE_DELAY * 2 ** attempts)
+                    await asyncio.sleep(random.uniform(0, delay))
+                    attempts += 1
+                    response = await client.batch_write_item(
+                        RequestItems=response["UnprocessedItems"]
+                    )
+        except ClientError as err:
+            logger.error(
+                "Couldn't update the roster for class %s. Here's why: %s: %s",
+                class_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+
+class AsyncPartiQL:
+    """
+    Async counterpart of PartiQL. Runs PartiQL statements through an
+    aiobotocore client and converts results back into plain Python objects.
+    """
+
+    def __init__(self, dyn_client):
+        """
+        :param dyn_client: An AsyncDynamoDB instance.
+        """
+        self.dyn_client = dyn_client
+
+
+    async def run_partiql(self, statement, params):
+        """
+        Runs a PartiQL statement.
+
+        :param statement: The PartiQL statement.
+        :param params: The list of PartiQL parameters. These are applied to the
+                       statement in the order they are listed.
+        :return: The items returned from the statement, if any.
+        """
+        return await self._execute(
+            Statement=statement,
+            Parameters=[serializer.serialize(param) for param in params],
+        )
+
+
+    async def run_partiql_statement(self, statement):
+        """
+        Runs a PartiQL statement without parameters.
+
+        :param statement: The PartiQL statement.
+        :return: The items returned from the statement, if any.
+        """
+        return await self._execute(Statement=statement)
+
+
+    async def _execute(self, **kwargs):
+        client = await self.dyn_client.client()
+        try:
+            output = await client.execute_statement(**kwargs)
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ResourceNotFoundException":
+                logger.error(
+                    "Couldn't execute PartiQL '%s' because the table does not exist.",
+                    kwargs["Statement"],
+                )
+            else:
+                logger.error(
+                    "Couldn't execute PartiQL '%s'. Here's why: %s: %s",
+                    kwargs["Statement"],
+                    err.response["Error"]["Code"],
+                    err.response["Error"]["Message"],
+                )
+            raise
+        else:
+            output["Items"] = [deserialize(item) for item in output.get("Items", [])]
+            return output
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from redis import asyncio as aioredis
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic_settings import BaseSettings
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+idempotency_key = "idempotency:{}:{}"
+PENDING = "pending"
+DONE = "done"
+
+# Client errors that say to try again later rather than that the request is wrong, such as
+# admission control's 429 or a conflicting request still in progress. They aren't stored
+TRANSIENT_STATUSES = {
+    status.HTTP_408_REQUEST_TIMEOUT,
+    status.HTTP_409_CONFLICT,
+    status.HTTP_425_TOO_EARLY,
+    status.HTTP_429_TOO_MANY_REQUESTS,
+}
+
+
+class IdempotencySettings(BaseSettings, env_file=".env", extra="ignore"):
+    # How long a stored response is replayed for
+    idempotency_ttl: int = 86400
+    # How long an execution may hold a key before a duplicate may run it again
+    idempotency_lock_ttl: int = 30
+    # How long a duplicate waits for the first execution, under KrakenD's 3000 ms timeout
+    idempotency_wait: float = 2.5
+
+
+settings = IdempotencySettings()
+# the asyncio client, so waiting on redis doesn't block the event loop
+r = aioredis.Redis(db=1)
+
+# Executions running in this worker, so duplicates here wait on them instead of polling redis
+in_flight = {}
+
+
+def request_fingerprint(request, body):
+    """
+    Identifies what a request does, so a key reused for a different request is refused.
+
+    :param request: The incoming Request.
+    :param body: The raw request body.
+    :return: A hex digest of the method, path, query and body.
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(str(request.url.path).encode())
+    digest.update(str(request.url.query).encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def is_stored(status_code):
+    """
+    :param status_code: The status of a route's response.
+    :return: Boolean based on if the response is final, a success or a client error
+    that would be the same on a retry, and so replayed for later requests with the key.
+    """
+    if 200 <= status_code < 300:
+        return True
+    return 400 <= status_code < 500 and status_code not in TRANSIENT_STATUSES
+
+
+def replay(record):
+    response = Response(
+        content=record["body"].encode("utf-8"),
+        status_code=record["status"],
+        media_type=record["media_type"],
+    )
+    response.headers[REPLAYED_HEADER] = "true"
+    return response
+
+
+async def execute(handler, request, key, fingerprint):
+    """
+    Runs the route once for a claimed key and stores its response. Server errors,
+    including 503s, and transient client errors such as 429 aren't stored, and the
+    key is released, so a retry with the same key runs the route again.
+    """
+    future = asyncio.get_running_loop().create_future()
+    in_flight[key] = future
+    try:
+        try:
+            response = await handler(request)
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+        if not is_stored(response.status_code) or not hasattr(response, "body"):
+            await r.delete(key)
+        else:
+            record = {
+                "state": DONE,
+                "fingerprint": fingerprint,
+                "status": response.status_code,
+                "body": response.body.decode("utf-8"),
+                "media_type": response.media_type,
+            }
+            await r.set(key, json.dumps(record), ex=settings.idempotency_ttl)
+        return response
+    except BaseException:
+        await r.delete(key)
+        raise
+    finally:
+        del in_flight[key]
+        future.set_result(None)
+
+
+async def run_idempotent(handler, request, idempotency_value):
+    """
+    Runs a mutating request at most once per Idempotency-Key and caller. Later requests
+    with the same key get the stored response, and ones that arrive while the first is
+    still running wait for it, whichever worker they land on.
+    """
+    body = await request.body()
+    fingerprint = request_fingerprint(request, body)
+    key = idempotency_key.format(request.headers.get("X-User", "anonymous"), idempotency_value)
+    pending = json.dumps({"state": PENDING, "fingerprint": fingerprint})
+
+    deadline = time.monotonic() + settings.idempotency_wait
+    while True:
+        if await r.set(key, pending, nx=True, ex=settings.idempotency_lock_ttl):
+            return await execute(handler, request, key, fingerprint)
+
+        stored = await r.get(key)
+        if stored is not None:
+            record = json.loads(stored)
+            if record["fingerprint"] != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"{IDEMPOTENCY_HEADER} was already used for a different request",
+                )
+            if record["state"] == DONE:
+                return replay(record)
+
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        # Wait for the first execution, without polling if it's running in this worker
+        local = in_flight.get(key)
+        if local is not None:
+            await asyncio.shield(local)
+        else:
+            await asyncio.sleep(0.02)
+
+
+class IdempotentRoute(APIRoute):
+    """
+    Route class that honours the Idempotency-Key header on mutating routes.
+    Requests without the header run as usual.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            idempotency_value = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_value or request.method not in MUTATING_METHODS:
+                return await handler(request)
+            return await run_idempotent(handler, request, idempotency_value)
+
+        return idempotent_handler
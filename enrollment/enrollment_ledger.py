@@ -0,0 +1,161 @@
+"""
+Seat ledger flusher: writes the redis seat ledger behind to DynamoDB.
+
+With SEAT_LEDGER enabled, the enroll and drop routes and the promotion worker
+change seat counts and the enrolled sets in redis through the SeatLedger
+scripts, instead of updating the class item. Every few hundred milliseconds
+this process takes the classes that changed, writes each one's current count
+and enrolled set to enrollment_class in a single update, applies its op log to
+the roster table and appends its drops to the drop history, and only then
+trims the log. A class that fails to
+write is marked dirty again and retried on the next pass.
+
+DynamoDB stays the source of truth. On startup the flusher first writes back
+anything left in redis, then reloads every class from DynamoDB, and removes
+classes from the ledger that no longer exist there.
+
+Run from the main directory:
+
+    python -m enrollment.enrollment_ledger
+"""
+import asyncio
+import os
+
+from enrollment.enrollment_clients import settings as client_settings, client_config_kwargs, get_table
+from enrollment.enrollment_dynamo import ROSTER_ENROLLED
+from enrollment.enrollment_dynamo_async import AsyncDynamoDB, AsyncEnrollment
+from enrollment.enrollment_redis import SeatLedger
+from enrollment.enrollment_schemas import Settings
+
+CLASS_TABLE = "enrollment_class"
+FLUSH_INTERVAL = float(os.environ.get("SEAT_LEDGER_FLUSH_INTERVAL", "0.25"))
+FLUSH_BATCH = int(os.environ.get("SEAT_LEDGER_FLUSH_BATCH", "50"))
+
+settings = Settings()
+ledger = SeatLedger()
+
+
+async def flush_class(async_enrollment, class_id):
+    """
+    Writes one class's ledger state, pending roster changes and drops to DynamoDB.
+
+    :param async_enrollment: An AsyncEnrollment.
+    :param class_id: The integer id of a class.
+    """
+    current, enrolled, ops = ledger.snapshot(class_id)
+    if current is None:
+        # removed from the ledger since it changed
+        ledger.ack_ops(class_id, len(ops))
+        return
+
+    # enrolled is a number set, and DynamoDB can't store an empty set
+    values = {":current_enroll": current}
+    if enrolled:
+        update_expression = "SET current_enroll = :current_enroll, enrolled = :enrolled"
+        values[":enrolled"] = enrolled
+    else:
+        update_expression = "SET current_enroll = :current_enroll REMOVE enrolled"
+
+    updated = await async_enrollment.update_class_item(
+        class_id, update_expression, values, condition="attribute_exists(id)"
+    )
+    if not updated:
+        # the class was removed from DynamoDB
+        ledger.delete_class(class_id)
+        return
+
+    # Only the latest op per student matters to the roster, and a batch can't write the
+    # same key twice. Every drop goes in the history, keyed by its time so a retried
+    # flush writes the same items again
+    latest = {}
+    drops = []
+    for kind, student_id, name, dropped_at in ops:
+        latest[student_id] = (kind, name)
+        if kind == "D":
+            drops.append((student_id, name, dropped_at))
+    puts, deletes = [], []
+    for student_id, (kind, name) in latest.items():
+        if kind == "E":
+            puts.append((student_id, name, ROSTER_ENROLLED))
+        else:
+            deletes.append((student_id, ROSTER_ENROLLED))
+    await async_enrollment.write_roster(class_id, puts=puts, deletes=deletes, drops=drops)
+
+    ledger.ack_ops(class_id, len(ops))
+
+
+async def flush(async_enrollment):
+    """
+    Writes back a batch of changed classes.
+
+    :param async_enrollment: An AsyncEnrollment.
+    :return: The number of classes taken.
+    """
+    class_ids = ledger.take_dirty(FLUSH_BATCH)
+    if not class_ids:
+        return 0
+    results = await asyncio.gather(
+        *(flush_class(async_enrollment, class_id) for class_id in class_ids),
+        return_exceptions=True,
+    )
+    failed = []
+    for class_id, result in zip(class_ids, results):
+        if isinstance(result, Exception):
+            print(f" [!] Error writing class {class_id} back, retrying: {result!r}")
+            failed.append(class_id)
+    ledger.mark_dirty(failed)
+    return len(class_ids)
+
+
+async def reconcile(async_enrollment):
+    """
+    Writes back everything left in redis, then reloads the ledger from DynamoDB.
+
+    :param async_enrollment: An AsyncEnrollment.
+    """
+    ledger.mark_dirty(ledger.pending_classes())
+    while await flush(async_enrollment):
+        pass
+
+    table = get_table(CLASS_TABLE)
+    scan_kwargs = {"ProjectionExpression": "id, current_enroll, max_enroll, enrolled"}
+    class_ids = set()
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            class_ids.add(int(item["id"]))
+            ledger.load_class(item, overwrite=True)
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    for class_id in set(ledger.loaded_classes()) - class_ids:
+        ledger.delete_class(class_id)
+    print(f" [*] Reconciled {len(class_ids)} classes with DynamoDB")
+
+
+async def main():
+    async_dynamodb = AsyncDynamoDB(
+        endpoint_url=client_settings.dynamodb_endpoint_url,
+        config_kwargs=client_config_kwargs(),
+    )
+    async_enrollment = AsyncEnrollment(async_dynamodb)
+    try:
+        # With the ledger off there is nothing to load, but anything left from when it
+        # was on is still written back
+        if settings.seat_ledger:
+            await reconcile(async_enrollment)
+        print(' [*] Writing the seat ledger back to DynamoDB. To exit press CTRL+C')
+        while True:
+            # keep going without sleeping while there is a backlog
+            if await flush(async_enrollment) < FLUSH_BATCH:
+                await asyncio.sleep(FLUSH_INTERVAL)
+    finally:
+        await async_dynamodb.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,92 @@
+import json
+
+import pika
+
+
+# Direct exchange that routes each notification by delivery channel, so email
+# consumers only get emails and webhook consumers only get webhooks
+NOTIFICATION_EXCHANGE = "enrollment_channels"
+EMAIL_ROUTING_KEY = "email"
+WEBHOOK_ROUTING_KEY = "webhook"
+
+# Durable work queues shared by all replicas of each consumer type, by routing key
+WORK_QUEUES = {
+    EMAIL_ROUTING_KEY: "email_notifications",
+    WEBHOOK_ROUTING_KEY: "webhook_notifications",
+}
+
+# Redis Streams the consumers read instead when NOTIFICATION_TRANSPORT is "redis",
+# by routing key. Each consumer type reads its stream as the group named after its work queue
+NOTIFICATION_STREAMS = {
+    EMAIL_ROUTING_KEY: "notifications:email",
+    WEBHOOK_ROUTING_KEY: "notifications:webhook",
+}
+
+
+def channel_messages(notification):
+    """
+    Splits a notification into one message per delivery channel it has an address for.
+
+    :param notification: A dictionary with class_name, section, message, and the
+    subscriber's email and webhook_url, either of which may be empty.
+    :return: A list of (routing_key, message) tuples.
+    """
+    base = {
+        "class_name": notification["class_name"],
+        "section": notification["section"],
+        "message": notification["message"],
+    }
+    messages = []
+    if notification.get("email"):
+        messages.append((EMAIL_ROUTING_KEY, {**base, "email": notification["email"]}))
+    if notification.get("webhook_url"):
+        messages.append(
+            (WEBHOOK_ROUTING_KEY, {**base, "webhook_url": notification["webhook_url"]})
+        )
+    return messages
+
+
+def declare_topology(channel):
+    """
+    Declares the channels exchange and the work queues bound to it. The queues
+    are declared here too, so messages published before any consumer has started
+    are kept instead of dropped by the exchange.
+
+    :param channel: An open pika channel.
+    """
+    channel.exchange_declare(exchange=NOTIFICATION_EXCHANGE, exchange_type='direct', durable=True)
+    for routing_key, queue in WORK_QUEUES.items():
+        channel.queue_declare(queue=queue, durable=True)
+        channel.queue_bind(exchange=NOTIFICATION_EXCHANGE, queue=queue, routing_key=routing_key)
+
+
+def publish_notification(channel, notification):
+    """
+    Publishes a notification to the channels exchange, one persistent message per channel.
+    On a channel in confirm mode each publish blocks until the broker has accepted it,
+    and raises if it was nacked or returned.
+
+    :param channel: An open pika channel, with the topology declared.
+    :param notification: A dictionary as described in channel_messages.
+    """
+    for routing_key, message in channel_messages(notification):
+        body = json.dumps(message)
+        channel.basic_publish(
+            exchange=NOTIFICATION_EXCHANGE,
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent),
+            mandatory=True,
+        )
+        print(f" [x] Sent {routing_key} {body}")
+
+
+def stream_notification(pipe, notification):
+    """
+    Queues one XADD per delivery channel on a redis pipeline, for the Redis Streams transport.
+
+    :param pipe: A redis pipeline, executed by the caller.
+    :param notification: A dictionary as described in channel_messages.
+    """
+    for routing_key, message in channel_messages(notification):
+        pipe.xadd(NOTIFICATION_STREAMS[routing_key], {"body": json.dumps(message)})
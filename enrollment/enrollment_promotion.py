@@ -0,0 +1,172 @@
+"""
+Promotion worker: fills seats released by drops from the class waitlists.
+
+The drop routes only release the seat and queue a seat release for the class.
+This worker takes classes off the wakeup queue and, holding the class's lock so
+promotions for one class never run concurrently, promotes as many students from
+the front of the waitlist as there are queued releases, with one DynamoDB update
+and one roster write per batch. The students chosen are kept in a batch list in
+redis until they are enrolled, so a retry promotes the same students. Their
+notifications are written to the outbox, and the releases acknowledged, only
+after the batch is written, and releases left over from a crash are requeued on startup.
+
+Run from the main directory:
+
+    python -m enrollment.enrollment_promotion
+"""
+import asyncio
+import os
+
+from enrollment.enrollment_clients import settings as client_settings, client_config_kwargs
+from enrollment.enrollment_dynamo import ROSTER_ENROLLED, CLASS_NAME, CLASS_SEATS, USER_NAME
+from enrollment.enrollment_dynamo_async import AsyncDynamoDB, AsyncEnrollment
+from enrollment.enrollment_redis import Waitlist, SeatLedger, SeatReleases, Subscription, UserNames, promotion_batch_key, LEDGER_NOT_LOADED
+from enrollment.enrollment_schemas import Settings
+
+WAKEUP_TIMEOUT = int(os.environ.get("PROMOTION_WAKEUP_TIMEOUT", "5"))
+RETRY_DELAY = 1
+
+settings = Settings()
+wl = Waitlist
+ledger = SeatLedger()
+releases = SeatReleases
+sub = Subscription()
+user_names = UserNames()
+
+
+def promotion_notification(class_id, class_data, student_id):
+    """
+    Builds the notification for a student promoted off a class's waitlist.
+
+    :param class_id: The integer id of the class.
+    :param class_data: The class item.
+    :param student_id: The integer id of the promoted student.
+    :return: A notification dictionary, or None if the student isn't subscribed to the class.
+    """
+    subscription = sub.get_subscription(student_id, class_id)
+    if not subscription:
+        print("Student is not subscribed to this class")
+        return None
+    return {
+        "class_name": class_data["name"],
+        "section": str(class_data["section_number"]),
+        "message": "You have been enrolled in " + class_data["name"] + ", section " + str(class_data["section_number"]) + ", by the registrar",
+        "webhook_url": subscription["webhook_url"],
+        "email": subscription["email"],
+    }
+
+
+async def get_student_names(async_enrollment, student_ids):
+    """
+    Looks up student names in the redis name cache, reading and caching any misses from DynamoDB.
+
+    :param async_enrollment: An AsyncEnrollment.
+    :param student_ids: A list of integer student ids.
+    :return: A list of names, in the same order.
+    """
+    names = user_names.get_names(student_ids)
+    missing = [student_id for student_id, name in zip(student_ids, names) if name is None]
+    if missing:
+        users = await asyncio.gather(*(async_enrollment.get_user_item(student_id, USER_NAME) for student_id in missing))
+        found = {int(user["id"]): user["name"] for user in users if user}
+        user_names.set_names(found)
+        names = [found.get(student_id, "") if name is None else name for student_id, name in zip(student_ids, names)]
+    return names
+
+
+async def promote_class(async_enrollment, class_id):
+    """
+    Promotes one student off a class's waitlist for every seat release queued for it.
+
+    :param async_enrollment: An AsyncEnrollment.
+    :param class_id: The integer id of the class.
+    """
+    released = releases.get_releases(class_id)
+    if not released:
+        return
+
+    # the notifications only need the class's name
+    class_data = await async_enrollment.get_class_item(class_id, CLASS_NAME)
+    if not class_data:
+        releases.finish_batch(class_id, len(released), [])
+        return
+
+    # Students taken off the waitlist by a pass that failed before finishing are
+    # promoted first. Each student is taken off the waitlist and added to the batch
+    # in one redis transaction, so a retry never picks different students for the
+    # same seats, and students who left the waitlist meanwhile are skipped
+    promoted = releases.get_batch(class_id)
+    if len(promoted) < len(released):
+        waitlist = wl.get_class_waitlist(class_id)
+        for student_id in sorted(waitlist, key=waitlist.get):
+            if len(promoted) >= len(released):
+                break
+            student_id = int(student_id)
+            if student_id not in promoted and wl.remove_student_from_waitlists(
+                student_id, class_id, promotion_batch_key.format(class_id)
+            ):
+                promoted.append(student_id)
+
+    if promoted:
+        # Enroll the batch before anyone is told. Both writes are idempotent, so a
+        # retry after a failure here writes the same batch again
+        names = await get_student_names(async_enrollment, promoted)
+        if settings.seat_ledger:
+            # the seat ledger flusher writes the promotions behind to DynamoDB
+            students = list(zip(promoted, names))
+            if ledger.promote(class_id, students) == LEDGER_NOT_LOADED:
+                # the class's seats are only read when the ledger doesn't have it yet
+                seats = await async_enrollment.get_class_item(class_id, CLASS_SEATS)
+                if seats:
+                    ledger.load_class(seats)
+                if ledger.promote(class_id, students) == LEDGER_NOT_LOADED:
+                    raise RuntimeError(f"Class {class_id} could not be loaded into the seat ledger")
+        else:
+            await asyncio.gather(
+                async_enrollment.update_class_item(
+                    class_id, "ADD enrolled :promoted", {":promoted": set(promoted)}
+                ),
+                async_enrollment.write_roster(
+                    class_id, puts=[(student_id, name, ROSTER_ENROLLED) for student_id, name in zip(promoted, names)]
+                ),
+            )
+
+    # record the notifications in the outbox, the relay publishes them from there,
+    # in the same redis transaction that clears the batch and acknowledges the releases
+    events = [promotion_notification(class_id, class_data, student_id) for student_id in promoted]
+    releases.finish_batch(class_id, len(released), [event for event in events if event is not None])
+    if promoted:
+        print(f" [x] Promoted {promoted} in class {class_id} for {len(released)} released seat(s)")
+
+
+async def main():
+    async_dynamodb = AsyncDynamoDB(
+        endpoint_url=client_settings.dynamodb_endpoint_url,
+        config_kwargs=client_config_kwargs(),
+    )
+    async_enrollment = AsyncEnrollment(async_dynamodb)
+
+    print(f" [*] Requeued {releases.requeue_pending()} classes with pending seat releases")
+    print(' [*] Promotion worker is waiting for seat releases. To exit press CTRL+C')
+    try:
+        while True:
+            class_id = releases.next_class(WAKEUP_TIMEOUT)
+            if class_id is None:
+                continue
+            try:
+                with releases.lock_class(class_id):
+                    await promote_class(async_enrollment, class_id)
+            except Exception as e:
+                # The releases stay queued, try the class again shortly
+                print(f" [!] Error promoting class {class_id}, retrying: {e!r}")
+                await asyncio.sleep(RETRY_DELAY)
+                releases.wake(class_id)
+    finally:
+        await async_dynamodb.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
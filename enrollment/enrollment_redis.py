@@ -10,6 +10,92 @@ student_waitlists_key = "student:{}:waitlists"
 class_waitlist_key_pattern = "class:*:waitlist"
 student_waitlists_key_pattern = "student:*:waitlists"
 
+# Stream of notifications waiting to be relayed to RabbitMQ
+outbox_stream_key = "outbox:notifications"
+
+# Seat release queues, one per class, and the queue of classes with releases for the promotion worker
+seat_releases_key = "class:{}:seat_releases"
+seat_releases_key_pattern = "class:*:seat_releases"
+promotion_lock_key = "class:{}:promotion_lock"
+# Students the promotion worker has taken off a class's waitlist but not yet finished promoting
+promotion_batch_key = "class:{}:promotion_batch"
+promotion_wakeup_key = "promotions:wakeup"
+
+# Seat ledger keys, for classes whose seats are counted in redis and written behind to DynamoDB
+class_seats_key = "class:{}:seats"
+class_seats_key_pattern = "class:*:seats"
+class_enrolled_key = "class:{}:enrolled"
+class_ledger_ops_key = "class:{}:ledger_ops"
+class_ledger_ops_key_pattern = "class:*:ledger_ops"
+ledger_dirty_key = "ledger:dirty"
+
+# Seat ledger script results
+LEDGER_NOT_LOADED = -1
+LEDGER_REJECTED = 0
+LEDGER_APPLIED = 1
+LEDGER_FULL = 2
+
+# Every ledger script gets KEYS = seats, enrolled, ops, dirty and ARGV[1] = class id.
+# Ops are "kind|student id|name", and drops "D|student id|dropped at|name"
+# Enrolls a student if there is a seat, ARGV = class id, student id, name
+LEDGER_ENROLL_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if redis.call('SISMEMBER', KEYS[2], ARGV[2]) == 1 then return 0 end
+local current = tonumber(redis.call('HGET', KEYS[1], 'current_enroll'))
+local max = tonumber(redis.call('HGET', KEYS[1], 'max_enroll'))
+if current + 1 >= max then return 2 end
+redis.call('HINCRBY', KEYS[1], 'current_enroll', 1)
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('RPUSH', KEYS[3], 'E|' .. ARGV[2] .. '|' .. ARGV[3])
+redis.call('SADD', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Drops an enrolled student, ARGV = class id, student id, name, dropped at in milliseconds
+LEDGER_DROP_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if redis.call('SISMEMBER', KEYS[2], ARGV[2]) == 0 then return 0 end
+redis.call('SREM', KEYS[2], ARGV[2])
+redis.call('RPUSH', KEYS[3], 'D|' .. ARGV[2] .. '|' .. ARGV[4] .. '|' .. ARGV[3])
+redis.call('SADD', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Enrolls students promoted into released seats, ARGV = class id, then student id, name pairs
+LEDGER_PROMOTE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+for i = 2, #ARGV, 2 do
+    redis.call('SADD', KEYS[2], ARGV[i])
+    redis.call('RPUSH', KEYS[3], 'E|' .. ARGV[i] .. '|' .. ARGV[i + 1])
+end
+redis.call('SADD', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Loads a class from its DynamoDB item, unless redis has changes that aren't written back yet.
+# ARGV = class id, overwrite (1 or 0), current_enroll, max_enroll, enrolled ids
+LEDGER_LOAD_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[4], ARGV[1]) == 1 or redis.call('LLEN', KEYS[3]) > 0 then return 0 end
+if ARGV[2] == '0' and redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[1], 'current_enroll', ARGV[3], 'max_enroll', ARGV[4])
+for i = 5, #ARGV do redis.call('SADD', KEYS[2], ARGV[i]) end
+return 1
+"""
+
+# Student name cache key
+user_names_key = "users:names"
+
+# Subscription key patterns
+student_subscriptions_key = "subscriptions:{}"
+student_subscriptions_key_pattern = "subscriptions:*"
+class_subscribers_key = "class:{}:subscribers"
+subscriptions_format_key = "meta:subscriptions:format"
+
+# Subscriptions are stored as "email<US>webhook_url" instead of JSON
+SUBSCRIPTION_SEPARATOR = "\x1f"
+SUBSCRIPTIONS_FORMAT = b"2"
+
 
 class Waitlist:
 
@@ -37,29 +123,49 @@ class Waitlist:
         r1.zadd(student_waitlists_key.format(student_id), {class_id: new_placement})
 
 
-    def remove_student_from_waitlists(student_id, class_id):
+    def remove_student_from_waitlists(student_id, class_id, batch_key=None):
         """
         Removes a student from a class's waitlist.
         This will also reorder the placement values of the remaining students.
+        The removal, the reordering, and the optional push onto a batch list are
+        written in one MULTI/EXEC, so a student is batched if and only if this call
+        took them off the waitlist.
 
         :param class_id: The integer id of a class.
         :param student_id: The integer id of a student.
+        :param batch_key: An optional list to append the student to, such as the promotion batch.
+        :return: Boolean based on if the student was on the waitlist and removed.
         """
-        # Get the placement of the student in the class waitlist
-        student_placement = r1.zscore(class_waitlist_key.format(class_id), student_id)
-
-        if student_placement is not None:
-            # Remove the student from the class waitlist
-            r1.zrem(class_waitlist_key.format(class_id), student_id)
-
-            # Remove the class from the student's waitlists
-            r1.zrem(student_waitlists_key.format(student_id), class_id)
-
-            # Update the placement values for remaining students
-            remaining_students = r1.zrangebyscore(class_waitlist_key.format(class_id), student_placement + 1, '+inf', withscores=True)
-            for other_student_id, other_placement in remaining_students:
-                r1.zadd(class_waitlist_key.format(class_id), {other_student_id: other_placement - 1})
-                r1.zadd(student_waitlists_key.format(int(other_student_id)), {class_id: other_placement - 1})
+        waitlist_key = class_waitlist_key.format(class_id)
+        with r1.pipeline() as pipe:
+            while True:
+                try:
+                    # Retry if another request changes the waitlist between our reads and the write
+                    pipe.watch(waitlist_key)
+
+                    # Get the placement of the student in the class waitlist
+                    student_placement = pipe.zscore(waitlist_key, student_id)
+                    if student_placement is None:
+                        pipe.unwatch()
+                        return False
+                    remaining_students = pipe.zrangebyscore(waitlist_key, student_placement + 1, '+inf', withscores=True)
+
+                    pipe.multi()
+                    # Remove the student from the class waitlist and the class from the student's waitlists
+                    pipe.zrem(waitlist_key, student_id)
+                    pipe.zrem(student_waitlists_key.format(student_id), class_id)
+
+                    # Update the placement values for remaining students
+                    for other_student_id, other_placement in remaining_students:
+                        pipe.zadd(waitlist_key, {other_student_id: other_placement - 1})
+                        pipe.zadd(student_waitlists_key.format(int(other_student_id)), {class_id: other_placement - 1})
+
+                    if batch_key is not None:
+                        pipe.rpush(batch_key, student_id)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
 
 
     def is_student_on_waitlist(student_id, class_id):
@@ -81,7 +187,8 @@ class Waitlist:
         Used mainly for debug purposes.
         Prints all class waitlist information for all classes that have waitlists.
         """
-        keys = r1.keys(class_waitlist_key_pattern)
+        # SCAN rather than KEYS, which would block redis for every other route while it runs
+        keys = r1.scan_iter(class_waitlist_key_pattern)
         class_waitlists = {}
         for key in keys:
             class_id = key.decode().split(":")[1]
@@ -95,7 +202,7 @@ class Waitlist:
         Used mainly for debug purposes. 
         Prints all student waitlist information for all students that are on waitlists.
         """
-        keys = r1.keys(student_waitlists_key_pattern)
+        keys = r1.scan_iter(student_waitlists_key_pattern)
         student_waitlists = {}
         for key in keys:
             student_id = key.decode().split(":")[1]
@@ -153,6 +260,317 @@ class Waitlist:
         return waitlist_info
 
 
+class SeatReleases:
+
+    def release_seat(class_id, student_id):
+        """
+        Queues a released seat for the promotion worker.
+
+        :param class_id: The integer id of a class.
+        :param student_id: The integer id of the student who dropped the seat.
+        """
+        pipe = r1.pipeline()
+        pipe.rpush(seat_releases_key.format(class_id), student_id)
+        pipe.rpush(promotion_wakeup_key, class_id)
+        pipe.execute()
+
+
+    def wake(class_id):
+        """
+        Queues a class for the promotion worker again, such as after a failed batch.
+
+        :param class_id: The integer id of a class.
+        """
+        r1.rpush(promotion_wakeup_key, class_id)
+
+
+    def next_class(timeout):
+        """
+        Waits for a class with released seats.
+
+        :param timeout: Seconds to wait.
+        :return: The integer id of a class, or None if none arrived in time.
+        The same class can be returned more than once for one batch of releases.
+        """
+        item = r1.blpop(promotion_wakeup_key, timeout=timeout)
+        return int(item[1]) if item else None
+
+
+    def get_releases(class_id):
+        """
+        Returns every seat release queued for a class, without removing them.
+
+        :param class_id: The integer id of a class.
+        :return: A list of the integer ids of the students who dropped, oldest first.
+        """
+        return [int(student_id) for student_id in r1.lrange(seat_releases_key.format(class_id), 0, -1)]
+
+
+    def get_batch(class_id):
+        """
+        Returns the students already taken off a class's waitlist for the releases
+        being handled, such as by a worker that failed before finishing.
+
+        :param class_id: The integer id of a class.
+        :return: A list of integer student ids, in promotion order.
+        """
+        return [int(student_id) for student_id in r1.lrange(promotion_batch_key.format(class_id), 0, -1)]
+
+
+    def finish_batch(class_id, count, outbox_events):
+        """
+        Finishes a promotion batch once its students are enrolled: appends their
+        notifications to the outbox, clears the batch and acknowledges the releases
+        it filled, in one MULTI/EXEC.
+
+        :param class_id: The integer id of a class.
+        :param count: The number of releases handled.
+        :param outbox_events: Notification dictionaries for the relay to publish.
+        """
+        pipe = r1.pipeline()
+        for event in outbox_events:
+            pipe.xadd(outbox_stream_key, {"event": json.dumps(event)})
+        pipe.delete(promotion_batch_key.format(class_id))
+        pipe.ltrim(seat_releases_key.format(class_id), count, -1)
+        pipe.execute()
+
+
+    def lock_class(class_id, timeout=30):
+        """
+        Returns a lock that serializes promotions for a class across workers.
+
+        :param class_id: The integer id of a class.
+        :param timeout: Seconds before the lock expires, in case its holder dies.
+        :return: A redis lock, to be used as a context manager.
+        """
+        return r1.lock(promotion_lock_key.format(class_id), timeout=timeout)
+
+
+    def requeue_pending():
+        """
+        Wakes the worker for every class that still has releases queued, such as
+        releases a worker took but died before acknowledging.
+
+        :return: The number of classes requeued.
+        """
+        class_ids = [key.decode().split(":")[1] for key in r1.scan_iter(seat_releases_key_pattern)]
+        if class_ids:
+            r1.rpush(promotion_wakeup_key, *class_ids)
+        return len(class_ids)
+
+
+class UserNames:
+
+    def __init__(self):
+        self.redis_client = r1
+
+
+    def set_names(self, names):
+        """
+        Adds or updates cached user names.
+
+        :param names: A dictionary of {user_id: name}.
+        """
+        if names:
+            self.redis_client.hset(user_names_key, mapping=names)
+
+
+    def get_names(self, user_ids):
+        """
+        Gets the cached names for several users with a single HMGET.
+
+        :param user_ids: A list of integer user ids.
+        :return: A list of names in the same order as user_ids, with None for any user
+        that isn't cached.
+        """
+        if not user_ids:
+            return []
+        names = self.redis_client.hmget(user_names_key, user_ids)
+        return [name.decode("utf-8") if name is not None else None for name in names]
+
+
+class SeatLedger:
+    """
+    Seat counts and enrolled sets for classes, kept in redis and changed
+    only by Lua scripts, so concurrent enrolls on a hot class are serialized by redis
+    instead of contending on one DynamoDB item. Every change is also appended to the
+    class's op log and marks the class dirty, for the flusher in enrollment_ledger.py
+    to write behind to DynamoDB. The scripts return LEDGER_NOT_LOADED for a class that
+    isn't loaded yet, and the caller loads it with load_class from its DynamoDB item.
+    """
+
+    def __init__(self):
+        self.redis_client = r1
+        self.enroll_script = r1.register_script(LEDGER_ENROLL_SCRIPT)
+        self.drop_script = r1.register_script(LEDGER_DROP_SCRIPT)
+        self.promote_script = r1.register_script(LEDGER_PROMOTE_SCRIPT)
+        self.load_script = r1.register_script(LEDGER_LOAD_SCRIPT)
+
+
+    def keys(self, class_id):
+        return [
+            class_seats_key.format(class_id),
+            class_enrolled_key.format(class_id),
+            class_ledger_ops_key.format(class_id),
+            ledger_dirty_key,
+        ]
+
+
+    def load_class(self, class_data, overwrite=False):
+        """
+        Loads a class into the ledger from its DynamoDB item.
+        Classes with changes that aren't written back yet are never overwritten.
+
+        :param class_data: The class item.
+        :param overwrite: Whether to replace a class that is already loaded.
+        :return: Boolean based on if the class was loaded.
+        """
+        class_id = int(class_data["id"])
+        enrolled = [int(student_id) for student_id in class_data.get("enrolled", ())]
+        return bool(self.load_script(
+            keys=self.keys(class_id),
+            args=[
+                class_id, int(overwrite), int(class_data.get("current_enroll", 0)),
+                int(class_data.get("max_enroll", 0)), *enrolled,
+            ],
+        ))
+
+
+    def run(self, script, class_id, *args):
+        # Runs a script on a class, LEDGER_NOT_LOADED if the class isn't in the ledger yet
+        return script(keys=self.keys(class_id), args=[class_id, *args])
+
+
+    def enroll(self, class_id, student_id, name):
+        """
+        Enrolls a student if the class has a seat.
+
+        :param class_id: The integer id of a class.
+        :param student_id: The integer id of a student.
+        :param name: The student's name, for the roster.
+        :return: LEDGER_APPLIED, LEDGER_FULL, LEDGER_REJECTED if the student is already enrolled,
+        or LEDGER_NOT_LOADED if the class has to be loaded first.
+        """
+        return self.run(self.enroll_script, class_id, student_id, name)
+
+
+    def drop(self, class_id, student_id, name, dropped_at):
+        """
+        Drops an enrolled student, logging the drop for the drop history.
+
+        :param class_id: The integer id of a class.
+        :param student_id: The integer id of a student.
+        :param name: The student's name, for the drop history.
+        :param dropped_at: The drop time in milliseconds since the epoch.
+        :return: LEDGER_APPLIED, LEDGER_REJECTED if the student isn't enrolled,
+        or LEDGER_NOT_LOADED if the class has to be loaded first.
+        """
+        return self.run(self.drop_script, class_id, student_id, name, dropped_at)
+
+
+    def promote(self, class_id, students):
+        """
+        Enrolls students promoted off the waitlist into released seats.
+
+        :param class_id: The integer id of a class.
+        :param students: A list of (student_id, name) tuples.
+        :return: LEDGER_APPLIED, or LEDGER_NOT_LOADED if the class has to be loaded first.
+        """
+        return self.run(self.promote_script, class_id, *[value for student in students for value in student])
+
+
+    def get_seats(self, class_id):
+        """
+        Gets a class's seat counts from the ledger.
+
+        :param class_id: The integer id of a class.
+        :return: A dictionary with current_enroll and max_enroll, or None if the class isn't loaded.
+        """
+        seats = self.redis_client.hgetall(class_seats_key.format(class_id))
+        if not seats:
+            return None
+        return {field.decode("utf-8"): int(value) for field, value in seats.items()}
+
+
+    def snapshot(self, class_id):
+        """
+        Reads a class's ledger state and pending op log in one transaction.
+
+        :param class_id: The integer id of a class.
+        :return: A tuple of (current_enroll or None if the class isn't loaded, enrolled ids, ops),
+        where ops are (kind, student_id, name, dropped_at) tuples, oldest first, with dropped_at None for enrolls.
+        """
+        pipe = self.redis_client.pipeline()
+        pipe.hget(class_seats_key.format(class_id), "current_enroll")
+        pipe.smembers(class_enrolled_key.format(class_id))
+        pipe.lrange(class_ledger_ops_key.format(class_id), 0, -1)
+        current, enrolled, ops = pipe.execute()
+        parsed = []
+        for op in ops:
+            kind, student_id, name = op.decode("utf-8").split("|", 2)
+            dropped_at = None
+            if kind == "D":
+                dropped_at, name = name.split("|", 1)
+                dropped_at = int(dropped_at)
+            parsed.append((kind, int(student_id), name, dropped_at))
+        return (
+            int(current) if current is not None else None,
+            {int(student_id) for student_id in enrolled},
+            parsed,
+        )
+
+
+    def take_dirty(self, count):
+        """
+        Removes and returns up to count classes with changes to write back.
+
+        :return: A list of integer class ids.
+        """
+        return [int(class_id) for class_id in self.redis_client.spop(ledger_dirty_key, count) or []]
+
+
+    def mark_dirty(self, class_ids):
+        if class_ids:
+            self.redis_client.sadd(ledger_dirty_key, *class_ids)
+
+
+    def ack_ops(self, class_id, count):
+        """
+        Removes the oldest ops from a class's log once they are written back.
+
+        :param class_id: The integer id of a class.
+        :param count: The number of ops written.
+        """
+        self.redis_client.ltrim(class_ledger_ops_key.format(class_id), count, -1)
+
+
+    def pending_classes(self):
+        """
+        :return: The integer ids of every class with ops that aren't written back yet.
+        """
+        return [int(key.decode().split(":")[1]) for key in self.redis_client.scan_iter(class_ledger_ops_key_pattern)]
+
+
+    def loaded_classes(self):
+        """
+        :return: The integer ids of every class in the ledger.
+        """
+        return [int(key.decode().split(":")[1]) for key in self.redis_client.scan_iter(class_seats_key_pattern)]
+
+
+    def delete_class(self, class_id):
+        """
+        Removes a class from the ledger.
+
+        :param class_id: The integer id of a class.
+        """
+        keys = self.keys(class_id)
+        pipe = self.redis_client.pipeline()
+        pipe.delete(*keys[:3])
+        pipe.srem(ledger_dirty_key, class_id)
+        pipe.execute()
+
+
 class Subscription:
 
     def __init__(self):
@@ -161,14 +579,18 @@ class Subscription:
 
     def add_subscription(self, student_id, class_id, sub_payload):
         """
-        Adds subscription information to redis.
+        Adds subscription information to redis, both under the student and in the
+        class's subscriber index.
 
         :param student_id: The integer id of a student.
-        :param sub_payload: The subscription info, such as class_id and either an email,
-        webhook URL, or both.
+        :param class_id: The integer id of a class.
+        :param sub_payload: The subscription info, either an email, webhook URL, or both.
         """
-        key = f"subscriptions:{student_id}"
-        self.redis_client.hset(key, class_id, json.dumps(sub_payload))
+        value = pack_subscription(sub_payload)
+        pipe = self.redis_client.pipeline()
+        pipe.hset(student_subscriptions_key.format(student_id), class_id, value)
+        pipe.hset(class_subscribers_key.format(class_id), student_id, value)
+        pipe.execute()
 
     
     def check_student_subscription(self, student_id):
@@ -178,7 +600,7 @@ class Subscription:
         :param student_id: The integer id of a student.
         :return: Boolean based on if it exists or not.
         """
-        key = f"subscriptions:{student_id}"
+        key = student_subscriptions_key.format(student_id)
         return self.redis_client.hlen(key) > 0
     
 
@@ -190,8 +612,22 @@ class Subscription:
         :param class_id: The integer id of a class.
         :return: Boolean based on if it exists or not.
         """
-        key = f"subscriptions:{student_id}"
+        key = student_subscriptions_key.format(student_id)
         return self.redis_client.hexists(key, class_id)
+
+
+    def get_subscription(self, student_id, class_id):
+        """
+        Get a student's subscription for a single class with one HGET.
+
+        :param student_id: The integer id of a student.
+        :param class_id: The integer id of a class.
+        :return: A dictionary with the email and webhook_url, or None if the student
+        isn't subscribed to the class.
+        """
+        key = student_subscriptions_key.format(student_id)
+        value = self.redis_client.hget(key, class_id)
+        return unpack_subscription(value) if value is not None else None
     
 
     def get_all_subscriptions(self, student_id):
@@ -201,16 +637,31 @@ class Subscription:
         :param student_id: The integer id of a student.
         :return: List of subscription information.
         """
-        key = f"subscriptions:{student_id}"
+        key = student_subscriptions_key.format(student_id)
         subscriptions = self.redis_client.hgetall(key)
     
         # Convert each subscription to a dictionary with keys: class_id, email, and webhook_url
         subscriptions_data = [
-            {"class_id": int(class_id), **json.loads(subscription)}
+            {"class_id": int(class_id), **unpack_subscription(subscription)}
             for class_id, subscription in subscriptions.items()
         ]
     
         return subscriptions_data
+
+
+    def get_class_subscribers(self, class_id):
+        """
+        Get every subscription for a class with one HGETALL, for notifying everyone
+        watching a class.
+
+        :param class_id: The integer id of a class.
+        :return: A dictionary of {student_id: {"email": ..., "webhook_url": ...}}.
+        """
+        key = class_subscribers_key.format(class_id)
+        return {
+            int(student_id): unpack_subscription(subscription)
+            for student_id, subscription in self.redis_client.hgetall(key).items()
+        }
     
 
     def delete_subscription(self, student_id, class_id):
@@ -220,11 +671,61 @@ class Subscription:
         :param student_id: The integer id of a student.
         :param class_id: The integer id of a class.
         """
-        key = f"subscriptions:{student_id}"
+        key = student_subscriptions_key.format(student_id)
         
         # Check if the subscription exists before attempting to delete
         if self.redis_client.hexists(key, class_id):
-            self.redis_client.hdel(key, class_id)
+            pipe = self.redis_client.pipeline()
+            pipe.hdel(key, class_id)
+            pipe.hdel(class_subscribers_key.format(class_id), student_id)
+            pipe.execute()
         else:
             # If the subscription doesn't exist, raise an exception
             raise ValueError(f"Subscription not found for student {student_id} and class {class_id}")
+
+
+    def migrate_subscriptions(self):
+        """
+        Rewrites subscriptions stored in the old JSON format into the packed format and
+        builds the class subscriber index from them. Runs once, later calls return
+        straight away.
+        """
+        if self.redis_client.get(subscriptions_format_key) == SUBSCRIPTIONS_FORMAT:
+            return
+        for key in self.redis_client.scan_iter(student_subscriptions_key_pattern):
+            student_id = int(key.decode().split(":")[1])
+            pipe = self.redis_client.pipeline()
+            for class_id, subscription in self.redis_client.hgetall(key).items():
+                value = pack_subscription(unpack_subscription(subscription))
+                pipe.hset(key, class_id, value)
+                pipe.hset(class_subscribers_key.format(int(class_id)), student_id, value)
+            pipe.execute()
+        self.redis_client.set(subscriptions_format_key, SUBSCRIPTIONS_FORMAT)
+
+
+def pack_subscription(sub_payload):
+    """
+    Packs a subscription into a single compact string, "email<US>webhook_url".
+    The ASCII unit separator can't appear in an email address or a URL.
+
+    :param sub_payload: A dictionary with the email and webhook_url.
+    :return: The packed subscription.
+    """
+    return sub_payload.get("email", "") + SUBSCRIPTION_SEPARATOR + sub_payload.get("webhook_url", "")
+
+
+def unpack_subscription(value):
+    """
+    Unpacks a subscription stored by pack_subscription. Values written before the
+    packed format existed are JSON and are decoded as such.
+
+    :param value: The stored subscription, as bytes or a string.
+    :return: A dictionary with the email and webhook_url.
+    """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if value.startswith("{"):
+        data = json.loads(value)
+        return {"email": data.get("email", ""), "webhook_url": data.get("webhook_url", "")}
+    email, _, webhook_url = value.partition(SUBSCRIPTION_SEPARATOR)
+    return {"email": email, "webhook_url": webhook_url}
@@ -0,0 +1,163 @@
+"""
+Outbox relay: moves notifications from the Redis outbox stream to RabbitMQ.
+
+The enrollment routes append a notification to the outbox stream in the same
+Redis transaction that promotes a student off a waitlist, instead of publishing
+to RabbitMQ inline. This process drains the stream in batches, publishes each
+entry with publisher confirms, and only then acknowledges and deletes it, so a
+notification is delivered at least once even if RabbitMQ or the relay is down
+when the student is promoted.
+
+With NOTIFICATION_TRANSPORT set to "redis" there is no broker: the relay moves
+each batch onto the per channel notification streams the consumers read, in the
+same MULTI/EXEC that acknowledges it, so nothing is lost or published twice.
+
+Run from the main directory:
+
+    python -m enrollment.enrollment_relay
+"""
+import json
+import os
+import time
+
+import pika
+import redis
+
+from enrollment.enrollment_notify import declare_topology, publish_notification, stream_notification
+from enrollment.enrollment_redis import outbox_stream_key
+
+RELAY_GROUP = "relay"
+RELAY_CONSUMER = os.environ.get("RELAY_CONSUMER", f"relay-{os.getpid()}")
+BATCH_SIZE = int(os.environ.get("RELAY_BATCH_SIZE", "100"))
+BLOCK_MS = int(os.environ.get("RELAY_BLOCK_MS", "1000"))
+# Entries pending this long on a consumer that is gone are claimed by another relay
+CLAIM_IDLE_MS = int(os.environ.get("RELAY_CLAIM_IDLE_MS", "30000"))
+RECONNECT_DELAY = 2
+TRANSPORT = os.environ.get("NOTIFICATION_TRANSPORT", "rabbitmq")
+
+r = redis.Redis(db=1)
+
+
+def create_group():
+    """
+    Creates the relay consumer group, and the stream if it doesn't exist yet.
+    The group starts at the beginning of the stream, so entries written before
+    the first relay ever started are still published.
+    """
+    try:
+        r.xgroup_create(outbox_stream_key, RELAY_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def claim_stale_entries():
+    """
+    Takes over entries that another relay read but never acknowledged, so they
+    are published again instead of staying pending forever.
+    """
+    start = "0-0"
+    while True:
+        start, claimed, *_ = r.xautoclaim(
+            outbox_stream_key, RELAY_GROUP, RELAY_CONSUMER,
+            min_idle_time=CLAIM_IDLE_MS, start_id=start, count=BATCH_SIZE,
+        )
+        if claimed:
+            print(f" [*] Claimed {len(claimed)} stale outbox entries")
+        if start in (b"0-0", "0-0"):
+            return
+
+
+def read_batch(entry_id):
+    """
+    Reads a batch of outbox entries for this consumer.
+
+    :param entry_id: "0" to re-read this consumer's pending entries,
+    or ">" to read new entries, blocking until some arrive.
+    :return: A list of (entry_id, fields) tuples.
+    """
+    response = r.xreadgroup(
+        RELAY_GROUP, RELAY_CONSUMER, {outbox_stream_key: entry_id},
+        count=BATCH_SIZE, block=None if entry_id == "0" else BLOCK_MS,
+    )
+    if not response:
+        return []
+    return response[0][1]
+
+
+def relay_batch(channel, entries):
+    """
+    Publishes a batch of outbox entries and removes them from the stream once the
+    broker has confirmed every message in it.
+
+    :param channel: A pika channel in confirm mode.
+    :param entries: A list of (entry_id, fields) tuples from the stream.
+    """
+    for entry_id, fields in entries:
+        publish_notification(channel, json.loads(fields[b"event"]))
+
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe = r.pipeline(transaction=False)
+    pipe.xack(outbox_stream_key, RELAY_GROUP, *entry_ids)
+    pipe.xdel(outbox_stream_key, *entry_ids)
+    pipe.execute()
+
+
+def stream_batch(entries):
+    """
+    Moves a batch of outbox entries onto the notification streams and acknowledges
+    them in one transaction.
+
+    :param entries: A list of (entry_id, fields) tuples from the stream.
+    """
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe = r.pipeline()
+    for entry_id, fields in entries:
+        stream_notification(pipe, json.loads(fields[b"event"]))
+    pipe.xack(outbox_stream_key, RELAY_GROUP, *entry_ids)
+    pipe.xdel(outbox_stream_key, *entry_ids)
+    pipe.execute()
+
+
+def connect():
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+    channel = connection.channel()
+    declare_topology(channel)
+    channel.confirm_delivery()
+    return connection, channel
+
+
+def main():
+    create_group()
+    claim_stale_entries()
+    print(f' [*] Relaying outbox notifications to {TRANSPORT}. To exit press CTRL+C')
+
+    if TRANSPORT == "redis":
+        while True:
+            entries = read_batch("0") or read_batch(">")
+            if entries:
+                stream_batch(entries)
+
+    while True:
+        try:
+            connection, channel = connect()
+            try:
+                while True:
+                    # Pending entries first, these were read but never confirmed,
+                    # usually because the broker went away mid batch
+                    entries = read_batch("0") or read_batch(">")
+                    if entries:
+                        relay_batch(channel, entries)
+            finally:
+                if connection.is_open:
+                    connection.close()
+        except pika.exceptions.AMQPError as e:
+            print(f" [!] RabbitMQ error, retrying in {RECONNECT_DELAY}s: {e!r}")
+            time.sleep(RECONNECT_DELAY)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -1,92 +1,223 @@
+import asyncio
 import logging.config
-import boto3
 import redis
 
-import pika
 import json
 import hashlib
-from fastapi import Depends, HTTPException, APIRouter, status, Request
-from fastapi.responses import JSONResponse
+from functools import partial
+from fastapi import Depends, HTTPException, APIRouter, status, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from typing import Optional
 from boto3.dynamodb.conditions import Key, Attr
 from enrollment.enrollment_schemas import *
-from enrollment.enrollment_dynamo import Enrollment, PartiQL
-from enrollment.enrollment_redis import Waitlist, Subscription
+from enrollment.enrollment_auth import Identity, authorize, get_identity
+from enrollment.enrollment_admission import AdmissionLimiter
+from enrollment.enrollment_idempotency import IdempotentRoute
+from enrollment.enrollment_singleflight import SingleFlight
+from enrollment.enrollment_stale import StaleCache, CATALOG_POLICY, age_header
+from enrollment.enrollment_bulkhead import Bulkhead, bulkhead_stats, settings as bulkhead_settings
+from enrollment.enrollment_clients import settings as client_settings, client_config_kwargs, get_dynamodb_resource, get_table, DEBUG_POOL
+from enrollment.enrollment_dynamo import (
+    Enrollment, ROSTER_ENROLLED, SCAN_SEGMENTS, drop_time, is_history_cursor,
+    CLASS_EXISTS, CLASS_OWNER, CLASS_SEATS, CLASS_SUMMARY, USER_EXISTS, USER_NAME,
+)
+from enrollment.enrollment_dynamo_async import AsyncDynamoDB, AsyncEnrollment, AsyncPartiQL
+from enrollment.enrollment_redis import Waitlist, SeatReleases, SeatLedger, UserNames, class_waitlist_key, LEDGER_APPLIED, LEDGER_FULL, LEDGER_NOT_LOADED, LEDGER_REJECTED
 from datetime import datetime
 
 
 settings = Settings()
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
 
 CLASS_TABLE = "enrollment_class"
 USER_TABLE = "enrollment_user"
+ROSTER_TABLE = "enrollment_roster"
+DROP_HISTORY_TABLE = "enrollment_drop_history"
 DEBUG = False
 FREEZE = False
 MAX_WAITLIST = 3
+ROSTER_PAGE_SIZE = 50
+MAX_ROSTER_PAGE_SIZE = 500
+MAX_SCAN_SEGMENTS = 16
+EXPORT_CHUNK_ITEMS = 100
 
 
 
 def get_logger():
     return logging.getLogger(__name__)
 
-# Connect to DynamoDB
-dynamodb = boto3.resource("dynamodb", endpoint_url="http://localhost:5500")
-
-def get_table_resource(dynamodb, table_name):
-    return dynamodb.Table(table_name)
+# Connect to DynamoDB through the shared, tuned client
+dynamodb = get_dynamodb_resource()
 
-# Create wrapper for PartiQL queries
-wrapper = PartiQL(dynamodb)
+# Async DynamoDB client used by the hot routes, so they don't tie up threadpool workers
+async_dynamodb = AsyncDynamoDB(
+    endpoint_url=client_settings.dynamodb_endpoint_url,
+    config_kwargs=client_config_kwargs(),
+)
+async_enrollment = AsyncEnrollment(async_dynamodb)
+async_wrapper = AsyncPartiQL(async_dynamodb)
 
 # Connect to Redis
 r = redis.Redis(db=1)
 
 # Create class items
 wl = Waitlist
+releases = SeatReleases
+ledger = SeatLedger()
+
+# Admission control for registration storms on the enroll route, shared by every worker
+enroll_admission = AdmissionLimiter("enroll")
 enrollment = Enrollment(dynamodb)
-sub = Subscription()
+user_names = UserNames()
+
+# Debug scans get their own DynamoDB connection pool, so they can't take the connections the student routes need
+debug_enrollment = Enrollment(get_dynamodb_resource(DEBUG_POOL))
+
+# Concurrency limits per route group, so expensive admin traffic can't starve the student routes.
+# The sync routes in each group run on the group's own threads
+student_bulkhead = Bulkhead("student", bulkhead_settings.bulkhead_student_limit, bulkhead_settings.bulkhead_student_queue)
+instructor_bulkhead = Bulkhead("instructor", bulkhead_settings.bulkhead_instructor_limit, bulkhead_settings.bulkhead_instructor_queue)
+registrar_bulkhead = Bulkhead("registrar", bulkhead_settings.bulkhead_registrar_limit, bulkhead_settings.bulkhead_registrar_queue)
+debug_bulkhead = Bulkhead("debug", bulkhead_settings.bulkhead_debug_limit, bulkhead_settings.bulkhead_debug_queue)
+
+# Coalesces identical concurrent reads on the hot routes into one backend call
+flight = SingleFlight()
+
+# Serves recent copies of the catalog while DynamoDB is slow, with one refresh per key
+stale = StaleCache()
 
 if DEBUG:
     logging.config.fileConfig(
         settings.enrollment_logging_config, disable_existing_loggers=False
     )
 
+# A database from before the roster and drop history tables has to be migrated first,
+# fail at startup instead of on the first enroll or drop
+@router.on_event("startup")
+def check_tables():
+    missing = enrollment.missing_tables()
+    if missing:
+        raise RuntimeError(
+            f"DynamoDB tables {', '.join(missing)} don't exist, run python -m enrollment.migrate_roster "
+            "and python -m enrollment.migrate_drop_history first"
+        )
+
+@router.on_event("shutdown")
+async def close_async_dynamodb():
+    await async_dynamodb.close()
+
 # ETag Generator for any changes waitlist
 def generate_etag(data):
     data_string = json.dumps(data, sort_keys=True)
     # Create a hash of this string
     return hashlib.md5(data_string.encode()).hexdigest()
 
+# Looks up student names in the redis name cache with one HMGET.
+# Any names missing from the cache are read from DynamoDB and cached
+async def get_student_names(student_ids):
+    names = await asyncio.to_thread(user_names.get_names, student_ids)
+    missing = [student_id for student_id, name in zip(student_ids, names) if name is None]
+    if missing:
+        users = await asyncio.gather(
+            *(async_enrollment.get_user_item(student_id, USER_NAME) for student_id in missing)
+        )
+        found = {int(user["id"]): user["name"] for user in users if user}
+        await asyncio.to_thread(user_names.set_names, found)
+        names = [
+            found.get(student_id, "") if name is None else name
+            for student_id, name in zip(student_ids, names)
+        ]
+    return names
+
+
+# Runs a seat ledger operation on a class. The class is read from DynamoDB, for its seats
+# only, when the ledger doesn't have it yet. Returns None if the class doesn't exist.
+# Like every redis call in the async routes, the scripts run on a thread, off the event loop
+async def run_ledger(operation, class_id, *args):
+    result = await asyncio.to_thread(operation, class_id, *args)
+    if result != LEDGER_NOT_LOADED:
+        return result
+    class_data = await async_enrollment.get_class_item(class_id, CLASS_SEATS)
+    if not class_data:
+        return None
+    await asyncio.to_thread(ledger.load_class, class_data)
+    result = await asyncio.to_thread(operation, class_id, *args)
+    if result == LEDGER_NOT_LOADED:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Seat ledger is unavailable, try again",
+        )
+    return result
+
+
+# Puts a student on a full class's waitlist, unless there is an administrative freeze
+# or the student or the waitlist is already at its limit. It calls redis, so the async
+# routes run it on a thread
+def waitlist_student(class_id, student_id, class_data):
+    new_enrollment = class_data.get("current_enroll", 0) + 1
+    # freeze is in place
+    if not FREEZE:
+        waitlist_count = wl.get_waitlist_count(student_id)
+        if (
+            waitlist_count < MAX_WAITLIST
+            and new_enrollment < class_data.get("max_enroll", 0) + 15
+        ):
+            wl.add_waitlists(class_id, student_id)
+            return {"message": "Student added to the waitlist"}
+        else:
+            return {
+                "message": "Unable to add student to waitlist due to already having the maximum number of waitlists"
+            }
+    else:
+        return {
+            "message": "Unable to add student to waitlist due to administrative freeze"
+        }
+
+
 # ==========================================students==================================================
 
 
 # gets available classes for a student
-@router.get("/students/{student_id}/classes", tags=["Student"])
-def get_available_classes(student_id: int, request: Request):
-
-    # User Authentication
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
+def class_enroll(item, instructor_name):
+    """
+    Builds the Class_Enroll view of a class item, splitting its enrollment count into
+    enrolled students and waitlist.
+
+    :param item: The class item.
+    :param instructor_name: The name of the class's instructor.
+    :return: A Class_Enroll.
+    """
+    # Get waitlist information
+    if item["current_enroll"] > item["max_enroll"]:
+        current_enroll = item["max_enroll"]
+        waitlist = item["current_enroll"] - item["max_enroll"]
+    else:
+        current_enroll = item["current_enroll"]
+        waitlist = 0
+    return Class_Enroll(
+        id=item["id"],
+        name=item["name"],
+        course_code=item["course_code"],
+        section_number=item["section_number"],
+        current_enroll=current_enroll,
+        max_enroll=item["max_enroll"],
+        department=item["department"],
+        instructor=Instructor(id=item["instructor_id"], name=instructor_name),
+        current_waitlist=waitlist,
+        max_waitlist=15,
+    )
 
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
 
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
+@router.get("/students/{student_id}/classes", tags=["Student"])
+@student_bulkhead
+async def get_available_classes(student_id: int, response: Response, identity: Optional[Identity] = Depends(get_identity)):
 
-        # Check if the current user's id matches the requested student_id
-        if r_flag:
-            if current_user != student_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
+    # User Authentication
+    authorize(identity, student_id)
 
     # Fetch student data from db
-    student_data = enrollment.get_user_item(student_id)
+    student_data = await async_enrollment.get_user_item(student_id, USER_EXISTS)
 
     # Check if exist
     if not student_data:
@@ -94,13 +225,14 @@ def get_available_classes(student_id: int, request: Request):
             status_code=status.HTTP_404_NOT_FOUND, detail="Student not found"
         )
 
-    waitlist_count = wl.get_waitlist_count(student_id)
+    # Only the columns the catalog shows, not the enrolled set
+    columns = ", ".join(f'"{attribute}"' for attribute in CLASS_SUMMARY)
+
+    waitlist_count = await asyncio.to_thread(wl.get_waitlist_count, student_id)
 
     # If max waitlist, don't show full classes with open waitlists
     if waitlist_count >= MAX_WAITLIST:
-        output = wrapper.run_partiql_statement(
-            f'SELECT * FROM "{CLASS_TABLE}" WHERE current_enroll <= max_enroll'
-        )
+        statement = f'SELECT {columns} FROM "{CLASS_TABLE}" WHERE current_enroll <= max_enroll'
 
     # Else show all open classes or full classes with open waitlists
     else:
@@ -108,42 +240,27 @@ def get_available_classes(student_id: int, request: Request):
         # so 30 + 15 = 45. Technically classes can be created with any max_enroll value,
         # but I cant use partiql with arithmatic, for example I cant do
         # "WHERE current_enroll < (max_enroll + 15)". So for now its just 45
-        output = wrapper.run_partiql_statement(
-            f'SELECT * FROM "{CLASS_TABLE}" WHERE current_enroll < 45',
+        statement = f'SELECT {columns} FROM "{CLASS_TABLE}" WHERE current_enroll < 45'
+
+    # students asking for the catalog at the same time share one scan, and get
+    # a recent copy of it while the scan is slow
+    output, age = await stale.get(("catalog", statement), CATALOG_POLICY, async_wrapper.run_partiql_statement, statement)
+    age_header(response, age)
+
+    # get instructor information, fetching each instructor once and all of them concurrently
+    instructor_ids = list({item["instructor_id"] for item in output["Items"]})
+    instructor_items = await asyncio.gather(
+        *(
+            flight.run(("user", instructor_id, USER_NAME), async_enrollment.get_user_item, instructor_id, USER_NAME)
+            for instructor_id in instructor_ids
         )
+    )
+    instructors = dict(zip(instructor_ids, instructor_items))
 
-    # Create a list to store the Class instances
-    class_instances = []
-
-    # Iterate through the query results and create Class instances
-    for item in output["Items"]:
-        # get instructor information
-        result = wrapper.run_partiql(
-            f'SELECT * FROM "{USER_TABLE}" WHERE id=?', [item["instructor_id"]]
-        )
-        # Get waitlist information
-        if item["current_enroll"] > item["max_enroll"]:
-            current_enroll = item["max_enroll"]
-            waitlist = item["current_enroll"] - item["max_enroll"]
-        else:
-            current_enroll = item["current_enroll"]
-            waitlist = 0
-        # Create the class instance
-        class_instance = Class_Enroll(
-            id=item["id"],
-            name=item["name"],
-            course_code=item["course_code"],
-            section_number=item["section_number"],
-            current_enroll=current_enroll,
-            max_enroll=item["max_enroll"],
-            department=item["department"],
-            instructor=Instructor(
-                id=item["instructor_id"], name=result["Items"][0]["name"]
-            ),
-            current_waitlist=waitlist,
-            max_waitlist=15,
-        )
-        class_instances.append(class_instance)
+    # Create the Class instances from the query results
+    class_instances = [
+        class_enroll(item, instructors[item["instructor_id"]]["name"]) for item in output["Items"]
+    ]
     
     # Sort the class_instances list based on the id attribute
     class_instances = sorted(class_instances, key=lambda x: x.id)
@@ -153,37 +270,38 @@ def get_available_classes(student_id: int, request: Request):
 
 # Enrolls a student into an available class,
 # or will automatically put the student on an open waitlist for a full class
-@router.post("/students/{student_id}/classes/{class_id}/enroll", tags=["Student"])
-def enroll_student_in_class(student_id: int, class_id: int, request: Request):
-
-    class_table = get_table_resource(dynamodb, CLASS_TABLE)
+@router.post("/students/{student_id}/classes/{class_id}/enroll", tags=["Student"], dependencies=[Depends(enroll_admission)])
+@student_bulkhead
+async def enroll_student_in_class(student_id: int, class_id: int, identity: Optional[Identity] = Depends(get_identity)):
 
     # User Authentication
-    if request.headers.get("X-User"):
-
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
-
-        # Check if the current user's id matches the requested student_id
-        if r_flag:
-            if current_user != student_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
-
-    # Fetch student data from db
-    student_data = enrollment.get_user_item(student_id)
-
-    # Fetch class data from db
-    class_data = enrollment.get_class_item(class_id)
+    authorize(identity, student_id)
+
+    # With the seat ledger, seats are counted in redis and written behind to DynamoDB
+    if settings.seat_ledger:
+        student_data = await async_enrollment.get_user_item(student_id, USER_NAME)
+        result = None
+        if student_data:
+            result = await run_ledger(ledger.enroll, class_id, student_id, student_data["name"])
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Student or Class not found"
+            )
+        if result == LEDGER_REJECTED:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Student is already enrolled in this class or currently on waitlist",
+            )
+        if result == LEDGER_FULL:
+            seats = await asyncio.to_thread(ledger.get_seats, class_id)
+            return await asyncio.to_thread(waitlist_student, class_id, student_id, seats or {})
+        return {"message": "Student successfully enrolled in class"}
+
+    # Fetch student and class data from db concurrently
+    student_data, class_data = await asyncio.gather(
+        async_enrollment.get_user_item(student_id, USER_NAME),
+        async_enrollment.get_class_item(class_id, CLASS_SEATS),
+    )
 
     # Check if the class and student exists in the database
     if not student_data or not class_data:
@@ -191,57 +309,51 @@ def enroll_student_in_class(student_id: int, class_id: int, request: Request):
             status_code=status.HTTP_404_NOT_FOUND, detail="Student or Class not found"
         )
 
-    # Check if student is already enrolled in the class
-    # check the information in the table
-    for enrolled_student_id in class_data.get("enrolled", []):
-        if student_id == enrolled_student_id:
+    # Check if student is already enrolled in the class before waitlisting them,
+    # enrolled is a number set so this is a hash lookup
+    if student_id in class_data.get("enrolled", set()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Student is already enrolled in this class or currently on waitlist",
+        )
+
+    # Check if the class is full, add student to waitlist if no.
+    if class_data.get("current_enroll", 0) + 1 >= class_data.get("max_enroll", 0):
+        return await asyncio.to_thread(waitlist_student, class_id, student_id, class_data)
+
+    # Increment enrollment number and add student to enrolled in a single update.
+    # The condition rechecks membership and the seat count on the server, so two
+    # concurrent enrolls can't both succeed or both take the last seat
+    enrolled = await async_enrollment.update_class_item(
+        class_id,
+        "ADD current_enroll :one, enrolled :student_ids",
+        {
+            ":one": 1,
+            ":student_id": student_id,
+            ":student_ids": {student_id},
+            ":seat_limit": class_data.get("max_enroll", 0) - 1,
+        },
+        condition="NOT contains(enrolled, :student_id) AND current_enroll < :seat_limit",
+    )
+    if not enrolled:
+        # Another request changed the class first, read it again to see whether
+        # the student got enrolled or the class filled up
+        class_data = await async_enrollment.get_class_item(class_id, CLASS_SEATS)
+        if not class_data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Student or Class not found"
+            )
+        if student_id in class_data.get("enrolled", set()):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Student is already enrolled in this class or currently on waitlist",
             )
+        return await asyncio.to_thread(waitlist_student, class_id, student_id, class_data)
 
-    new_enrollment = class_data.get("current_enroll", 0) + 1
-
-    # Check if the class is full, add student to waitlist if no.
-    if new_enrollment >= class_data.get("max_enroll", 0):
-        # freeze is in place
-        if not FREEZE:
-            waitlist_count = wl.get_waitlist_count(student_id)
-            if (
-                waitlist_count < MAX_WAITLIST
-                and new_enrollment < class_data.get("max_enroll", 0) + 15
-            ):
-                wl.add_waitlists(class_id, student_id)
-                return {"message": "Student added to the waitlist"}
-            else:
-                return {
-                    "message": "Unable to add student to waitlist due to already having the maximum number of waitlists"
-                }
-        else:
-            return {
-                "message": "Unable to add student to waitlist due to administrative freeze"
-            }
-        
-    # Increment enrollment number in the database
-    class_table.update_item(
-        Key={"id": class_id},
-        UpdateExpression="SET current_enroll = :new_enrollment",
-        ExpressionAttributeValues={":new_enrollment": new_enrollment},
-    )
-
-    # Add student to enrolled class in the database
-    class_table.update_item(
-        Key={"id": class_id},
-        UpdateExpression="SET enrolled = list_append(enrolled, :student_id)",
-        ExpressionAttributeValues={":student_id": [student_id]},
-    )
-
-    dropped = class_data.get("dropped", [])
-    new_dropped = [student_id for student_id in dropped if student_id != student_id]
-    class_table.update_item(
-        Key={"id": class_id},
-        UpdateExpression="SET dropped = :dropped",
-        ExpressionAttributeValues={":dropped": new_dropped},
+    # and add the student to the enrolled roster
+    await async_enrollment.write_roster(
+        class_id,
+        puts=[(student_id, student_data["name"], ROSTER_ENROLLED)],
     )
  
     return {"message": "Student successfully enrolled in class"}
@@ -249,35 +361,39 @@ def enroll_student_in_class(student_id: int, class_id: int, request: Request):
 
 # Have a student drop a class they're enrolled in
 @router.put("/students/{student_id}/classes/{class_id}/drop/", tags=["Student"])
-def drop_student_from_class(student_id: int, class_id: int, request: Request):
-
-    class_table = get_table_resource(dynamodb, CLASS_TABLE)
+@student_bulkhead
+async def drop_student_from_class(student_id: int, class_id: int, identity: Optional[Identity] = Depends(get_identity)):
 
     # user authentication
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
-
-        # Check if the current user's id matches the requested student_id
-        if r_flag:
-            if current_user != student_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
-
-    # fetch data for the user
-    student_data = enrollment.get_user_item(student_id)
+    authorize(identity, student_id)
+
+    # With the seat ledger, the drop is recorded in redis and written behind to DynamoDB
+    if settings.seat_ledger:
+        student_data = await async_enrollment.get_user_item(student_id, USER_NAME)
+        result = None
+        if student_data:
+            # students on the waitlist aren't enrolled
+            if await asyncio.to_thread(wl.is_student_on_waitlist, student_id, class_id):
+                result = LEDGER_REJECTED
+            else:
+                result = await run_ledger(ledger.drop, class_id, student_id, student_data["name"], drop_time())
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Student or Class not found"
+            )
+        if result != LEDGER_APPLIED:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Student is not enrolled in the class",
+            )
+        await asyncio.to_thread(releases.release_seat, class_id, student_id)
+        return {"message": "Student successfully dropped class"}
 
-    # fetch data for the class
-    class_data = enrollment.get_class_item(class_id)
+    # fetch data for the user and the class concurrently
+    student_data, class_data = await asyncio.gather(
+        async_enrollment.get_user_item(student_id, USER_NAME),
+        async_enrollment.get_class_item(class_id, CLASS_EXISTS),
+    )
 
     # Check if the class and student exists in the database
     if not student_data or not class_data:
@@ -285,124 +401,45 @@ def drop_student_from_class(student_id: int, class_id: int, request: Request):
             status_code=status.HTTP_404_NOT_FOUND, detail="Student or Class not found"
         )
 
-    # fetch enrollment information
-    enrollment_data = wrapper.run_partiql(
-        f'SELECT * FROM "{CLASS_TABLE}" WHERE id=?', [class_id]
+    # fetch waitlist information
+    waitlist_data = await asyncio.to_thread(wl.is_student_on_waitlist, student_id, class_id)
+
+    # remove student from enrolled, if the server still has them enrolled
+    # and they aren't on the waitlist
+    dropped = not waitlist_data and await async_enrollment.update_class_item(
+        class_id,
+        "DELETE enrolled :student_ids",
+        {":student_id": student_id, ":student_ids": {student_id}},
+        condition="contains(enrolled, :student_id)",
     )
+    if not dropped:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Student is not enrolled in the class",
+        )
 
-    # fetch waitlist information
-    waitlist_data = wl.is_student_on_waitlist(student_id, class_id)
-    
+    # take the student off the enrolled roster and append the drop to the class's drop history
+    await async_enrollment.write_roster(
+        class_id,
+        deletes=[(student_id, ROSTER_ENROLLED)],
+        drops=[(student_id, student_data["name"], drop_time())],
+    )
 
-    # check if the student is enrolled or on the waitlist
-    for item in enrollment_data["Items"]:
-        check_enroll = item.get("enrolled", [])
-        if student_id not in check_enroll or waitlist_data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Student is not enrolled in the class",
-            )
+    # the promotion worker fills the released seat from the waitlist
+    await asyncio.to_thread(releases.release_seat, class_id, student_id)
 
-    # remove student from class
-    for item in enrollment_data["Items"]:
-        # store the student that is enrolled
-        student_enroll = item.get("enrolled", [])
-        if student_id in student_enroll:
-            # remove student from enrolled
-            student_enroll.remove(student_id)
-            # udpate enrolled table with the removed student
-            class_table.update_item(
-                Key={"id": class_id},
-                UpdateExpression="SET enrolled = :enrolled",
-                ExpressionAttributeValues={":enrolled": student_enroll},
-            )
-    
-    
-    students = wl.get_class_waitlist(class_id)
-    if students:
-        next_student = int(min(students, key=students.get))
-        print(f"This is the top_student--- {next_student}")
-        #top_student = next_student[0][0].decode("utf-8")
-        wl.remove_student_from_waitlists(next_student, class_id)
-        class_table.update_item(
-            Key={"id": class_id},
-            UpdateExpression="SET enrolled = list_append(enrolled, :student_id)",
-            ExpressionAttributeValues={":student_id": [next_student]},
-        )
-        class_table.update_item(
-            Key={"id": class_id},
-            UpdateExpression="SET dropped = list_append(dropped, :student_id)",
-            ExpressionAttributeValues={":student_id": [student_id]},
-        )
-       
-        subscribed = sub.is_student_subscribed(next_student,class_id)
-        if subscribed:
-            sub.get_all_subscriptions(next_student)
-            for subscription in sub.get_all_subscriptions(next_student):
-                if subscription["class_id"] == class_id:
-                    webhook = subscription["webhook_url"]
-                    email = subscription["email"]
-                    break
-            # craft message to be sent
-            section = str(class_data["section_number"])
-            print(section)
-            message = {
-                "class_name": class_data["name"],
-                "section": str(class_data["section_number"]),
-                "message": "You have been enrolled in " + class_data["name"] + ", section " + str(class_data["section_number"]) + ", by the registrar",
-                "webhook_url": webhook,
-                "email": email,
-            }
-            message = json.dumps(message)
-            #subscription_details = sub.get_subscription(next_student, class_id)
-            # message = "You have been enrolled in " + class_data["name"] + " by the registrar"
-            connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
-            channel = connection.channel()
-
-            channel.exchange_declare(exchange='enrollment_notifications', exchange_type='fanout')
-            channel.basic_publish(exchange='enrollment_notifications', routing_key='', body=message, properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent))
-            print(f" [x] Sent {message}")
-            connection.close()
-        else:
-            print("Student is not subscribed to this class")
-    else:
-        next_student = None
-    
-     # Update dropped table
-        class_table.update_item(
-            Key={"id": class_id},
-            UpdateExpression="SET dropped = list_append(dropped, :student_id)",
-            ExpressionAttributeValues={":student_id": [student_id]},
-    )
-  
     return {"message": "Student successfully dropped class"}
 
 
 # ==========================================wait list==========================================
 # Get all waiting lists for a student
 @router.get("/waitlist/students/{student_id}", tags=["Waitlist"])
-def view_all_waiting_lists(student_id: int, request: Request):
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
-
-        # Check if the current user's id matches the requested student_id
-        if r_flag:
-            if current_user != student_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
+@student_bulkhead
+async def view_all_waiting_lists(student_id: int, request: Request, identity: Optional[Identity] = Depends(get_identity)):
+    authorize(identity, student_id)
 
     # Retrieve waitlist entries for the specified student from redis
-    waitlist_data = wl.get_student_waitlist(student_id)
+    waitlist_data = await asyncio.to_thread(wl.get_student_waitlist, student_id)
         
     # Check if exist
     if not waitlist_data:
@@ -451,33 +488,17 @@ def view_all_waiting_lists(student_id: int, request: Request):
 
 # Get student position for a waitlist for a specific class a student is on
 @router.get("/waitlist/students/{student_id}/classes/{class_id}", tags=["Waitlist"])
-def view_position(student_id: int, class_id: int, request: Request):
+@student_bulkhead
+async def view_position(student_id: int, class_id: int, request: Request, identity: Optional[Identity] = Depends(get_identity)):
     
     # User Authentication
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
+    authorize(identity, student_id)
 
-        # Check if the current user's id matches the requested student_id
-        if r_flag:
-            if current_user != student_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
-
-    # Fetch student data from db
-    student_data = enrollment.get_user_item(student_id)
-
-    # Fetch class data from db
-    class_data = enrollment.get_class_item(class_id)
+    # Fetch student and class data from db concurrently
+    student_data, class_data = await asyncio.gather(
+        async_enrollment.get_user_item(student_id, USER_EXISTS),
+        async_enrollment.get_class_item(class_id, CLASS_EXISTS),
+    )
 
     # Check if the class and student exists in the database
     if not student_data or not class_data:
@@ -486,7 +507,8 @@ def view_position(student_id: int, class_id: int, request: Request):
         )
 
     # Retrieve waitlist position for the specified class from redis
-    waitlist_position = wl.get_class_waitlist(class_id).get(str(student_id))
+    waitlist = await asyncio.to_thread(wl.get_class_waitlist, class_id)
+    waitlist_position = waitlist.get(str(student_id))
         
     # Check if exist
     if not waitlist_position:
@@ -525,29 +547,13 @@ def view_position(student_id: int, class_id: int, request: Request):
 @router.put(
     "/waitlist/students/{student_id}/classes/{class_id}/drop", tags=["Waitlist"]
 )
-def remove_from_waitlist(student_id: int, class_id: int, request: Request):
-
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
+@student_bulkhead
+async def remove_from_waitlist(student_id: int, class_id: int, identity: Optional[Identity] = Depends(get_identity)):
 
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
-
-        # Check if the current user's id matches the requested student_id
-        if r_flag:
-            if current_user != student_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
+    authorize(identity, student_id)
 
     # get student information
-    student_data = wl.get_student_waitlist(student_id)
+    student_data = await asyncio.to_thread(wl.get_student_waitlist, student_id)
 
     # check if student exists
     if not student_data:
@@ -567,7 +573,7 @@ def remove_from_waitlist(student_id: int, class_id: int, request: Request):
         )
 
     # Delete student from waitlist enrollment
-    wl.remove_student_from_waitlists(student_id, class_id)
+    await asyncio.to_thread(wl.remove_student_from_waitlists, student_id, class_id)
 
     return {"message": "Student removed from the waiting list"}
 
@@ -577,36 +583,17 @@ def remove_from_waitlist(student_id: int, class_id: int, request: Request):
 @router.get(
     "/waitlist/instructors/{instructor_id}/classes/{class_id}", tags=["Waitlist"]
 )
-def view_current_waitlist(instructor_id: int, class_id: int, request: Request):
-
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role match2es 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
+@instructor_bulkhead
+async def view_current_waitlist(instructor_id: int, class_id: int, identity: Optional[Identity] = Depends(get_identity)):
 
-        # Check if the current user's id matches the requested instructor_id
-        if r_flag:
-            if current_user != instructor_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
+    authorize(identity, instructor_id)
 
-    # Getting the instructors id
-    user = get_table_resource(dynamodb, USER_TABLE)
-    user_response = user.get_item(Key={"id": instructor_id})
-    instructor_data = user_response.get("Item")
-
-    # Getting the Instructor class
-    classes = get_table_resource(dynamodb, CLASS_TABLE)
-    class_response = classes.get_item(Key={"id": class_id})
-    class_data = class_response.get("Item")
+    # Getting the instructor and the class concurrently. The class decides who may see
+    # its waitlist, so it is never served from the stale cache
+    instructor_data, class_data = await asyncio.gather(
+        flight.run(("user", instructor_id, USER_EXISTS), async_enrollment.get_user_item, instructor_id, USER_EXISTS),
+        flight.run(("class", class_id, CLASS_OWNER), async_enrollment.get_class_item, class_id, CLASS_OWNER),
+    )
 
     if not class_data or not instructor_data:
         raise HTTPException(
@@ -614,28 +601,18 @@ def view_current_waitlist(instructor_id: int, class_id: int, request: Request):
             detail="Instructor or Class not found",
         )
 
-    # fetch data from the instructor
-    instructor_data = wrapper.run_partiql(
-        f"SELECT * FROM {CLASS_TABLE} WHERE instructor_id = ? AND id = ?",
-        [instructor_id, class_id],
-    )
-
-    # Grabbing the first item in the list
-    if "Items" in instructor_data and instructor_data["Items"]:
-        retrieved_instructor_id = instructor_data["Items"][0].get("instructor_id")
-
-        # varifies that the instructor id matches the one provided
-        if retrieved_instructor_id != instructor_id:
-            # chcek if the instructor is assigned to the class
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Instructor not assigned to this class",
-            )
+    # chcek if the instructor is assigned to the class, from the class item already loaded
+    if class_data["instructor_id"] != instructor_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Instructor not assigned to this class",
+        )
 
     # Get the waitlist information for the class
-    class_waitlist_key = "class:{}:waitlist"
-    waitlist_data = r.zrange(
-        class_waitlist_key.format(class_id), 0, -1, withscores=True
+    waitlist_data = await flight.run(
+        ("waitlist", class_id),
+        asyncio.to_thread,
+        partial(r.zrange, class_waitlist_key.format(class_id), 0, -1, withscores=True),
     )
 
     # check if the waitlist class exists in redis
@@ -645,25 +622,17 @@ def view_current_waitlist(instructor_id: int, class_id: int, request: Request):
             detail="Class does not have a waitlist",
         )
 
+    # Convert binary data to integers
+    student_ids = [int(student_id.decode("utf-8")) for student_id, _ in waitlist_data]
+
+    # Fetch student names from the name cache
+    student_names = await get_student_names(student_ids)
+
     # Create a list to store the Waitlist_Instructor instances
     waitlist_list = []
 
     # Iterate through the query results and create Waitlist_Instructor instances
-    for student_id, score in waitlist_data:
-        # Convert binary data to integers
-        student_id = int(student_id.decode("utf-8"))
-
-        # Fetch student name based on student ID
-        result = wrapper.run_partiql(
-            f'SELECT * FROM "{USER_TABLE}" WHERE id=?', [student_id]
-        )
-
-        # Check if the result has items and fetch the student name
-        if "Items" in result and result["Items"]:
-            student_name = result["Items"][0]["name"]
-        else:
-            student_name = ""
-
+    for student_id, (_, score), student_name in zip(student_ids, waitlist_data, student_names):
         # Create Waitlist_Instructor instance
         waitlist_info = Waitlist_Instructor(
             student=Student(id=student_id, name=student_name),
@@ -676,35 +645,52 @@ def view_current_waitlist(instructor_id: int, class_id: int, request: Request):
 
 # ==========================================Instructor==================================================
 # view current enrollment for class
-@router.get(
-    "/instructors/{instructor_id}/classes/{class_id}/enrollment", tags=["Instructor"]
-)
-def get_instructor_enrollment(instructor_id: int, class_id: int, request: Request):
-    # Checks for the correct role. In this case, Instructor role is needed to gain access to class enrollment.
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
+# The sections an instructor teaches
+@router.get("/instructors/{instructor_id}/classes", tags=["Instructor"])
+@instructor_bulkhead
+async def get_instructor_sections(instructor_id: int, identity: Optional[Identity] = Depends(get_identity)):
+
+    authorize(identity, instructor_id)
+
+    # Getting the instructor, and their classes from the instructor index, concurrently
+    instructor_data, sections = await asyncio.gather(
+        flight.run(("user", instructor_id, USER_NAME), async_enrollment.get_user_item, instructor_id, USER_NAME),
+        flight.run(
+            ("sections", instructor_id), async_enrollment.get_instructor_classes, instructor_id, CLASS_SUMMARY
+        ),
+    )
 
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
+    if not instructor_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Instructor not found",
+        )
 
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
+    return {"Classes": [class_enroll(item, instructor_data["name"]) for item in sections]}
 
-        # Check if the current user's id matches the requested instructor_id
-        if r_flag:
-            if current_user != instructor_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
 
-    # @ Getting the user table resource and using it to retrieve the instructors id and classes
-    user = get_table_resource(dynamodb, USER_TABLE)
+@router.get(
+    "/instructors/{instructor_id}/classes/{class_id}/enrollment", tags=["Instructor"]
+)
+@instructor_bulkhead
+def get_instructor_enrollment(
+    instructor_id: int,
+    class_id: int,
+    identity: Optional[Identity] = Depends(get_identity),
+    limit: int = Query(ROSTER_PAGE_SIZE, ge=1, le=MAX_ROSTER_PAGE_SIZE),
+    cursor: Optional[int] = None,
+):
+    # Checks for the correct role. In this case, Instructor role is needed to gain access to class enrollment.
+    authorize(identity, instructor_id)
 
-    instructor_data = enrollment.get_user_item(instructor_id)
-    class_data = enrollment.get_class_item(class_id)
+    # @ Retrieve the instructor and the class, sharing reads already in flight. The class
+    # decides who may see its roster, so it is never served from the stale cache
+    instructor_data = flight.run_sync(
+        ("user", instructor_id, USER_EXISTS), enrollment.get_user_item, instructor_id, USER_EXISTS
+    )
+    class_data = flight.run_sync(
+        ("class", class_id, CLASS_OWNER), enrollment.get_class_item, class_id, CLASS_OWNER
+    )
 
     # Following if statements check if both the instructor and class exist
     if not instructor_data or not class_data:
@@ -713,83 +699,51 @@ def get_instructor_enrollment(instructor_id: int, class_id: int, request: Reques
             detail="Instructor and/or class not found",
         )
 
-    # @ BREIF: getting the instructor id and class id to verify if instructor teaches certain class
-    instructor_data = wrapper.run_partiql(
-        f"SELECT * FROM {CLASS_TABLE} WHERE instructor_id = ? AND id = ?",
-        [instructor_id, class_id],
-    )
-
-    # @ BREIF: Checks if the instructor data is not empty as well as the contents inside are not empty
-    if "Items" in instructor_data and instructor_data["Items"]:
-        # Grabbing the first item in the list
-        retrieved_instructor_id = instructor_data["Items"][0].get("instructor_id")
-        # verifies that the instructor id matches the one provided
-        if retrieved_instructor_id == instructor_id:
-            print("Instructor assigned to the class.")
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Instructor not assigned to this class",
-            )
-    else:
+    # @ BREIF: verify the instructor teaches the class, from the class item already loaded
+    if class_data["instructor_id"] != instructor_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Class not found or instructor not assigned to this class",
+            detail="Instructor not assigned to this class",
         )
 
-    # Getting list of enrolled students using partql
-    enrolled_students = wrapper.run_partiql(
-        f"SELECT enrolled FROM {CLASS_TABLE} WHERE id = ?", [class_id]
+    # Getting a page of enrolled students from the class roster
+    enrolled_list, next_cursor = flight.run_sync(
+        ("roster", class_id, ROSTER_ENROLLED, limit, cursor),
+        enrollment.get_roster_page, class_id, ROSTER_ENROLLED, limit, cursor,
     )
 
-    if "Items" in enrolled_students and enrolled_students["Items"]:
-        enrolled_data = enrolled_students["Items"][0].get("enrolled", [])
-
-        enrolled_list = []
-        for student_id in enrolled_data:
-            user_item = user.get_item(Key={"id": student_id})
-            if user_item and "Item" in user_item:
-                enrolled_list.append({
-                    "id": student_id,
-                    "name": user_item["Item"].get("name", "Unknown Name")
-                })
-        return {"Enrolled": enrolled_list}
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Class has no enrolled students",
-        )
+    return {"Enrolled": enrolled_list, "NextCursor": next_cursor}
 
 
-# view students who have dropped the class
+# view the drops from the class, newest first
 @router.get("/instructors/{instructor_id}/classes/{class_id}/drop", tags=["Instructor"])
-def get_instructor_dropped(instructor_id: int, class_id: int, request: Request):
+@instructor_bulkhead
+def get_instructor_dropped(
+    instructor_id: int,
+    class_id: int,
+    identity: Optional[Identity] = Depends(get_identity),
+    limit: int = Query(ROSTER_PAGE_SIZE, ge=1, le=MAX_ROSTER_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
 
     # User Authentication
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
+    authorize(identity, instructor_id)
 
-        # Check if the current user's id matches the requested instructor_id
-        if r_flag:
-            if current_user != instructor_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
-
-    # Getting the instructor id
-    user = get_table_resource(dynamodb, USER_TABLE)
+    # cursors are history entries, anything else would reach DynamoDB as a bad ExclusiveStartKey
+    if cursor is not None and not is_history_cursor(cursor):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
 
-    instructor_data = enrollment.get_user_item(instructor_id)
-    class_data = enrollment.get_class_item(class_id)
+    # Getting the instructor and the class, sharing reads already in flight. The class
+    # decides who may see its drops, so it is never served from the stale cache
+    instructor_data = flight.run_sync(
+        ("user", instructor_id, USER_EXISTS), enrollment.get_user_item, instructor_id, USER_EXISTS
+    )
+    class_data = flight.run_sync(
+        ("class", class_id, CLASS_OWNER), enrollment.get_class_item, class_id, CLASS_OWNER
+    )
 
     # checking if the instructor and class exists
     if not instructor_data or not class_data:
@@ -798,169 +752,94 @@ def get_instructor_dropped(instructor_id: int, class_id: int, request: Request):
             detail="Instructor and/or class not found",
         )
 
-    # getting the instructor id and class id
-    instructor_data = wrapper.run_partiql(
-        f"SELECT * FROM {CLASS_TABLE} WHERE instructor_id = ? AND id = ?",
-        [instructor_id, class_id],
-    )
-
-    # checking if the instructor is assigned to class
-    if "Items" in instructor_data and instructor_data["Items"]:
-        retrieved_instructor_id = instructor_data["Items"][0].get("instructor_id")
-        if retrieved_instructor_id == instructor_id:
-            print("Instructor assigned to the class.")
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Instructor not assigned to this class",
-            )
-    else:
+    # checking if the instructor is assigned to class, from the class item already loaded
+    if class_data["instructor_id"] != instructor_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Class not found or instructor not assigned to this class",
+            detail="Instructor not assigned to this class",
         )
 
-    # getting list of dropped students
-    dropped_students = wrapper.run_partiql(
-        f"SELECT dropped FROM {CLASS_TABLE} WHERE id = ?", [class_id]
+    # getting a page of drops from the class's drop history
+    dropped_list, next_cursor = flight.run_sync(
+        ("drops", class_id, limit, cursor),
+        enrollment.get_drop_history_page, class_id, limit, cursor,
     )
 
-    if "Items" in dropped_students and dropped_students["Items"]:
-        dropped_data = dropped_students["Items"][0].get("dropped", [])
-
-        dropped_list = [
-            {
-                "id": student_id,
-                "name": user.get_item(Key={"id": student_id}).get("Item")["name"],
-            }
-            for student_id in dropped_data
-        ]
-        return {"Dropped": dropped_list}
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Class has no dropped students",
-        )
+    return {"Dropped": dropped_list, "NextCursor": next_cursor}
 
 
 # Instructor administratively drop students
 @router.put("/instructors/{instructor_id}/classes/{class_id}/students/{student_id}/drop",tags=["Instructor"])
-def instructor_drop_class(instructor_id: int, class_id: int, student_id: int, request: Request):
-
-    class_table = get_table_resource(dynamodb, CLASS_TABLE)
+@instructor_bulkhead
+async def instructor_drop_class(instructor_id: int, class_id: int, student_id: int, identity: Optional[Identity] = Depends(get_identity)):
 
     # User Authentication
-    if request.headers.get("X-User"):
-        current_user = int(request.headers.get("X-User"))
-
-        roles_string = request.headers.get("X-Roles")
-        current_roles = roles_string.split(",")
-
-        r_flag = True
-        # Check if the current user's role matches 'registrar'
-        for role in current_roles:
-            if role == "registrar":
-                r_flag = False
-
-        # Check if the current user's id matches the requested instructor_id
-        if r_flag:
-            if current_user != instructor_id:
-                raise HTTPException(
-                    status_code=403, detail="Access forbidden, wrong user"
-                )
-
-    instructor_data = enrollment.get_user_item(instructor_id)
-    student_data = enrollment.get_user_item(student_id)
-    class_info = enrollment.get_class_item(class_id)
-
-    # checks if both student and instructor exist in db
-    if not instructor_data or not student_data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Instructor and/or student not found",
-        )
+    authorize(identity, instructor_id)
 
-    # getting the enrolled and dropped list of student ids in class table db
-    class_data = wrapper.run_partiql(
-        f"SELECT enrolled, dropped FROM {CLASS_TABLE} WHERE id = ?", [class_id]
+    # With the seat ledger, the drop is recorded in redis and written behind to DynamoDB
+    if settings.seat_ledger:
+        instructor_data, student_data = await asyncio.gather(
+            async_enrollment.get_user_item(instructor_id, USER_EXISTS),
+            async_enrollment.get_user_item(student_id, USER_NAME),
+        )
+        result = None
+        if instructor_data and student_data:
+            result = await run_ledger(ledger.drop, class_id, student_id, student_data["name"], drop_time())
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Instructor, student and/or class not found",
+            )
+        if result != LEDGER_APPLIED:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Student not enrolled in this class",
+            )
+        await asyncio.to_thread(releases.release_seat, class_id, student_id)
+        return {"Message": "Student successfully dropped"}
+
+    # fetch the instructor, student and class concurrently
+    instructor_data, student_data, class_info = await asyncio.gather(
+        async_enrollment.get_user_item(instructor_id, USER_EXISTS),
+        async_enrollment.get_user_item(student_id, USER_NAME),
+        async_enrollment.get_class_item(class_id, CLASS_EXISTS),
     )
 
-    # getting the first enrolled and dropped ids in the list
-    enrolled_data = class_data.get("Items", [])[0].get("enrolled", [])
-    dropped_data = class_data.get("Items", [])[0].get("dropped", [])
-
-    # Removes student_id from the enrolled list
-    if student_id in enrolled_data:
-        enrolled_data.remove(student_id)
-        print(f"Student {student_id} removed from enrolled list.")
-    else:
+    # checks if the student, instructor and class exist in db
+    if not instructor_data or not student_data or not class_info:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Student not enrolled in this class",
+            detail="Instructor, student and/or class not found",
         )
 
-    ###########################################################################################################
-    # This is where the waitlist logic will go
-    students = wl.get_class_waitlist(class_id)
-    if students:
-        next_student = int(min(students, key=students.get))
-        print(f"This is the top_student--- {next_student}")
-        #top_student = next_student[0][0].decode("utf-8")
-        wl.remove_student_from_waitlists(next_student, class_id)
-        class_table.update_item(
-            Key={"id": class_id},
-            UpdateExpression="SET enrolled = list_append(enrolled, :student_id)",
-            ExpressionAttributeValues={":student_id": [next_student]},
+    # Removes student_id from the enrolled set, if the server still has them enrolled
+    try:
+        dropped = await async_enrollment.update_class_item(
+            class_id,
+            "DELETE enrolled :student_ids",
+            {":student_id": student_id, ":student_ids": {student_id}},
+            condition="contains(enrolled, :student_id)",
         )
-        class_table.update_item(
-            Key={"id": class_id},
-            UpdateExpression="SET dropped = list_append(dropped, :student_id)",
-            ExpressionAttributeValues={":student_id": [student_id]},
+    except Exception as e:
+        print(f"Error updating lists: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error updating lists",
         )
-        
-        subscribed = sub.is_student_subscribed(next_student,class_id)
-        if subscribed:
-            sub.get_all_subscriptions(next_student)
-            for subscription in sub.get_all_subscriptions(next_student):
-                if subscription["class_id"] == class_id:
-                    webhook = subscription["webhook_url"]
-                    email = subscription["email"]
-                    break
-            # craft message to be sent 
-            message = {
-                "class_name": class_data["name"],
-                "section": str(class_data["section_number"]),
-                "message": "You have been enrolled in " + class_data["name"] + ", section " + str(class_data["section_number"]) + ", by the registrar",
-                "webhook_url": webhook,
-                "email": email,
-            }
-            message = json.dumps(message)
-            #subscription_details = sub.get_subscription(next_student, class_id)
-            # message = "You have been enrolled in " + class_data["name"] + " by the registrar"
-            connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
-            channel = connection.channel()
-
-            channel.exchange_declare(exchange='enrollment_notifications', exchange_type='fanout')
-            channel.basic_publish(exchange='enrollment_notifications', routing_key='', body=message, properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent))
-            print(f" [x] Sent {message}")
-            connection.close()
-        else:
-            print("Student is not subscribed to this class")
-    else:
-        next_student = None
+    if not dropped:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Student not enrolled in this class",
+        )
+    print(f"Student {student_id} removed from enrolled list.")
 
-    # DynamoDB updated with the modified enrolled and dropped lists
+    # and the roster and drop history
     try:
-        class_table = get_table_resource(dynamodb, CLASS_TABLE)
-        class_table.update_item(
-            Key={"id": class_id},
-            UpdateExpression="SET enrolled = :enrolled, dropped = :dropped",
-            ExpressionAttributeValues={
-                ":enrolled": enrolled_data +[next_student],
-                ":dropped": dropped_data + [student_id],
-            },
+        await async_enrollment.write_roster(
+            class_id,
+            deletes=[(student_id, ROSTER_ENROLLED)],
+            drops=[(student_id, student_data["name"], drop_time())],
         )
-        print(f"Student {student_id} added to dropped list.")
     except Exception as e:
         print(f"Error updating lists: {e}")
         raise HTTPException(
@@ -968,15 +847,19 @@ def instructor_drop_class(instructor_id: int, class_id: int, student_id: int, re
             detail="Error updating lists",
         )
 
+    # the promotion worker fills the released seat from the waitlist
+    await asyncio.to_thread(releases.release_seat, class_id, student_id)
+
     return {"Message": "Student successfully dropped"}
 
 
 # ==========================================registrar==================================================
 # Create a new class
 @router.post("/registrar/classes/", tags=["Registrar"])
+@registrar_bulkhead
 def create_class(class_data: Class):
 
-    existing_class = enrollment.get_class_item(class_data.id)
+    existing_class = enrollment.get_class_item(class_data.id, CLASS_EXISTS)
 
     if existing_class:
         raise HTTPException(
@@ -987,6 +870,24 @@ def create_class(class_data: Class):
     try:
         
         enrollment.add_class(class_data)
+
+        # Add any students the class was created with to its roster,
+        # and any it was created with as dropped to its drop history
+        roster_entries = []
+        for student_id in class_data.enrolled:
+            student_data = enrollment.get_user_item(student_id, USER_NAME)
+            if student_data:
+                roster_entries.append((class_data.id, student_id, student_data["name"], ROSTER_ENROLLED))
+        enrollment.add_roster_entries(roster_entries)
+
+        dropped_at = drop_time()
+        history_entries = []
+        for student_id in class_data.dropped:
+            student_data = enrollment.get_user_item(student_id, USER_NAME)
+            if student_data:
+                history_entries.append((class_data.id, student_id, student_data["name"], dropped_at))
+        enrollment.add_drop_history(history_entries)
+
         return {"Message": f"Class with ID {class_data.id} created successfully"}
 
     except Exception as e:
@@ -998,10 +899,11 @@ def create_class(class_data: Class):
 
 # Remove a class
 @router.delete("/registrar/classes/{class_id}", tags=["Registrar"])
+@registrar_bulkhead
 def remove_class(class_id: int):
 
     # fetch the class data 
-    class_data = enrollment.get_class_item(class_id)
+    class_data = enrollment.get_class_item(class_id, CLASS_EXISTS)
 
     # check if the class exists in the database
     if not class_data:
@@ -1010,15 +912,19 @@ def remove_class(class_id: int):
         )
     
     enrollment.delete_class_item(class_id)
+    enrollment.delete_roster(class_id)
+    enrollment.delete_drop_history(class_id)
+    ledger.delete_class(class_id)
 
     return {"message": "Class removed successfully"}
 
 
 # Change the assigned instructor for a class
 @router.put("/registrar/classes/{class_id}/instructors/{instructor_id}", tags=["Registrar"])
+@registrar_bulkhead
 def change_instructor(class_id: int, instructor_id: int):
-    # fetch class data
-    class_data = enrollment.get_class_item(class_id)
+    # fetch class data, only its current instructor is needed
+    class_data = enrollment.get_class_item(class_id, CLASS_OWNER)
 
     # check if the class exists in the database
     if not class_data:
@@ -1027,7 +933,7 @@ def change_instructor(class_id: int, instructor_id: int):
         )
 
     # fetch instructor data
-    instructor_data = enrollment.get_user_item(instructor_id)
+    instructor_data = enrollment.get_user_item(instructor_id, USER_EXISTS)
 
     # check if the instructor exists in the data
     if not instructor_data:
@@ -1043,7 +949,7 @@ def change_instructor(class_id: int, instructor_id: int):
     
     # fetch the enrollment table from the database
     # update the instructor to the new class 
-    class_table = get_table_resource(dynamodb, CLASS_TABLE)
+    class_table = get_table(CLASS_TABLE)
     class_table.update_item(
         Key={
             'id': class_id
@@ -1057,6 +963,7 @@ def change_instructor(class_id: int, instructor_id: int):
 
 # Freeze enrollment for classes
 @router.put("/registrar/automatic-enrollment/freeze", tags=["Registrar"])
+@registrar_bulkhead
 def freeze_automatic_enrollment():
     global FREEZE
     if FREEZE:
@@ -1069,13 +976,14 @@ def freeze_automatic_enrollment():
 
 # Create a new user (used by the user service to duplicate user info)
 @router.post("/registrar/create_user", tags=["Registrar"])
+@registrar_bulkhead
 def create_user(user: Create_User):
 
     if DEBUG:
         print("username: ", user.name)
         print("roles: ", user.roles)
 
-    user_table = get_table_resource(dynamodb,USER_TABLE)
+    user_table = get_table(USER_TABLE)
     response_id = user_table.scan(
         Select='COUNT',
         FilterExpression= Key('id').gte(0)
@@ -1091,6 +999,7 @@ def create_user(user: Create_User):
     }
 
     enrollment.add_user(user_data)
+    user_names.set_names({new_id: user.name})
 
     return {"Message": f'user created successfully. {user.name} Assigned id = {new_id}'}
 
@@ -1103,10 +1012,11 @@ def create_user(user: Create_User):
 
 # Gets currently enrolled classes for a student
 @router.get("/debug/students/{student_id}/enrolled", tags=["Debug"])
+@debug_bulkhead
 def view_enrolled_classes(student_id: int):
 
     # Check if the student exists in the database
-    student_data = enrollment.get_user_item(student_id)
+    student_data = debug_enrollment.get_user_item(student_id, USER_EXISTS)
 
     if not student_data:
         raise HTTPException(
@@ -1114,7 +1024,7 @@ def view_enrolled_classes(student_id: int):
         )
 
     # Check if the student is enrolled in any classes
-    class_table = get_table_resource(dynamodb, CLASS_TABLE)
+    class_table = get_table(CLASS_TABLE, DEBUG_POOL)
     response = class_table.scan(
         FilterExpression='contains(enrolled, :student_id)',
         ExpressionAttributeValues={':student_id': student_id}
@@ -1133,7 +1043,7 @@ def view_enrolled_classes(student_id: int):
     # Iterate through the query results and create Class instances
     for item in enrolled_data:
         # get instructor information
-        instructor_data = enrollment.get_user_item(item["instructor_id"])
+        instructor_data = debug_enrollment.get_user_item(item["instructor_id"], USER_NAME)
         # Get waitlist information
         if item["current_enroll"] > item["max_enroll"]:
             current_enroll = item["max_enroll"]
@@ -1163,6 +1073,7 @@ def view_enrolled_classes(student_id: int):
 
 # Get all classes with active waiting lists
 @router.get("/debug/waitlist/classes", tags=["Debug"])
+@debug_bulkhead
 def view_all_class_waitlists():
 
     # fetch all relevant waitlist information
@@ -1186,7 +1097,7 @@ def view_all_class_waitlists():
         student_ids = class_waitlist.keys()
         student_ids_list = list(student_ids)
         for sid in student_ids_list:
-            student_data = enrollment.get_user_item(int(sid))
+            student_data = debug_enrollment.get_user_item(int(sid), USER_NAME)
             wl_inst = Waitlist_Instructor(
                 student=Student(
                     id=student_data["id"],
@@ -1207,46 +1118,105 @@ def view_all_class_waitlists():
 # Search for specific users based on optional parameters,
 # if no parameters are given, returns all users
 @router.get("/debug/search", tags=["Debug"])
+@debug_bulkhead
 def search_for_users(id: Optional[int] = None, name: Optional[str] = None, role: Optional[str] = None):
     
-    table = get_table_resource(dynamodb, USER_TABLE)
-
-    # Construct the query based on the provided parameters
-    key_condition_expression = None
-    filter_expression = None
+    table = get_table(USER_TABLE, DEBUG_POOL)
 
+    # Look users up by key or by the name index where possible, and only scan for roles
     if id is not None:
-        key_condition_expression = Key('id').eq(id)
+        user = debug_enrollment.get_user_item(id)
+        user_data = [user] if user else []
     elif name is not None:
-        filter_expression = Attr('name').eq(name)
+        user_data = debug_enrollment.get_users_by_name(name)
     elif role is not None:
-        filter_expression = Attr('roles').contains(role)
-
-    # Perform the query
-    if key_condition_expression is not None:
-        response = table.query(
-            IndexName='id-index',
-            KeyConditionExpression=key_condition_expression
-        )
-    elif filter_expression is not None:
-        response = table.scan(
-            IndexName='id-index',
-            FilterExpression=filter_expression
-        )
+        user_data = list(debug_enrollment.parallel_scan(
+            table,
+            FilterExpression=Attr('roles').contains(role)
+        ))
     else:
         # If no parameters provided, return all users
-        response = table.scan(IndexName='id-index')
+        user_data = list(debug_enrollment.parallel_scan(table))
 
-    user_data = response.get('Items', [])
+    # Segments come back in no particular order
+    user_data.sort(key=lambda item: item['id'])
     return {"Users": user_data}
 
 
 # List all classes
 @router.get("/debug/classes", tags=["Debug"])
-def list_all_classes():
+@debug_bulkhead
+def list_all_classes(department: Optional[str] = None, course_code: Optional[str] = None):
 
-    table = get_table_resource(dynamodb, CLASS_TABLE)
-    response = table.scan(IndexName='id-index')
+    # Classes in a department, or one of its courses, come from the department index
+    if department is not None:
+        class_data = debug_enrollment.get_department_classes(department, course_code)
+    else:
+        table = get_table(CLASS_TABLE, DEBUG_POOL)
+        class_data = debug_enrollment.parallel_scan(table)
+    class_data = sorted(class_data, key=lambda item: item['id'])
 
-    class_data = response.get('Items', [])
     return {"Users": class_data}
+
+
+def ndjson_chunks(items):
+    # One JSON document per line, a few lines per chunk
+    chunk = []
+    for item in items:
+        chunk.append(json.dumps(jsonable_encoder(item)))
+        if len(chunk) >= EXPORT_CHUNK_ITEMS:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+# Export a whole table as newline delimited JSON, streamed as it's scanned
+@router.get("/debug/export/{table}", tags=["Debug"])
+async def export_table(table: str, segments: int = Query(SCAN_SEGMENTS, ge=1, le=MAX_SCAN_SEGMENTS)):
+
+    tables = {
+        "classes": CLASS_TABLE,
+        "users": USER_TABLE,
+        "roster": ROSTER_TABLE,
+        "drops": DROP_HISTORY_TABLE,
+    }
+    if table not in tables:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Table must be one of {', '.join(tables)}",
+        )
+
+    # The table is looked up on every request, so one created after startup can be exported,
+    # and a missing one is a 404 instead of an error once the stream has started
+    table_name = tables[table]
+    if not await asyncio.to_thread(debug_enrollment.check_table_exists, table_name):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Table {table_name} does not exist",
+        )
+
+    # Reject now if the debug routes are saturated, the stream holds a debug slot while it runs
+    debug_bulkhead.check_capacity()
+    items = debug_enrollment.parallel_scan(get_table(table_name, DEBUG_POOL), segments)
+    return StreamingResponse(
+        debug_bulkhead.stream(ndjson_chunks(items)), media_type="application/x-ndjson"
+    )
+
+
+@router.get("/debug/singleflight", tags=["Debug"])
+def view_singleflight_stats():
+    # Calls, backend executions and the share of calls coalesced, per read group, for this worker
+    return {"SingleFlight": flight.stats()}
+
+
+@router.get("/debug/stale", tags=["Debug"])
+def view_stale_cache_stats():
+    # Fresh hits, stale copies served, misses and refreshes of the stale cache, for this worker
+    return {"StaleCache": stale.stats()}
+
+
+@router.get("/debug/bulkheads", tags=["Debug"])
+def view_bulkhead_stats():
+    # Slots in use, queue depth, rejections and average queue wait per route group, for this worker
+    return {"Bulkheads": bulkhead_stats()}
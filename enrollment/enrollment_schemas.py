@@ -5,6 +5,7 @@ from typing import List
 class Settings(BaseSettings, env_file=".env", extra="ignore"):
     enrollment_database: str
     enrollment_logging_config: str
+    seat_ledger: bool = False
 
 class Instructor(BaseModel):
     id: int
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+
+class _Call:
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent backend reads in one worker: while a call for a
+    key is in flight, other callers with the same key wait for it and share its
+    result instead of making the same call again. Nothing is cached, the next call
+    after it finishes runs again.
+
+    Keys are tuples whose first item names the group the call is counted under.
+    Shared results are the same object for every caller, so callers must not mutate them.
+    """
+
+    def __init__(self):
+        self.async_calls = {}
+        self.sync_calls = {}
+        self.lock = threading.Lock()
+        # group -> [calls, executions]
+        self.counters = {}
+
+
+    def record(self, group, executed):
+        with self.lock:
+            counter = self.counters.setdefault(group, [0, 0])
+            counter[0] += 1
+            counter[1] += executed
+
+
+    async def run(self, key, func, *args):
+        """
+        Awaits func(*args), or the call already in flight for key.
+
+        :param key: A hashable tuple identifying the call, starting with its group name.
+        :param func: An async function.
+        :return: The call's result.
+        """
+        future = self.async_calls.get(key)
+        self.record(key[0], future is None)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.async_calls[key] = future
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # mark it retrieved, so there is no warning when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.async_calls[key]
+
+
+    def run_sync(self, key, func, *args):
+        """
+        Calls func(*args), or waits for the call already in flight for key on another thread.
+        For the sync routes, which FastAPI runs on its threadpool.
+
+        :param key: A hashable tuple identifying the call, starting with its group name.
+        :param func: A function.
+        :return: The call's result.
+        """
+        with self.lock:
+            call = self.sync_calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.sync_calls[key] = _Call()
+        self.record(key[0], leader)
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.sync_calls[key]
+            call.event.set()
+
+
+    def stats(self):
+        """
+        :return: A dictionary of group -> calls, executions, and coalescing_ratio,
+        the share of calls that were served by another call's result.
+        """
+        with self.lock:
+            return {
+                group: {
+                    "calls": calls,
+                    "executions": executions,
+                    "coalescing_ratio": round(1 - executions / calls, 4) if calls else 0.0,
+                }
+                for group, (calls, executions) in self.counters.items()
+            }
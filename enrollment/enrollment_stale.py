@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from pydantic_settings import BaseSettings
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 1024
+
+
+class StaleSettings(BaseSettings, env_file=".env", extra="ignore"):
+    # How long a read waits on the backend before a stale copy is served instead,
+    # well under KrakenD's 3000 ms timeout
+    stale_after: float = 0.5
+    # Per route: how old a cached copy may be and still be served without asking the
+    # backend, and how old it may be when it's served because the backend is slow or failing
+    stale_catalog_fresh_for: float = 0.0
+    stale_catalog_max_stale: float = 30.0
+
+
+settings = StaleSettings()
+
+
+@dataclass(frozen=True)
+class StalePolicy:
+    fresh_for: float
+    max_stale: float
+    stale_after: float = settings.stale_after
+
+
+CATALOG_POLICY = StalePolicy(settings.stale_catalog_fresh_for, settings.stale_catalog_max_stale)
+
+
+class StaleCache:
+    """
+    Stale-while-revalidate cache for reads in one worker. A read older than its route's
+    policy allows starts a refresh, at most one per key, and waits for it. If the backend
+    takes longer than stale_after, or fails, a copy no older than max_stale is served while
+    the refresh carries on in the background, and so is every read of the key that arrives
+    while that refresh is still running. Reads return the copy's age in seconds, or
+    None when the value came straight from the backend, for the Age header.
+
+    Cached values are shared by every caller, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        # key -> (value, monotonic time fetched)
+        self.entries = OrderedDict()
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.counters = {"fresh": 0, "stale": 0, "miss": 0, "refreshes": 0, "refresh_errors": 0}
+
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, None
+            self.entries.move_to_end(key)
+            return entry[0], time.monotonic() - entry[1]
+
+
+    def store(self, key, value):
+        # Missing items aren't cached, so new ones show up straight away
+        if value is None:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+    async def refresh(self, key, func, args):
+        try:
+            value = await func(*args)
+        except Exception:
+            self.count("refresh_errors")
+            raise
+        self.store(key, value)
+        self.count("refreshes")
+        return value
+
+
+    def is_fresh(self, policy, value, age):
+        if value is not None and age <= policy.fresh_for:
+            self.count("fresh")
+            return True
+        return False
+
+
+    def fall_back(self, key, value, age, reason):
+        # Only reached with a copy no older than max_stale
+        logger.info("Serving %s from cache, %.1f s old: %r", key, age, reason)
+        self.count("stale")
+        return value, age
+
+
+    async def get(self, key, policy, func, *args):
+        """
+        Reads a value through the cache from an async function.
+
+        :param key: A hashable key for the read.
+        :param policy: The route's StalePolicy.
+        :param func: The async function that reads the value from the backend.
+        :return: A tuple of (value, age in seconds or None if it was read just now).
+        """
+        value, age = self.lookup(key)
+        if self.is_fresh(policy, value, age):
+            return value, age
+
+        task = self.tasks.get(key)
+        started = task is None
+        if started:
+            task = asyncio.ensure_future(self.refresh(key, func, args))
+            self.tasks[key] = task
+            task.add_done_callback(lambda done: self.finish_task(key, done))
+
+        if value is None or age > policy.max_stale:
+            self.count("miss")
+            return await asyncio.shield(task), None
+        if not started:
+            return self.fall_back(key, value, age, "refresh already running")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), policy.stale_after), None
+        except Exception as e:
+            return self.fall_back(key, value, age, e)
+
+
+    def finish_task(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        # Retrieve errors from refreshes nobody waited for, they were counted already
+        if not task.cancelled():
+            task.exception()
+
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries), refreshing=len(self.tasks))
+
+
+def age_header(response, age):
+    """
+    Sets the Age header when a response was served from the cache.
+
+    :param response: The route's Response.
+    :param age: The age returned by StaleCache, or None.
+    """
+    if age is not None:
+        response.headers["Age"] = str(int(age))
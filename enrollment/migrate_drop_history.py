@@ -0,0 +1,84 @@
+"""
+Moves the dropped students of existing classes out of the class items and into
+the drop history table, creating the table if it doesn't exist yet. Class items
+used to keep every student who dropped in a dropped attribute, which the routes
+no longer read or write; the drop history is appended to instead and read a
+page at a time.
+
+The old data doesn't say when each student dropped, so the moved entries are
+dated with the time of the migration. A class's dropped attribute is only
+removed if it still has as many students as were moved, otherwise the class is
+read again and moved once more, so drops made meanwhile by services that haven't
+been restarted yet aren't lost. Entries are keyed by the run's time and the
+student, so moving a class again writes the same items, and the tool is safe
+to run more than once.
+
+Run from the main directory:
+
+    python -m enrollment.migrate_drop_history
+"""
+from botocore.exceptions import ClientError
+
+from enrollment.enrollment_clients import get_dynamodb_resource
+from enrollment.enrollment_dynamo import Enrollment, USER_NAME, drop_time, table_prefix
+
+
+def migrate_class(enrollment, class_id, dropped, dropped_at):
+    """
+    Moves one class's dropped students to the drop history and removes its dropped attribute.
+
+    :param enrollment: An Enrollment.
+    :param class_id: The integer id of the class.
+    :param dropped: The class's dropped attribute, a list or a number set of student ids.
+    :param dropped_at: The time to date the moved entries with, in milliseconds since the epoch.
+    :return: Boolean based on if the attribute was removed, False if the class changed meanwhile.
+    """
+    entries = []
+    for student_id in sorted({int(student_id) for student_id in dropped}):
+        user = enrollment.get_user_item(student_id, USER_NAME)
+        entries.append((class_id, student_id, user["name"] if user else "", dropped_at))
+    if entries:
+        enrollment.add_drop_history(entries)
+
+    try:
+        enrollment.classes.update_item(
+            Key={"id": class_id},
+            UpdateExpression="REMOVE dropped",
+            ConditionExpression="size(dropped) = :count",
+            ExpressionAttributeValues={":count": len(dropped)},
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+    return True
+
+
+def main():
+    enrollment = Enrollment(get_dynamodb_resource())
+    if not enrollment.check_table_exists(table_prefix + "drop_history"):
+        print("Creating the drop history table")
+        enrollment.create_table("drop_history")
+
+    dropped_at = drop_time()
+    scanned = moved = 0
+    for item in enrollment.parallel_scan(
+        enrollment.classes,
+        ProjectionExpression="id, dropped",
+        FilterExpression="attribute_exists(dropped)",
+    ):
+        scanned += 1
+        class_id = int(item["id"])
+        dropped = item["dropped"]
+        # read the class again until its dropped students are moved or there are none left
+        while not migrate_class(enrollment, class_id, dropped, dropped_at):
+            current = enrollment.get_class_item(class_id, ("id", "dropped"))
+            if not current or "dropped" not in current:
+                break
+            dropped = current["dropped"]
+        moved += len(dropped)
+    print(f"Moved {moved} drops of {scanned} classes to the drop history")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Brings the global secondary indexes of existing class and user tables in line
+with the schema in enrollment_dynamo.py: creates the instructor, department and
+name indexes the routes now query, then deletes the old id-index, which only
+repeated the tables' own hash key and doubled the cost of every write.
+
+DynamoDB changes one index at a time, so each step waits for the table to be
+active again. Indexes that already exist are left alone, so the tool is safe to
+run more than once. Run it before deploying the routes that query the new
+indexes. With --keep-legacy-index the old index is kept, so services that still
+scan it keep working until they're restarted; run it again without the flag
+afterwards to delete it.
+
+Run from the main directory:
+
+    python -m enrollment.migrate_indexes [--keep-legacy-index]
+"""
+import argparse
+
+from enrollment.enrollment_clients import get_dynamodb_resource
+from enrollment.enrollment_dynamo import Enrollment, CLASS_INDEXES, USER_INDEXES, LEGACY_ID_INDEX
+
+
+def migrate_table(enrollment, table, indexes, keep_legacy_index):
+    """
+    Creates a table's missing indexes, then deletes its legacy id index.
+
+    :param enrollment: An Enrollment.
+    :param table: The DynamoDB table object.
+    :param indexes: A dictionary of index name to key schema the table should have.
+    :param keep_legacy_index: Boolean based on if the legacy id index should be kept for now.
+    """
+    existing = enrollment.secondary_indexes(table)
+    for index_name, key_schema in indexes.items():
+        if index_name in existing:
+            print(f"{table.name}: {index_name} already exists")
+            continue
+        print(f"{table.name}: creating {index_name}")
+        enrollment.create_secondary_index(table, index_name, key_schema)
+
+    if LEGACY_ID_INDEX in existing:
+        if keep_legacy_index:
+            print(f"{table.name}: keeping {LEGACY_ID_INDEX} for now")
+        else:
+            print(f"{table.name}: deleting {LEGACY_ID_INDEX}")
+            enrollment.delete_secondary_index(table, LEGACY_ID_INDEX)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keep-legacy-index", action="store_true")
+    args = parser.parse_args()
+
+    enrollment = Enrollment(get_dynamodb_resource())
+    migrate_table(enrollment, enrollment.classes, CLASS_INDEXES, args.keep_legacy_index)
+    migrate_table(enrollment, enrollment.users, USER_INDEXES, args.keep_legacy_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Converts the enrolled attribute of existing class items from DynamoDB lists
+to number sets, which the routes now update with ADD and DELETE. Empty lists
+are removed, since DynamoDB can't store an empty set. Each item is updated on
+the condition that its attribute is still a list, so the tool is safe to run
+more than once and alongside the running services. The dropped attribute is
+moved out of the class items by migrate_drop_history instead.
+
+Run from the main directory:
+
+    python -m enrollment.migrate_number_sets
+"""
+from botocore.exceptions import ClientError
+
+from enrollment.enrollment_clients import get_table
+
+CLASS_TABLE = "enrollment_class"
+SET_ATTRIBUTES = ("enrolled",)
+
+
+def migrate_item(table, item):
+    """
+    Rewrites one class item's list attributes as number sets.
+
+    :param table: The class table.
+    :param item: The class item, as scanned.
+    :return: Boolean based on if the item was changed.
+    """
+    sets, removes, conditions = [], [], []
+    values = {":list": "L"}
+    for attribute in SET_ATTRIBUTES:
+        if not isinstance(item.get(attribute), list):
+            continue
+        conditions.append(f"attribute_type({attribute}, :list)")
+        student_ids = {int(student_id) for student_id in item[attribute]}
+        if student_ids:
+            sets.append(f"{attribute} = :{attribute}")
+            values[f":{attribute}"] = student_ids
+        else:
+            removes.append(attribute)
+    if not conditions:
+        return False
+
+    update_expression = ""
+    if sets:
+        update_expression += "SET " + ", ".join(sets) + " "
+    if removes:
+        update_expression += "REMOVE " + ", ".join(removes)
+    try:
+        table.update_item(
+            Key={"id": item["id"]},
+            UpdateExpression=update_expression.strip(),
+            ConditionExpression=" AND ".join(conditions),
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+    return True
+
+
+def main():
+    table = get_table(CLASS_TABLE)
+    scan_kwargs = {"ProjectionExpression": "id, enrolled"}
+    scanned = migrated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            scanned += 1
+            migrated += migrate_item(table, item)
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    print(f"Migrated {migrated} of {scanned} classes to number sets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Fills the roster table from the enrolled sets of existing classes, creating the
+table if it doesn't exist yet. The instructor enrollment endpoint reads the
+roster instead of the class items, so without this every class that had
+students before the roster existed would show an empty roster.
+
+Each class's roster is brought in line with its enrolled set: missing students
+are added and students no longer enrolled are removed. The roster is read
+before the class, and the enroll and drop routes change the class before the
+roster, so an enroll made meanwhile by a restarted service is never removed.
+The tool is safe to run more than once.
+
+Run from the main directory:
+
+    python -m enrollment.migrate_roster
+"""
+from enrollment.enrollment_clients import get_dynamodb_resource
+from enrollment.enrollment_dynamo import (
+    Enrollment, ROSTER_ENROLLED, USER_NAME, roster_item, roster_key, table_prefix,
+)
+
+CLASS_ENROLLED = ("id", "enrolled")
+
+
+def roster_students(enrollment, class_id):
+    """
+    Gets every student on a class's roster.
+
+    :param enrollment: An Enrollment.
+    :param class_id: The integer id of a class.
+    :return: A set of integer student ids.
+    """
+    student_ids = set()
+    cursor = None
+    while True:
+        students, cursor = enrollment.get_roster_page(class_id, ROSTER_ENROLLED, 500, cursor)
+        student_ids.update(int(student["id"]) for student in students)
+        if cursor is None:
+            return student_ids
+
+
+def migrate_class(enrollment, class_id):
+    """
+    Brings one class's roster in line with its enrolled set.
+
+    :param enrollment: An Enrollment.
+    :param class_id: The integer id of the class.
+    :return: A tuple of (students added, students removed).
+    """
+    on_roster = roster_students(enrollment, class_id)
+    class_data = enrollment.get_class_item(class_id, CLASS_ENROLLED)
+    if not class_data:
+        return 0, 0
+    enrolled = {int(student_id) for student_id in class_data.get("enrolled", ())}
+
+    added = sorted(enrolled - on_roster)
+    removed = sorted(on_roster - enrolled)
+    with enrollment.roster.batch_writer() as batch:
+        for student_id in added:
+            user = enrollment.get_user_item(student_id, USER_NAME)
+            batch.put_item(Item=roster_item(class_id, student_id, user["name"] if user else "", ROSTER_ENROLLED))
+        for student_id in removed:
+            batch.delete_item(Key=roster_key(class_id, student_id, ROSTER_ENROLLED))
+    return len(added), len(removed)
+
+
+def main():
+    enrollment = Enrollment(get_dynamodb_resource())
+    if not enrollment.check_table_exists(table_prefix + "roster"):
+        print("Creating the roster table")
+        enrollment.create_table("roster")
+
+    scanned = added = removed = 0
+    for item in enrollment.parallel_scan(enrollment.classes, ProjectionExpression="id"):
+        scanned += 1
+        class_added, class_removed = migrate_class(enrollment, int(item["id"]))
+        added += class_added
+        removed += class_removed
+    print(f"Added {added} and removed {removed} roster entries for {scanned} classes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 import redis
-import boto3
 import logging
 
+from enrollment_clients import get_dynamodb_resource
 from enrollment_schemas import Class, Enroll, User_info
-from enrollment_dynamo import Enrollment, PartiQL
-from enrollment_redis import Waitlist
+from enrollment_dynamo import Enrollment, PartiQL, ROSTER_ENROLLED, drop_time
+from enrollment_redis import Waitlist, UserNames
 
 
 # turn debug print statements on or off
@@ -18,7 +18,7 @@ logger = logging.getLogger(__name__)
 r = redis.Redis(db=1)
 
 # Connect to DynamoDB
-dynamodb = boto3.resource('dynamodb', endpoint_url='http://localhost:5500')
+dynamodb = get_dynamodb_resource()
 table_prefix = "enrollment_"
 
 # Lists of dummy names
@@ -282,17 +282,27 @@ for index, class_data in enumerate(sample_classes, start = 1):
 def create_database(enrollment, wrapper, waitlist):
     classes = "class"
     users = "user"
+    roster = "roster"
+    drop_history = "drop_history"
     class_table = table_prefix + classes
     user_table = table_prefix + users
+    roster_table = table_prefix + roster
+    drop_history_table = table_prefix + drop_history
     
     # Check if the tables exist, if they do delete them
     if enrollment.check_table_exists(class_table):
         enrollment.delete_table(classes)
         enrollment.delete_table(users)
+    if enrollment.check_table_exists(roster_table):
+        enrollment.delete_table(roster)
+    if enrollment.check_table_exists(drop_history_table):
+        enrollment.delete_table(drop_history)
 
     # create the tables
     enrollment.create_table(classes)
     enrollment.create_table(users)
+    enrollment.create_table(roster)
+    enrollment.create_table(drop_history)
 
     # initialize the tables with sample data
     for class_data in sample_classes:
@@ -301,9 +311,27 @@ def create_database(enrollment, wrapper, waitlist):
     for user_data in sample_users:
         enrollment.add_user(user_data)
 
+    # build the class rosters from the enrolled students of each class,
+    # and the drop histories from the dropped ones
+    user_names = {user_data.id: user_data.name for user_data in sample_users}
+    enrollment.add_roster_entries(
+        (class_data.id, student_id, user_names[student_id], ROSTER_ENROLLED)
+        for class_data in sample_classes
+        for student_id in class_data.enrolled
+    )
+    dropped_at = drop_time()
+    enrollment.add_drop_history(
+        (class_data.id, student_id, user_names[student_id], dropped_at)
+        for class_data in sample_classes
+        for student_id in class_data.dropped
+    )
+
     # flush all data from the redis db
     r.flushdb()
 
+    # warm the student name cache used by the instructor waitlist view
+    UserNames().set_names(user_names)
+
     # initialize the redis db with waitlist information
     for enrollment_data in sample_enrollments:
         if enrollment_data.placement > 30:
@@ -1,35 +1,47 @@
 import redis
-import boto3
 
-from fastapi import APIRouter, HTTPException
-from enrollment.enrollment_dynamo import Enrollment
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from enrollment.enrollment_auth import Identity, authorize, get_identity
+from enrollment.enrollment_clients import get_dynamodb_resource
+from enrollment.enrollment_dynamo import Enrollment, CLASS_EXISTS, USER_EXISTS
+from enrollment.enrollment_idempotency import IdempotentRoute
 from enrollment.enrollment_redis import Subscription
 from notification.notification_schema import Sub_List
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
 
 # Connect to Redis
 r = redis.Redis(db=2)
 
-# Connect to DynamoDB
-dynamodb = boto3.resource("dynamodb", endpoint_url="http://localhost:5500")
+# Connect to DynamoDB through the shared, tuned client
+dynamodb = get_dynamodb_resource()
 
 # Create class items
 enrollment = Enrollment(dynamodb)
 sub = Subscription()
 
+
+# Convert any subscriptions stored in the old JSON format
+@router.on_event("startup")
+def migrate_subscriptions():
+    sub.migrate_subscriptions()
+
 # ==========================================endpoints==================================================
 
 # Subscribe to notifications for a new course
 @router.post("/students/{student_id}/subscribe/{class_id}", tags=["Notification"])
-def subscribe_to_course(student_id: int, class_id: int, email: str = "", webhook_url: str = ""):
+def subscribe_to_course(student_id: int, class_id: int, email: str = "", webhook_url: str = "", identity: Optional[Identity] = Depends(get_identity)):
+
+    # User Authentication
+    authorize(identity, student_id)
 
     # Check if student and class exist
     # Fetch student data from db
-    student_data = enrollment.get_user_item(student_id)
+    student_data = enrollment.get_user_item(student_id, USER_EXISTS)
 
     # Fetch class data from db
-    class_data = enrollment.get_class_item(class_id)
+    class_data = enrollment.get_class_item(class_id, CLASS_EXISTS)
 
     # Check if exist
     if not student_data or not class_data:
@@ -64,11 +76,14 @@ def subscribe_to_course(student_id: int, class_id: int, email: str = "", webhook
 
 # List all subscriptions for a student
 @router.get("/students/{student_id}/subscriptions", tags=["Notification"])
-def list_current_subscriptions(student_id: int):
+def list_current_subscriptions(student_id: int, identity: Optional[Identity] = Depends(get_identity)):
+
+    # User Authentication
+    authorize(identity, student_id)
 
     # check if student exists
     # Fetch student data from db
-    student_data = enrollment.get_user_item(student_id)
+    student_data = enrollment.get_user_item(student_id, USER_EXISTS)
 
     if not student_data:
         raise HTTPException(
@@ -93,14 +108,17 @@ def list_current_subscriptions(student_id: int):
 
 # Allow student to unsubscribe from a course
 @router.delete("/students/{student_id}unsubscribe/{class_id}", tags=["Notification"])
-def unsubscribe_from_course(student_id: int, class_id: int):
-    
+def unsubscribe_from_course(student_id: int, class_id: int, identity: Optional[Identity] = Depends(get_identity)):
+
+    # User Authentication
+    authorize(identity, student_id)
+
     # Check if student and class exist
     # Fetch student data from db
-    student_data = enrollment.get_user_item(student_id)
+    student_data = enrollment.get_user_item(student_id, USER_EXISTS)
 
     # Fetch class data from db
-    class_data = enrollment.get_class_item(class_id)
+    class_data = enrollment.get_class_item(class_id, CLASS_EXISTS)
 
     # Check if exist
     if not student_data or not class_data:
@@ -1,3 +1,3 @@
 #!/bin/sh
 
-foreman start -m enrollment=3,primary=1,secondary=1,tertiary=1,krakend=1,dynamodb=1,notification=1,email-consumer=3,webhook-consumer=3,aiosmtpd=1
+foreman start -m enrollment=3,primary=1,secondary=1,tertiary=1,krakend=1,dynamodb=1,notification=1,email-consumer=3,webhook-consumer=3,outbox-relay=1,promotion-worker=1,seat-ledger=1,aiosmtpd=1
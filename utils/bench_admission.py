@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Measures enroll goodput under overload: the rate of enroll requests that
+succeed within the gateway's 3000 ms deadline, as the number of concurrent
+clients grows past what the enrollment service can serve.
+
+Each client loops posting enrolls for random students and classes. Rejected
+requests wait for their Retry-After before trying again, the way a well behaved
+client would. Run it once with ADMISSION_ENABLED=false and once with it true in
+.env (restarting the enrollment service in between) to compare goodput and tail
+latency with and without admission control.
+
+Run from the main directory, with the services running and the databases populated:
+
+    python -m utils.bench_admission --concurrency 50 200 800 --duration 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+
+async def client(http, args, deadline_at, stats):
+    while time.perf_counter() < deadline_at:
+        student_id = random.randint(1, args.students)
+        class_id = random.randint(1, args.classes)
+        url = f"{args.url}/students/{student_id}/classes/{class_id}/enroll"
+        start = time.perf_counter()
+        try:
+            response = await http.post(url, timeout=args.deadline)
+        except httpx.TimeoutException:
+            stats["timeout"] += 1
+            continue
+        except httpx.HTTPError:
+            stats["error"] += 1
+            continue
+        latency = time.perf_counter() - start
+        if response.status_code == 429:
+            stats["rejected"] += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        elif response.status_code < 500:
+            stats["good"] += 1
+            stats["latencies"].append(latency)
+        else:
+            stats["error"] += 1
+
+
+async def run_level(args, concurrency):
+    stats = {"good": 0, "rejected": 0, "timeout": 0, "error": 0, "latencies": []}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as http:
+        deadline_at = time.perf_counter() + args.duration
+        await asyncio.gather(*(client(http, args, deadline_at, stats) for _ in range(concurrency)))
+    latencies = sorted(stats["latencies"]) or [0.0]
+    stats["p99"] = latencies[int(len(latencies) * 0.99) - 1 if len(latencies) > 1 else 0]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--deadline", type=float, default=3.0, help="the gateway timeout, in seconds")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--classes", type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'clients':<10}{'goodput/s':>12}{'429/s':>10}{'timeouts':>10}{'errors':>8}{'p99 ms':>10}")
+    for concurrency in args.concurrency:
+        stats = asyncio.run(run_level(args, concurrency))
+        print(
+            f"{concurrency:<10}{stats['good'] / args.duration:>12.1f}"
+            f"{stats['rejected'] / args.duration:>10.1f}{stats['timeout']:>10}"
+            f"{stats['error']:>8}{stats['p99'] * 1000:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Shows how notification throughput scales with the number of competing consumers
+on one durable work queue, the way the email and webhook consumers share
+email_notifications and webhook_notifications.
+
+For each consumer count, the script fills a scratch queue with messages, starts
+that many consumer processes with the same prefetch as the real consumers, and
+times how long they take to drain it. Each message simulates a fixed amount of
+delivery work, such as an SMTP session or a webhook POST.
+
+Run from the main directory, with RabbitMQ running:
+
+    python -m utils.bench_consumers --consumers 1 2 4 8 --messages 400 --work-ms 20
+"""
+import argparse
+import multiprocessing
+import time
+
+import pika
+
+QUEUE = "bench_notifications"
+
+
+def consume(prefetch, work_ms, done):
+    connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+    channel = connection.channel()
+    channel.basic_qos(prefetch_count=prefetch)
+
+    def callback(ch, method, properties, body):
+        time.sleep(work_ms / 1000)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        with done.get_lock():
+            done.value += 1
+
+    channel.basic_consume(queue=QUEUE, on_message_callback=callback)
+    try:
+        channel.start_consuming()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_level(consumers, messages, prefetch, work_ms):
+    connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+    channel = connection.channel()
+    channel.queue_declare(queue=QUEUE, durable=True)
+    channel.queue_purge(queue=QUEUE)
+    for i in range(messages):
+        channel.basic_publish(exchange="", routing_key=QUEUE, body=str(i))
+    connection.close()
+
+    done = multiprocessing.Value("i", 0)
+    processes = [
+        multiprocessing.Process(target=consume, args=(prefetch, work_ms, done), daemon=True)
+        for _ in range(consumers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    while done.value < messages:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.terminate()
+        process.join()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--consumers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--prefetch", type=int, default=10)
+    parser.add_argument("--work-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"{'consumers':<12}{'msg/s':>10}{'speedup':>10}")
+    baseline = None
+    for consumers in args.consumers:
+        throughput = run_level(consumers, args.messages, args.prefetch, args.work_ms)
+        baseline = baseline or throughput
+        print(f"{consumers:<12}{throughput:>10.1f}{throughput / baseline:>9.2f}x")
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
+    connection.channel().queue_delete(queue=QUEUE)
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
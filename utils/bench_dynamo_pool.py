@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""
+Measures DynamoDB read throughput at different concurrency levels, comparing the
+default botocore client config against the shared, tuned config from
+enrollment/enrollment_clients.py.
+
+Each concurrency level simulates one uvicorn worker with that many requests in
+flight, every request doing a get_item on the class table.
+
+Run from the main directory, with DynamoDB running and the databases populated:
+
+    python -m utils.bench_dynamo_pool --concurrency 50 100 150 200 --requests 2000
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from enrollment.enrollment_clients import client_config, settings
+
+
+def run_level(table, concurrency, requests, class_ids):
+    def fetch(i):
+        table.get_item(Key={"id": class_ids[i % len(class_ids)]})
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # warm the connection pool before timing
+        list(pool.map(fetch, range(concurrency)))
+        start = time.perf_counter()
+        list(pool.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 150, 200])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--classes", type=int, default=15, help="number of class ids to read from")
+    args = parser.parse_args()
+
+    class_ids = list(range(1, args.classes + 1))
+    configs = {
+        "default": None,
+        "tuned": client_config(max_pool_connections=max(args.concurrency)),
+    }
+
+    print(f"{'config':<10}{'concurrency':>12}{'req/s':>12}")
+    for name, config in configs.items():
+        resource = boto3.resource(
+            "dynamodb", endpoint_url=settings.dynamodb_endpoint_url, config=config
+        )
+        table = resource.Table("enrollment_class")
+        for concurrency in args.concurrency:
+            throughput = run_level(table, concurrency, args.requests, class_ids)
+            print(f"{name:<10}{concurrency:>12}{throughput:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
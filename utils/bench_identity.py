@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+Compares the per-request cost of the old inline X-User / X-Roles check that every
+enrollment route used to copy, against the shared get_identity dependency and
+authorize() from enrollment/enrollment_auth.py.
+
+Run from the main directory:
+
+    python -m utils.bench_identity --number 200000
+"""
+import argparse
+import timeit
+
+from fastapi import HTTPException
+
+from enrollment.enrollment_auth import authorize, get_identity
+
+
+def inline_check(headers, student_id):
+    if headers.get("X-User"):
+        current_user = int(headers.get("X-User"))
+
+        roles_string = headers.get("X-Roles")
+        current_roles = roles_string.split(",")
+
+        r_flag = True
+        for role in current_roles:
+            if role == "registrar":
+                r_flag = False
+
+        if r_flag:
+            if current_user != student_id:
+                raise HTTPException(status_code=403, detail="Access forbidden, wrong user")
+
+
+def dependency_check(headers, student_id):
+    identity = get_identity(headers.get("X-User"), headers.get("X-Roles"))
+    authorize(identity, student_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    cases = {
+        "student": ({"X-User": "42", "X-Roles": "student"}, 42),
+        "registrar": ({"X-User": "560", "X-Roles": "instructor,registrar"}, 42),
+    }
+
+    print(f"{'case':<12}{'inline ns':>12}{'dependency ns':>16}")
+    for name, (headers, student_id) in cases.items():
+        results = []
+        for check in (inline_check, dependency_check):
+            seconds = timeit.timeit(
+                lambda: check(headers, student_id), number=args.number
+            )
+            results.append(seconds / args.number * 1e9)
+        print(f"{name:<12}{results[0]:>12.0f}{results[1]:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
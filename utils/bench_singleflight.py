@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Simulates a thundering herd on the catalog read: waves of identical requests
+arriving within a few milliseconds of each other, as when a popular section
+reopens, with and without single-flight in front of the backend.
+
+The simulated backend gets slower the more calls it serves at once, the way
+DynamoDB scans do once they start competing for read capacity. The benchmark
+reports the backend calls made, the coalescing ratio, and request latency for
+each herd size. It runs in-process and needs no services; /debug/singleflight
+on a running enrollment service reports the same ratio for real traffic.
+
+Run from the main directory:
+
+    python -m utils.bench_singleflight --herd 10 100 1000 --waves 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from enrollment.enrollment_singleflight import SingleFlight
+
+
+class Backend:
+
+    def __init__(self, base_latency, contention):
+        self.base_latency = base_latency
+        self.contention = contention
+        self.in_flight = 0
+        self.calls = 0
+
+    async def scan(self, statement):
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.base_latency + self.contention * self.in_flight)
+            return {"Items": [statement]}
+        finally:
+            self.in_flight -= 1
+
+
+async def request(backend, flight, statement, spread, latencies):
+    await asyncio.sleep(random.uniform(0, spread))
+    start = time.perf_counter()
+    if flight is None:
+        await backend.scan(statement)
+    else:
+        await flight.run(("catalog", statement), backend.scan, statement)
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_herd(args, herd, coalesce):
+    backend = Backend(args.latency / 1000, args.contention / 1000)
+    flight = SingleFlight() if coalesce else None
+    latencies = []
+    for _ in range(args.waves):
+        await asyncio.gather(
+            *(request(backend, flight, "catalog", args.spread / 1000, latencies) for _ in range(herd))
+        )
+    latencies.sort()
+    calls = herd * args.waves
+    return {
+        "backend_calls": backend.calls,
+        "ratio": 1 - backend.calls / calls,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99) - 1 if len(latencies) > 1 else 0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--herd", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--waves", type=int, default=20)
+    parser.add_argument("--spread", type=float, default=5, help="ms over which each wave arrives")
+    parser.add_argument("--latency", type=float, default=20, help="backend latency with no load, in ms")
+    parser.add_argument("--contention", type=float, default=0.5, help="ms added per concurrent backend call")
+    args = parser.parse_args()
+
+    print(f"{'herd':<8}{'mode':<14}{'backend calls':>14}{'coalesced':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for herd in args.herd:
+        for coalesce in (False, True):
+            stats = asyncio.run(run_herd(args, herd, coalesce))
+            print(
+                f"{herd:<8}{'single-flight' if coalesce else 'direct':<14}{stats['backend_calls']:>14}"
+                f"{stats['ratio']:>10.1%}{stats['p50'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
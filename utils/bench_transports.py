@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""
+Compares notification throughput of the two consumer transports in
+consumer/notification_transport.py: the RabbitMQ work queue and the Redis Stream
+consumer group, at a few prefetch / batch sizes.
+
+For each transport and size, the script fills a scratch queue or stream with
+messages, then times one consumer draining it with an empty handler that only
+acks, so the numbers are the transport's own overhead per message.
+
+Run from the main directory, with RabbitMQ and Redis running:
+
+    python -m utils.bench_transports --messages 20000 --sizes 1 10 100
+"""
+import argparse
+import json
+import time
+
+import redis
+
+from consumer.notification_transport import (
+    NOTIFICATION_EXCHANGE,
+    RabbitMQTransport,
+    RedisStreamTransport,
+)
+
+ROUTING_KEY = "bench"
+QUEUE = "bench_notifications"
+STREAM = "bench:notifications"
+BODY = json.dumps({"class_name": "CPSC 449", "section": "1", "message": "bench", "email": "a@b.c"})
+
+
+class Done(Exception):
+    pass
+
+
+def drain(transport, messages):
+    count = 0
+
+    def handler(message):
+        nonlocal count
+        message.ack()
+        count += 1
+        if count == messages:
+            raise Done
+
+    start = time.perf_counter()
+    try:
+        transport.consume(handler)
+    except Done:
+        pass
+    return messages / (time.perf_counter() - start)
+
+
+def bench_rabbitmq(messages, prefetch):
+    transport = RabbitMQTransport("email", prefetch=prefetch)
+    transport.routing_key = ROUTING_KEY
+    transport.queue = QUEUE
+    transport.connect()
+    transport.channel.queue_purge(queue=QUEUE)
+    for _ in range(messages):
+        transport.channel.basic_publish(exchange=NOTIFICATION_EXCHANGE, routing_key=ROUTING_KEY, body=BODY)
+    throughput = drain(transport, messages)
+    transport.channel.queue_delete(queue=QUEUE)
+    transport.connection.close()
+    return throughput
+
+
+def bench_redis(r, messages, batch_size):
+    r.delete(STREAM)
+    transport = RedisStreamTransport("email", batch_size=batch_size, client=r)
+    transport.stream = STREAM
+    transport.group = QUEUE
+    pipe = r.pipeline(transaction=False)
+    for _ in range(messages):
+        pipe.xadd(STREAM, {"body": BODY})
+    pipe.execute()
+    throughput = drain(transport, messages)
+    r.delete(STREAM)
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100],
+                        help="prefetch counts for RabbitMQ and batch sizes for Redis")
+    args = parser.parse_args()
+
+    r = redis.Redis(db=1)
+    print(f"{'transport':<12}{'size':>8}{'msg/s':>12}")
+    for size in args.sizes:
+        print(f"{'rabbitmq':<12}{size:>8}{bench_rabbitmq(args.messages, size):>12.0f}")
+        print(f"{'redis':<12}{size:>8}{bench_redis(r, args.messages, size):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()